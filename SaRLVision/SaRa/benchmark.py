@@ -0,0 +1,250 @@
+#-------------------------------------------------------------------------------
+# Name:        benchmark.py
+# Purpose:     Benchmarking SaRa and Itti saliency, and checking their outputs against stored references.
+#
+# Author:      Matthias Bartolo <matthias.bartolo@ieee.org>
+#
+# Created:     February 24, 2024
+# Copyright:   (c) Matthias Bartolo 2024-
+# Licence:     All rights reserved
+#-------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import cv2
+import numpy as np
+import pandas as pd
+
+import SaRLVision.SaRa.saraRC1 as sara
+from SaRLVision.SaRa.pySaliencyMap import pySaliencyMap
+
+# The resolutions (height, width) of the synthetic benchmark images.
+BENCHMARK_RESOLUTIONS = ((240, 320), (375, 500), (480, 640))
+# The grid sizes of the SaRa algorithm that are benchmarked.
+BENCHMARK_GRID_SIZES = (6, 9, 12)
+# The number of synthetic images per resolution.
+BENCHMARK_IMAGES = 3
+# The number of timed repetitions of every stage (the median latency is reported).
+BENCHMARK_REPEATS = 3
+# The seed of the synthetic image set, so that the images (and hence the reference outputs) are fixed.
+BENCHMARK_SEED = 2024
+# The rate of important ranks used for sara_resize and the initial bounding box (as in DetectionEnv.generate_initial_bbox).
+BENCHMARK_RATE = 0.3
+# The side of the thumbnail of the saliency map stored in the reference outputs.
+REFERENCE_THUMBNAIL_SIZE = 16
+# The tolerance on the saliency map thumbnails (in grey levels) and on the relative SaRa scores when checking against the reference outputs (a grey level flipped by rounding in the saliency map moves the scores by about 1e-5).
+SALIENCY_TOLERANCE = 1.0
+SCORE_TOLERANCE = 1e-4
+# The path of the stored reference outputs.
+REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_reference.json')
+
+
+def generate_benchmark_images(resolutions=BENCHMARK_RESOLUTIONS, num_images=BENCHMARK_IMAGES, seed=BENCHMARK_SEED):
+    """
+        Function that generates the fixed synthetic benchmark image set, i.e. smooth noisy backgrounds with a few coloured shapes as salient objects.
+
+        Args:
+            - Resolutions: Resolutions (height, width) of the images
+            - Num_images: Number of images per resolution
+            - Seed: Seed of the image set
+
+        Output:
+            - Dictionary of images keyed by (height, width, image index)
+    """
+    rng = np.random.default_rng(seed)
+    images = {}
+
+    for height, width in resolutions:
+        for index in range(num_images):
+            # Smooth background noise
+            img = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 5)
+
+            # Drawing the salient objects (circles and rectangles of random colours)
+            for _ in range(int(rng.integers(1, 4))):
+                color = tuple(int(c) for c in rng.integers(0, 256, 3))
+                x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+                size = int(rng.integers(min(height, width) // 12, min(height, width) // 4))
+                if rng.random() < 0.5:
+                    cv2.circle(img, (x, y), size, color, -1)
+                else:
+                    cv2.rectangle(img, (x - size, y - size), (x + size, y + size), color, -1)
+
+            images[(height, width, index)] = img
+
+    return images
+
+
+def time_stage(func, repeats=BENCHMARK_REPEATS):
+    """
+        Function that times a stage and measures its peak memory.
+
+        Args:
+            - Func: Stage (a function without arguments)
+            - Repeats: Number of timed repetitions
+
+        Output:
+            - Output of the stage, median latency (in seconds) and peak memory traced by tracemalloc (in bytes)
+    """
+    # Timing the stage without tracing, as tracemalloc slows allocations down
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = func()
+        latencies.append(time.perf_counter() - start)
+
+    # Measuring the peak memory in a separate traced run (only numpy and Python allocations are traced, not OpenCV's internal buffers)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return output, float(np.median(latencies)), peak
+
+
+def run_benchmark(images=None, grid_sizes=BENCHMARK_GRID_SIZES, repeats=BENCHMARK_REPEATS, rate=BENCHMARK_RATE):
+    """
+        Function that benchmarks the SaRa stages (SMGetSM, return_sara, sara_resize and the initial bounding box) on every image and grid size.
+
+        Args:
+            - Images: Dictionary of images keyed by (height, width, image index) (the synthetic image set if None)
+            - Grid_sizes: Grid sizes of the SaRa algorithm
+            - Repeats: Number of timed repetitions of every stage
+            - Rate: Rate of important ranks
+
+        Output:
+            - DataFrame of latencies and peak memories (one row per image, grid size and stage), and the outputs of every case
+    """
+    if images is None:
+        images = generate_benchmark_images()
+
+    rows = []
+    outputs = {}
+
+    for (height, width, index), img in images.items():
+        # Itti saliency map (independent of the grid size)
+        _, latency, peak = time_stage(lambda: pySaliencyMap(width, height, fast=sara.FAST_ITTI).SMGetSM(img), repeats)
+        rows.append({'resolution': str(height) + 'x' + str(width), 'image': index, 'grid_size': None, 'stage': 'SMGetSM', 'latency_ms': latency * 1000, 'peak_memory_mb': peak / 2**20})
+
+        for grid_size in grid_sizes:
+            case = {'resolution': str(height) + 'x' + str(width), 'image': index, 'grid_size': grid_size}
+
+            # SaRa with the heatmap, as plotted
+            sara_info, latency, peak = time_stage(lambda: sara.return_sara(img, grid_size, 'itti', mode=2), repeats)
+            rows.append(dict(case, stage='return_sara', latency_ms=latency * 1000, peak_memory_mb=peak / 2**20))
+
+            # Resizing based on the important ranks
+            (_, _, resize_bbox), latency, peak = time_stage(lambda: sara.sara_resize(img.copy(), sara_info, grid_size, rate=rate, iterations=1), repeats)
+            rows.append(dict(case, stage='sara_resize', latency_ms=latency * 1000, peak_memory_mb=peak / 2**20))
+
+            # Initial bounding box, as generated by the environment (saliency, ranking only and resizing)
+            initial_bboxes, latency, peak = time_stage(lambda: sara.generate_initial_bboxes([img], grid_size, 'itti', rate=rate, iterations=1, workers=1), repeats)
+            rows.append(dict(case, stage='generate_initial_bbox', latency_ms=latency * 1000, peak_memory_mb=peak / 2**20))
+
+            # Storing the outputs of the case for the equivalence check
+            saliency_map = sara.return_saliency(img, 'itti')
+            thumbnail = cv2.resize(saliency_map, (REFERENCE_THUMBNAIL_SIZE, REFERENCE_THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+            outputs[case_key(height, width, index, grid_size)] = {
+                'saliency_thumbnail': thumbnail.astype(int).tolist(),
+                'ranks': [int(info[0]) for info in sara_info[1]],
+                'scores': [float(info[2]) for info in sara_info[1]],
+                'sara_resize_bbox': [int(c) for c in resize_bbox],
+                'initial_bbox': [int(c) for c in initial_bboxes[0]],
+            }
+
+    return pd.DataFrame(rows), outputs
+
+
+def case_key(height, width, index, grid_size):
+    """
+        Function that returns the key of a benchmark case in the reference outputs.
+    """
+    return str(height) + 'x' + str(width) + '/' + str(index) + '/' + str(grid_size)
+
+
+def compare_outputs(outputs, reference):
+    """
+        Function that checks the outputs of the benchmark against the reference outputs.
+
+        Args:
+            - Outputs: Outputs of the benchmark cases
+            - Reference: Reference outputs of the benchmark cases
+
+        Output:
+            - List of mismatches (empty if the outputs are equivalent)
+    """
+    mismatches = []
+
+    for key, output in outputs.items():
+        if key not in reference:
+            mismatches.append(key + ': missing from the reference outputs')
+            continue
+        expected = reference[key]
+
+        # The saliency map may differ by rounding, the ranking and the bounding boxes must match exactly
+        saliency_difference = np.abs(np.array(output['saliency_thumbnail']) - np.array(expected['saliency_thumbnail'])).max()
+        if saliency_difference > SALIENCY_TOLERANCE:
+            mismatches.append(key + ': saliency map differs by ' + str(saliency_difference) + ' grey levels')
+        if output['ranks'] != expected['ranks']:
+            mismatches.append(key + ': SaRa ranking differs')
+        elif not np.allclose(output['scores'], expected['scores'], rtol=SCORE_TOLERANCE, atol=0):
+            mismatches.append(key + ': SaRa scores differ')
+        for bbox in ('sara_resize_bbox', 'initial_bbox'):
+            if output[bbox] != expected[bbox]:
+                mismatches.append(key + ': ' + bbox + ' ' + str(output[bbox]) + ' != ' + str(expected[bbox]))
+
+    return mismatches
+
+
+def summarise_benchmark(results):
+    """
+        Function that summarises the benchmark results per stage and resolution.
+
+        Args:
+            - Results: DataFrame of latencies and peak memories
+
+        Output:
+            - DataFrame of the mean latency and peak memory per stage and resolution
+    """
+    return results.groupby(['stage', 'resolution'], sort=False)[['latency_ms', 'peak_memory_mb']].mean().round(3)
+
+
+if __name__ == '__main__':
+    # Running the benchmark, e.g. python -m SaRLVision.SaRa.benchmark (add --update_reference after an intended change of the outputs)
+    parser = argparse.ArgumentParser(description='Benchmark SaRa and check its outputs against the stored reference outputs.')
+    parser.add_argument('--repeats', type=int, default=BENCHMARK_REPEATS, help='Number of timed repetitions of every stage')
+    parser.add_argument('--reference', default=REFERENCE_PATH, help='Path of the reference outputs')
+    parser.add_argument('--update_reference', action='store_true', help='Store the current outputs as the reference outputs')
+    parser.add_argument('--save_path', default=None, help='Path of a CSV file to save the benchmark results to')
+    args = parser.parse_args()
+
+    results, outputs = run_benchmark(repeats=args.repeats)
+
+    print('\033[37m' + 'SaRa benchmark (mean per stage and resolution):' + '\033[0m')
+    print(summarise_benchmark(results).to_string())
+
+    if args.save_path is not None:
+        results.to_csv(args.save_path, index=False)
+
+    if args.update_reference:
+        with open(args.reference, 'w') as f:
+            json.dump(outputs, f)
+        print('\033[92m' + 'Reference outputs updated (' + str(len(outputs)) + ' cases).' + '\033[0m')
+        sys.exit(0)
+
+    if not os.path.exists(args.reference):
+        print('\033[91m' + 'No reference outputs found at ' + args.reference + ', run with --update_reference first.' + '\033[0m')
+        sys.exit(1)
+
+    with open(args.reference) as f:
+        mismatches = compare_outputs(outputs, json.load(f))
+
+    if mismatches:
+        print('\033[91m' + str(len(mismatches)) + ' output(s) differ from the reference outputs:' + '\033[0m')
+        for mismatch in mismatches:
+            print('  ' + mismatch)
+        sys.exit(1)
+
+    print('\033[92m' + 'All ' + str(len(outputs)) + ' outputs match the reference outputs.' + '\033[0m')
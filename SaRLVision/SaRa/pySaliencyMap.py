@@ -16,9 +16,14 @@ import time
 
 class pySaliencyMap:
     # initialization
-    def __init__(self, width, height):
+    # fast: share the intensity pyramid, normalize all the feature maps of a
+    # pyramid level as one stack, resize them to the image size in a single
+    # multi-channel call, stay in float32 throughout and skip the motion
+    # channel for still images
+    def __init__(self, width, height, fast=False):
         self.width  = width
         self.height = height
+        self.fast = fast
         self.prev_frame = None
         self.SM = None
         self.GaborKernel0   = np.array(pySaliencyMapDefs.GaborKernel_0)
@@ -88,9 +93,10 @@ class pySaliencyMap:
         # return
         return RGFM, BYFM
     ## orientation feature maps
-    def OFMGetFM(self, src):
-        # creating a Gaussian pyramid
-        GaussianI = self.FMCreateGaussianPyr(src)
+    def OFMGetFM(self, src, GaussianI=None):
+        # creating a Gaussian pyramid (unless it is shared with the intensity feature maps)
+        if GaussianI is None:
+            GaussianI = self.FMCreateGaussianPyr(src)
         # convoluting a Gabor filter with an intensity image to extract oriemtation features
         GaborOutput0   = [ np.empty((1,1)), np.empty((1,1)) ]  # dummy data: any kinds of np.array()s are OK
         GaborOutput45  = [ np.empty((1,1)), np.empty((1,1)) ]
@@ -167,6 +173,15 @@ class pySaliencyMap:
         stepsize = pySaliencyMapDefs.default_step_local
         width = src.shape[1]
         height = src.shape[0]
+        # fast: max-pool the full stepsize x stepsize tiles visited by the loop below with reshapes (over the rows of every tile first, which
+        # reduces whole image rows at once, and then over the columns of the much smaller result)
+        if self.fast:
+            ny = len(range(0, height-stepsize, stepsize))
+            nx = len(range(0, width-stepsize, stepsize))
+            if ny*nx == 0:
+                return 0
+            rowmax = src[:ny*stepsize, :nx*stepsize].reshape(ny, stepsize, nx*stepsize).max(axis=1)
+            return float(rowmax.reshape(ny, nx, stepsize).max(axis=2).mean(dtype=np.float64))
         # find local maxima
         numlocal = 0
         lmaxmean = 0
@@ -181,6 +196,27 @@ class pySaliencyMap:
             return 0
         else:
             return lmaxmean / numlocal
+    ## normalization of a stack of maps (n x height x width, float32), computing the same float32 values as SMNormalization on every map
+    def SMNormalizationStack(self, src):
+        # range normalization (the scale and offset are derived in double precision and applied in single precision, as in SMRangeNormalize)
+        minn = src.min(axis=(1,2)).astype(np.float64)
+        maxx = src.max(axis=(1,2)).astype(np.float64)
+        flat = maxx == minn
+        scale = np.where(flat, 1.0, maxx-minn).astype(np.float32)[:, np.newaxis, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            offset = np.where(flat, -minn, minn/(minn-maxx)).astype(np.float32)[:, np.newaxis, np.newaxis]
+        dst = src / scale + offset
+        # average of the local maxima of the full stepsize x stepsize tiles of every map
+        stepsize = pySaliencyMapDefs.default_step_local
+        ny = len(range(0, src.shape[1]-stepsize, stepsize))
+        nx = len(range(0, src.shape[2]-stepsize, stepsize))
+        if ny*nx == 0:
+            lmaxmean = np.zeros(len(src))
+        else:
+            rowmax = dst[:, :ny*stepsize, :nx*stepsize].reshape(len(src), ny, stepsize, nx*stepsize).max(axis=2)
+            lmaxmean = rowmax.reshape(len(src), ny, nx, stepsize).max(axis=3).reshape(len(src), -1).mean(axis=1, dtype=np.float64)
+        normcoeff = ((1-lmaxmean)*(1-lmaxmean)).astype(np.float32)[:, np.newaxis, np.newaxis]
+        return dst * normcoeff
     ## normalization specific for the saliency map model
     def SMNormalization(self, src):
         dst = self.SMRangeNormalize(src)
@@ -190,6 +226,13 @@ class pySaliencyMap:
     ## normalizing feature maps
     def normalizeFeatureMaps(self, FM):
         NFM = list()
+        # fast: maps (0,1), (2,3) and (4,5) share a pyramid level, and resizing is linear, so each pair is summed before a single resize
+        if self.fast:
+            for i in range(0,6,2):
+                normalizedImage = self.SMNormalization(FM[i]) + self.SMNormalization(FM[i+1])
+                nownfm = cv2.resize(normalizedImage, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+                NFM.append(nownfm)
+            return NFM
         for i in range(0,6):
             normalizedImage = self.SMNormalization(FM[i])
             nownfm = cv2.resize(normalizedImage, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
@@ -211,7 +254,7 @@ class pySaliencyMap:
         return CCM
     ## orientation conspicuity map
     def OCMGetCM(self, OFM):
-        OCM = np.zeros((self.height, self.width))
+        OCM = np.zeros((self.height, self.width), dtype=np.float32 if self.fast else np.float64)
         for i in range (0,4):
             # slicing
             nowofm = OFM[i*6:(i+1)*6]  # angle = i*45
@@ -237,16 +280,47 @@ class pySaliencyMap:
 #            sys.exit("size mismatch")
         # extracting individual color channels
         R, G, B, I = self.SMExtractRGBI(src)
-        # extracting feature maps
-        IFM = self.IFMGetFM(I)
-        CFM_RG, CFM_BY = self.CFMGetFM(R, G, B)
-        OFM = self.OFMGetFM(I)
-        MFM_X, MFM_Y = self.MFMGetFM(I)
-        # extracting conspicuity maps
-        ICM = self.ICMGetCM(IFM)
-        CCM = self.CCMGetCM(CFM_RG, CFM_BY)
-        OCM = self.OCMGetCM(OFM)
-        MCM = self.MCMGetCM(MFM_X, MFM_Y)
+        # fast: sharing the intensity pyramid, and skipping the motion channel for a still image (zero flow gives an all-zero conspicuity map)
+        if self.fast:
+            GaussianI = self.FMCreateGaussianPyr(I)
+            IFM = self.FMCenterSurroundDiff(GaussianI)
+            CFM_RG, CFM_BY = self.CFMGetFM(R, G, B)
+            OFM = self.OFMGetFM(I, GaussianI)
+            # the feature maps of every pyramid level (intensity, RG, BY and the four orientations, two maps each), normalized as one stack
+            FMs = [IFM, CFM_RG, CFM_BY, OFM[0:6], OFM[6:12], OFM[12:18], OFM[18:24]]
+            CMs = np.empty((len(FMs), self.height, self.width), dtype=np.float32)
+            for i in range(0,6,2):
+                NFM = self.SMNormalizationStack(np.stack([fm for FM in FMs for fm in FM[i:i+2]]))
+                # summing the two maps of every feature, and accumulating them at the image size in place
+                pairs = NFM[0::2] + NFM[1::2]
+                for j in range(len(FMs)):
+                    if i == 0:
+                        cv2.resize(pairs[j], (self.width, self.height), dst=CMs[j], interpolation=cv2.INTER_LINEAR)
+                    else:
+                        CMs[j] += cv2.resize(pairs[j], (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+            ICM = CMs[0]
+            CCM = CMs[1] + CMs[2]
+            # normalizing the conspicuity map of every orientation, and accumulating them in the same order as OCMGetCM
+            OCM = np.zeros((self.height, self.width), dtype=np.float32)
+            for j in range(3,7):
+                OCM += self.SMNormalization(CMs[j])
+            if self.prev_frame is None:
+                self.prev_frame = np.uint8(255 * I)
+                MCM = 0
+            else:
+                MFM_X, MFM_Y = self.MFMGetFM(I)
+                MCM = self.MCMGetCM(MFM_X, MFM_Y)
+        else:
+            # extracting feature maps
+            IFM = self.IFMGetFM(I)
+            CFM_RG, CFM_BY = self.CFMGetFM(R, G, B)
+            OFM = self.OFMGetFM(I)
+            MFM_X, MFM_Y = self.MFMGetFM(I)
+            # extracting conspicuity maps
+            ICM = self.ICMGetCM(IFM)
+            CCM = self.CCMGetCM(CFM_RG, CFM_BY)
+            OCM = self.OCMGetCM(OFM)
+            MCM = self.MCMGetCM(MFM_X, MFM_Y)
         # adding all the conspicuity maps to form a saliency map
         wi = pySaliencyMapDefs.weight_intensity
         wc = pySaliencyMapDefs.weight_color
@@ -255,7 +329,7 @@ class pySaliencyMap:
         SMMat = wi*ICM + wc*CCM + wo*OCM + wm*MCM
         # normalize
         normalizedSM = self.SMRangeNormalize(SMMat)
-        normalizedSM2 = normalizedSM.astype(np.float32)
+        normalizedSM2 = normalizedSM.astype(np.float32, copy=False)
         smoothedSM = cv2.bilateralFilter(normalizedSM2, 7, 3, 1.55)
         self.SM = cv2.resize(smoothedSM, (width,height), interpolation=cv2.INTER_NEAREST)
         # return
@@ -1,7 +1,6 @@
 import cv2
 import numpy as np
 import math
-import scipy.stats as st
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.lines import Line2D
 import matplotlib.pyplot as plt
@@ -9,6 +8,9 @@ import operator
 import time
 import os
 from enum import Enum
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
 
 # Akisato Kimura <akisato@ieee.org> implementation of Itti's Saliency Map Generator -- https://github.com/akisatok/pySaliencyMap
@@ -20,6 +22,19 @@ from SaRLVision.SaRa.pySaliencyMap import pySaliencyMap
 # Entropy, sum, depth, centre-bias
 WEIGHTS = (1, 1, 1, 1)
 
+# Whether the Itti generator uses the fast pySaliencyMap path (same map within float32 tolerance)
+FAST_ITTI = True
+
+# Grid sizes of the SaRa grid pyramid
+GRID_PYRAMID = (3, 6, 9, 12)
+# Number of segments that an object should span across when selecting the grid size from the pyramid
+OBJECT_SEGMENTS = 3
+
+# Number of processes used to compute Itti saliency maps in batch (None for all the cores)
+SALIENCY_WORKERS = None
+# Number of images handed to a saliency worker process at a time
+SALIENCY_CHUNK_SIZE = 4
+
 # segments_entropies = []
 segments_scores = []
 segments_coords = []
@@ -41,13 +56,16 @@ error_count = 0
 
 
 # SaRa Initial Functions
-def generate_segments(img, seg_count) -> list:
+def split_segments(img, seg_count) -> tuple:
     '''
     Given an image img and the desired number of segments seg_count, this 
-    function divides the image into segments and returns a list of segments.
+    function divides the image into segments without touching any module 
+    state. It returns the list of segments and the list of segment 
+    coordinates (index, x1, y1, x2, y2).
     '''
 
     segments = []
+    coords = []
     segment_count = seg_count
     index = 0
 
@@ -62,24 +80,60 @@ def generate_segments(img, seg_count) -> list:
             
             coord_tup = (index, int(w_interval * j), int(h_interval * i),
                          int(w_interval * (j + 1)), int(h_interval * (i + 1)))
-            segments_coords.append(coord_tup)
+            coords.append(coord_tup)
             
             index += 1
 
+    return segments, coords
+
+
+def grid_segments(img, seg_count) -> np.ndarray:
+    '''
+    Given an image img and the desired number of segments seg_count, this 
+    function returns the segments of split_segments as a strided view of 
+    shape (seg_count, seg_count, h_interval, w_interval, ...) of the image, 
+    without copying them out (pixels beyond the last full segment are not 
+    part of any segment).
+    '''
+
+    w_interval = int(img.shape[1] / seg_count)
+    h_interval = int(img.shape[0] / seg_count)
+
+    covered = img[:h_interval * seg_count, :w_interval * seg_count]
+
+    return covered.reshape((seg_count, h_interval, seg_count, w_interval) + img.shape[2:]).swapaxes(1, 2)
+
+
+def generate_segments(img, seg_count) -> list:
+    '''
+    Given an image img and the desired number of segments seg_count, this 
+    function divides the image into segments and returns a list of segments.
+
+    The segment coordinates are appended to the module level 
+    segments_coords, as used by generate_sara.
+    '''
+
+    segments, coords = split_segments(img, seg_count)
+    segments_coords.extend(coords)
+
     return segments
 
 
-def return_saliency(img, generator='itti', deepgaze_model=None, emlnet_models=None, DEVICE='cpu'):
+def return_saliency(img, generator='itti', deepgaze_model=None, emlnet_models=None, DEVICE='cpu', fast=FAST_ITTI):
     '''
     Takes an image img as input and calculates the saliency map using the 
     Itti's Saliency Map Generator. It returns the saliency map.
+
+    With fast set, the Itti generator shares its intensity pyramid, pools 
+    local maxima with reshapes and skips the motion channel of a still 
+    image.
     '''
 
     img_width, img_height = img.shape[1], img.shape[0]
 
     if generator == 'itti':
 
-        sm = pySaliencyMap(img_width, img_height)
+        sm = pySaliencyMap(img_width, img_height, fast=fast)
         saliency_map = sm.SMGetSM(img)
 
         # Scale pixel values to 0-255 instead of float (approx 0, hence black image)
@@ -170,68 +224,81 @@ def return_saliency(img, generator='itti', deepgaze_model=None, emlnet_models=No
     return saliency_map
 
 
-def return_saliency_batch(images, generator='deepgaze', deepgaze_model=None, emlnet_models=None, DEVICE='cuda', BATCH_SIZE=1):
-    img_widths, img_heights = [], []
-    if generator == 'deepgaze':
-        import numpy as np
-        from scipy.misc import face
+def return_saliency_batch(images, generator='itti', deepgaze_model=None, emlnet_models=None, DEVICE='cpu', BATCH_SIZE=8, workers=None, executor=None, fast=FAST_ITTI):
+    '''
+    Takes a list of images as input and calculates their saliency maps, 
+    exactly as return_saliency does for a single image. It returns the list 
+    of saliency maps, in the order of the images.
+
+    The Itti generator runs the images over a process pool (of workers 
+    processes, or the given executor), while the DeepGaze generator runs 
+    batches of up to BATCH_SIZE equally sized images through the model. Any 
+    other generator falls back to one return_saliency call per image.
+    '''
+
+    images = list(images)
+
+    if generator == 'itti':
+        saliency = partial(return_saliency, generator='itti', fast=fast)
+
+        # A single image (or a single worker) is not worth the pool start-up
+        if executor is None and (len(images) < 2 or workers == 1):
+            return [saliency(img) for img in images]
+
+        if executor is not None:
+            return list(executor.map(saliency, images, chunksize=SALIENCY_CHUNK_SIZE))
+
+        # Every worker runs OpenCV single-threaded, as the pool already uses the cores
+        with ProcessPoolExecutor(max_workers=workers or SALIENCY_WORKERS, initializer=cv2.setNumThreads, initargs=(1,)) as pool:
+            return list(pool.map(saliency, images, chunksize=SALIENCY_CHUNK_SIZE))
+
+    elif generator == 'deepgaze':
         from scipy.ndimage import zoom
         from scipy.special import logsumexp
         import torch
 
         import deepgaze_pytorch
 
-        # you can use DeepGazeI or DeepGazeIIE
-        # model = deepgaze_pytorch.DeepGazeIIE(pretrained=True).to(DEVICE)
-
         if deepgaze_model is None:
             model = deepgaze_pytorch.DeepGazeIIE(pretrained=True).to(DEVICE)
         else:
             model = deepgaze_model
 
-        # image = face()
-        # image = img
-        image_batch = torch.tensor([img.transpose(2, 0, 1) for img in images]).to(DEVICE)
-        centerbias_template = np.zeros((1024, 1024))
-        centerbias_tensors = []
+        # Grouping the images by shape, since only equally sized images can be stacked into a batch
+        groups = {}
+        for i, img in enumerate(images):
+            groups.setdefault(img.shape, []).append(i)
 
-        for img in images:
-            centerbias = zoom(centerbias_template, (img.shape[0] / centerbias_template.shape[0], img.shape[1] / centerbias_template.shape[1]), order=0, mode='nearest')
-            centerbias -= logsumexp(centerbias)
-            centerbias_tensors.append(torch.tensor(centerbias).to(DEVICE))
-
-            # Set img_width and img_height
-            img_widths.append(img.shape[1])
+        saliency_maps = [None] * len(images)
 
+        for shape, indices in groups.items():
+            img_height, img_width = shape[0], shape[1]
 
-        # rescale to match image size
-        # centerbias = zoom(centerbias_template, (image.shape[0]/centerbias_template.shape[0], image.shape[1]/centerbias_template.shape[1]), order=0, mode='nearest')
-        # # renormalize log density
-        # centerbias -= logsumexp(centerbias)
-
-        # image_tensor = torch.tensor([image.transpose(2, 0, 1)]).to(DEVICE)
-        # centerbias_tensor = torch.tensor([centerbias]).to(DEVICE)
-        with torch.no_grad():
-            # Process the batch of images in one forward pass
-            log_density_predictions = model(image_batch, torch.stack(centerbias_tensors))
+            # The (uniform) centerbias only depends on the image size, so it is shared by the whole group
+            centerbias_template = np.zeros((1024, 1024))
+            centerbias = zoom(centerbias_template, (img_height / centerbias_template.shape[0], img_width / centerbias_template.shape[1]), order=0, mode='nearest')
+            centerbias -= logsumexp(centerbias)
 
-        # log_density_prediction = model(image_tensor, centerbias_tensor)
+            for b in range(0, len(indices), BATCH_SIZE):
+                batch_indices = indices[b:b + BATCH_SIZE]
 
-        # saliency_map = cv2.resize(log_density_prediction.detach().cpu().numpy()[0, 0], (img_width, img_height))
+                image_batch = torch.tensor(np.stack([images[i].transpose(2, 0, 1) for i in batch_indices])).to(DEVICE)
+                centerbias_batch = torch.tensor(np.repeat(centerbias[None], len(batch_indices), axis=0)).to(DEVICE)
 
-        saliency_maps = []
+                with torch.no_grad():
+                    # Process the batch of images in one forward pass
+                    log_density_predictions = model(image_batch, centerbias_batch).cpu().numpy()
 
-        for i in range(len(images)):
-            saliency_map = cv2.resize(log_density_predictions[i, 0].cpu().numpy(), (img_widths[i], img_widths[i]))
+                for i, log_density_prediction in zip(batch_indices, log_density_predictions):
+                    saliency_map = cv2.resize(log_density_prediction[0], (img_width, img_height))
 
-            saliency_map = cv2.normalize(saliency_map, None, 255, 0, cv2.NORM_MINMAX, cv2.CV_8UC1)
+                    saliency_map = cv2.normalize(saliency_map, None, 255, 0, cv2.NORM_MINMAX, cv2.CV_8UC1)
 
-            saliency_map = cv2.GaussianBlur(saliency_map, (31, 31), 10)
-            saliency_map = saliency_map // 16
-            
-            saliency_maps.append(saliency_map)
+                    saliency_maps[i] = cv2.GaussianBlur(saliency_map, (31, 31), 10)
 
         return saliency_maps
+
+    return [return_saliency(img, generator, deepgaze_model=deepgaze_model, emlnet_models=emlnet_models, DEVICE=DEVICE, fast=fast) for img in images]
     
 
 # def return_itti_saliency(img):
@@ -322,16 +389,134 @@ def calculate_entropy(img, w, dw) -> float:
     return entropy
 
 
-def find_most_salient_segment(segments, kernel, dws):
+def calculate_segment_histograms(segments) -> np.ndarray:
     '''
-    Finds the most salient segment among the provided segments using a 
-    given kernel and depth weights. It returns the maximum entropy value 
-    and the index of the most salient segment.
+    Calculates the 256-bin histogram of every segment in segments (a stack 
+    of n equally sized uint8 segments) with a single bincount over the 
+    whole stack. It returns an array of shape (n, 256).
     '''
 
-    # max_entropy = 0
-    max_score = 0
-    index = 0
+    segments = np.asarray(segments)
+    n = segments.shape[0]
+
+    # Offset the pixel values of every segment by 256 * segment index, so that one bincount yields all the histograms
+    offsets = (np.arange(n, dtype=np.int64) * 256).reshape((n,) + (1,) * (segments.ndim - 1))
+    histograms = np.bincount((offsets + segments).ravel(), minlength=n * 256)
+
+    return histograms.reshape(n, 256)
+
+
+def calculate_grid_histograms(saliency_map, grid) -> np.ndarray:
+    '''
+    Calculates the 256-bin histogram of every segment of a grid x grid 
+    split of the uint8 saliency map (the segments of split_segments, in the 
+    same order) with a single bincount over the strided grid_segments view, 
+    without copying the segments out. It returns an array of shape 
+    (grid ** 2, 256).
+    '''
+
+    segments = grid_segments(saliency_map, grid)
+
+    # Offset the pixel values of every segment by 256 * segment index, so that one bincount yields all the histograms
+    offsets = (np.arange(grid * grid, dtype=np.int64) * 256).reshape((grid, grid) + (1,) * (segments.ndim - 2))
+    histograms = np.bincount((offsets + segments).ravel(), minlength=grid * grid * 256)
+
+    return histograms.reshape(grid * grid, 256)
+
+
+def calculate_entropies(histograms) -> np.ndarray:
+    '''
+    Calculates the entropy of every segment from its histogram, as 
+    calculate_entropy does for a single segment. It returns an array of 
+    entropies.
+    '''
+
+    total_pixels = histograms.sum(axis=1, keepdims=True)
+    p = histograms / np.maximum(total_pixels, 1)
+
+    # Entropy term of every pixel value (empty bins contribute 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(p > 0, p * np.log2(1 / p), 0)
+
+    # Accumulate the terms in increasing pixel value order, as calculate_entropy does
+    return np.cumsum(terms, axis=1)[:, -1]
+
+
+def calculate_normalised_sums(histograms) -> np.ndarray:
+    '''
+    Calculates the sum of every segment after min-max normalising it 
+    between 0 and 255, as cv2.normalize(segment, None, 255, 0, 
+    cv2.NORM_MINMAX, cv2.CV_8UC1) followed by np.sum does, using only its 
+    histogram. It returns an array of sums.
+    '''
+
+    values = np.arange(256)
+    present = histograms > 0
+
+    # Min and max pixel value of every segment (0 for empty segments)
+    seg_min = np.where(present.any(axis=1), np.argmax(present, axis=1), 0)
+    seg_max = np.where(present.any(axis=1), 255 - np.argmax(present[:, ::-1], axis=1), 0)
+
+    # Scale and shift of the normalisation (constant segments are mapped to 0, as in OpenCV)
+    value_range = (seg_max - seg_min).astype(np.float64)
+    scale = np.divide(255.0, value_range, out=np.zeros_like(value_range), where=value_range > 0)
+    shift = -seg_min * scale
+
+    # OpenCV converts uint8 data with single precision scale and shift, rounding the fused multiply-add once to single precision and then to the nearest integer
+    scale = scale.astype(np.float32).astype(np.float64)[:, np.newaxis]
+    shift = shift.astype(np.float32).astype(np.float64)[:, np.newaxis]
+    lut = np.clip(np.rint((values * scale + shift).astype(np.float32)), 0, 255).astype(np.uint64)
+
+    return (histograms.astype(np.uint64) * lut).sum(axis=1)
+
+
+def score_histograms(histograms, kernel, dws) -> list:
+    '''
+    Scores segments from their 256-bin histograms using a given kernel 
+    (centre-bias) and depth weights, exactly as score_segments scores the 
+    segments themselves. It returns a list of (index, score, entropy, sum, 
+    centre-bias, depth) tuples, one per segment.
+    '''
+
+    w = WEIGHTS
+    scores_list = []
+
+    n = len(histograms)
+    entropies = calculate_entropies(histograms)
+    sums = calculate_normalised_sums(histograms)
+
+    kernel = np.asarray(kernel[:n], dtype=np.float64)
+    seg_dws = np.asarray(dws[:n], dtype=np.float64)
+
+    # Same score as calculate_score, for all the segments at once
+    log_sums = np.log(np.maximum(sums, 1).astype(np.float64))
+    scores = entropies ** w[0] + np.where(sums > 0, log_sums, 0) ** w[1] + seg_dws ** w[2] + (kernel + 1) ** w[3]
+
+    for i in range(n):
+        scores_list.append((i, scores[i], entropies[i] ** w[0], sums[i] ** w[1], (kernel[i] + 1) ** w[2], dws[i] ** w[3]))
+
+    return scores_list
+
+
+def score_segments(segments, kernel, dws) -> list:
+    '''
+    Scores the provided segments using a given kernel (centre-bias) and 
+    depth weights, without touching any module state. It returns a list of 
+    (index, score, entropy, sum, centre-bias, depth) tuples, one per segment.
+
+    Equally sized uint8 segments (as produced by generate_segments on a 
+    saliency map) are scored all at once from their histograms, any other 
+    segments are scored one by one.
+    '''
+
+    w = WEIGHTS
+    scores_list = []
+
+    if len(segments) > 0 and all(segment.dtype == np.uint8 and segment.shape == segments[0].shape for segment in segments):
+        # One bincount per segment, so that the segments are not copied into a stack first (compute_sara scores a grid from grid_segments instead)
+        histograms = np.array([np.bincount(segment.ravel(), minlength=256) for segment in segments], dtype=np.int64)
+        return score_histograms(histograms, kernel, dws)
+
     i = 0
 
     for segment in segments:
@@ -339,27 +524,39 @@ def find_most_salient_segment(segments, kernel, dws):
         # Normalise semgnet bweetn 0 and 255
         segment = cv2.normalize(segment, None, 255, 0, cv2.NORM_MINMAX, cv2.CV_8UC1)
         temp_sum = np.sum(segment)
-        # temp_tup = (i, temp_entropy)
-        # segments_entropies.append(temp_tup)
 
-        w = WEIGHTS
-        
         temp_score = calculate_score(temp_entropy, temp_sum, dws[i], kernel[i], w)
 
         temp_tup = (i, temp_score, temp_entropy ** w[0], temp_sum ** w[1], (kernel[i] + 1) ** w[2], dws[i] ** w[3])
 
-        # segments_scores.append((i, temp_score))
-        segments_scores.append(temp_tup)
+        scores_list.append(temp_tup)
 
-        # if temp_entropy > max_entropy:
-        #     max_entropy = temp_entropy
-        #     index = i
+        i += 1
 
-        if temp_score > max_score:
-            max_score = temp_score
-            index = i
+    return scores_list
 
-        i += 1
+
+def find_most_salient_segment(segments, kernel, dws):
+    '''
+    Finds the most salient segment among the provided segments using a 
+    given kernel and depth weights. It returns the maximum entropy value 
+    and the index of the most salient segment.
+
+    The segment scores are appended to the module level segments_scores, 
+    as used by generate_sara.
+    '''
+
+    # max_entropy = 0
+    max_score = 0
+    index = 0
+
+    for temp_tup in score_segments(segments, kernel, dws):
+        # segments_scores.append((i, temp_score))
+        segments_scores.append(temp_tup)
+
+        if temp_tup[1] > max_score:
+            max_score = temp_tup[1]
+            index = temp_tup[0]
 
     # return max_entropy, index
     return max_score, index
@@ -698,12 +895,47 @@ def generate_heatmap(img, sorted_seg_scores, segments_coords, mode=2) -> tuple:
         
         return img, sara_list_out
 
+def generate_sara_list(sorted_seg_scores, mode=2) -> list:
+    '''
+    Generates the list of segment scores with quartile information that 
+    generate_heatmap returns for the given mode, without allocating or 
+    drawing any overlay. It is used when only the ranking is needed.
+    '''
+
+    print_index = len(sorted_seg_scores) - 1
+    set_value = int(0.25 * len(sorted_seg_scores))
+
+    sara_list_out = []
+
+    for ent in reversed(sorted_seg_scores):
+        # Mode 0 (white grid) does not assign quartiles
+        quartile = 0
+        if mode != 0:
+            if print_index + 1 <= set_value:
+                quartile = 1
+            elif print_index + 1 <= set_value * 2:
+                quartile = 2
+            elif print_index + 1 <= set_value * 3:
+                quartile = 3
+            else:
+                quartile = 4
+
+        # Index, rank, score, entropy, entropy_sum, centre_bias, depth, quartile
+        sara_tuple = (ent[0], print_index, ent[1], ent[2], ent[3], ent[4], ent[5], quartile)
+        sara_list_out.append(sara_tuple)
+        print_index -= 1
+
+    return sara_list_out
+
 def generate_sara(tex, tex_segments, mode=2):
     '''
     Generates the SaRa (Salient Region Annotation) output by calculating 
     saliency scores for the segments of the given texture image tex. It 
     returns the texture image with the heatmap overlay and a list of 
     segment scores.
+
+    This relies on the module level seg_dim, segments_coords and 
+    segments_scores (see reset); compute_sara is the stateless equivalent.
     '''
 
     gaussian_kernel_array = make_gaussian(seg_dim)
@@ -744,25 +976,157 @@ def generate_sara(tex, tex_segments, mode=2):
     return tex_out, sara_list_out
 
 
+def rank_segments(seg_scores) -> list:
+    '''
+    Sorts the segment score tuples by decreasing score (segments with equal 
+    scores keep their index order). It returns a list of [index, score, 
+    entropy, sum, centre-bias, depth] lists, as expected by generate_heatmap.
+    '''
+
+    sorted_scores = sorted(seg_scores, key=lambda x: x[1], reverse=True)
+
+    return [[i[0], i[1], i[2], i[3], i[4], i[5]] for i in sorted_scores]
+
+
+# Immutable SaRa output. Its first two fields index like the (heatmap, 
+# sara_list) tuple of return_sara (so it can be passed as sara_info), and it 
+# additionally carries the saliency map, grid size and segment coordinates 
+# it was computed from.
+SaraResult = namedtuple('SaraResult', ['heatmap', 'sara_list', 'saliency_map', 'grid_size', 'segments_coords'])
+
+
+def compute_sara(input_img, grid, generator='itti', saliency_map=None, mode=2, render=True) -> SaraResult:
+    '''
+    Computes the SaRa output for the given input image without reading or 
+    writing any module state, so it can be called concurrently (e.g. from a 
+    thread pool or a vectorised environment). It returns a SaraResult.
+
+    With render set to False only the ranking is computed, and the heatmap 
+    field of the result is None.
+    '''
+
+    if saliency_map is None:
+        saliency_map = return_saliency(input_img, generator)
+
+    tex_segments, coords = split_segments(saliency_map, grid)
+
+    gaussian1d = make_gaussian(grid).ravel()
+    seg_dws = [1] * len(tex_segments)
+
+    # Scoring a uint8 saliency map from the histograms of its strided grid view, and any other saliency map segment by segment
+    if saliency_map.dtype == np.uint8 and saliency_map.shape[0] >= grid and saliency_map.shape[1] >= grid:
+        seg_scores = score_histograms(calculate_grid_histograms(saliency_map, grid), gaussian1d, seg_dws)
+    else:
+        seg_scores = score_segments(tex_segments, gaussian1d, seg_dws)
+
+    sorted_scores = rank_segments(seg_scores)
+
+    if render:
+        tex_out, sara_list_out = generate_heatmap(input_img, sorted_scores, coords, mode=mode)
+    else:
+        tex_out, sara_list_out = None, generate_sara_list(sorted_scores, mode=mode)
+
+    return SaraResult(tex_out, list(reversed(sara_list_out)), saliency_map, grid, tuple(coords))
+
+
+class SaRa:
+    '''
+    Re-entrant SaRa (Saliency Ranking) callable. It only holds its 
+    configuration (grid size, saliency generator and heatmap mode), and 
+    every call returns a new SaraResult, so a single instance can be shared 
+    between threads.
+    '''
+
+    def __init__(self, grid_size=9, generator='itti', mode=2, render=True):
+        self.grid_size = grid_size
+        self.generator = generator
+        self.mode = mode
+        self.render = render
+
+    def __call__(self, img, saliency_map=None) -> SaraResult:
+        return compute_sara(img, self.grid_size, self.generator, saliency_map=saliency_map, mode=self.mode, render=self.render)
+
+
 def return_sara(input_img, grid, generator='itti', saliency_map=None, mode = 2):
     '''
     Computes the SaRa output for the given input image. It uses the 
-    generate_sara function internally. It returns the SaRa output image and 
-    a list of segment scores.
+    compute_sara function internally, so no module state is used and 
+    reset() is no longer needed between calls. It returns the SaRa output 
+    image and a list of segment scores.
     '''
 
-    global seg_dim
-    seg_dim = grid
+    sara_output, sara_list_output = compute_sara(input_img, grid, generator, saliency_map=saliency_map, mode=mode)[:2]
+
+    return sara_output, sara_list_output
+
+
+def compute_sara_pyramid(input_img, grids=GRID_PYRAMID, generator='itti', saliency_map=None, mode=2, render=False) -> dict:
+    '''
+    Computes the SaRa output for every grid size in grids from a single 
+    saliency map. The segments of every scale are scored from histograms 
+    gathered with one bincount over the saliency map, so no segment is 
+    copied out, and every scale gives the same result as compute_sara. It 
+    returns a dictionary of SaraResults keyed by grid size.
+    '''
 
     if saliency_map is None:
         saliency_map = return_saliency(input_img, generator)
 
-    tex_segments = generate_segments(saliency_map, seg_dim)
+    results = {}
 
-    # tex_segments = generate_segments(input_img, seg_dim)
-    sara_output, sara_list_output = generate_sara(input_img, tex_segments, mode=mode)
+    for grid in grids:
+        # Grids finer than the image have empty segments, which compute_sara scores one by one
+        if saliency_map.dtype != np.uint8 or saliency_map.shape[0] < grid or saliency_map.shape[1] < grid:
+            results[grid] = compute_sara(input_img, grid, generator, saliency_map=saliency_map, mode=mode, render=render)
+            continue
 
-    return sara_output, sara_list_output
+        coords = split_segments(saliency_map, grid)[1]
+
+        histograms = calculate_grid_histograms(saliency_map, grid)
+        sorted_scores = rank_segments(score_histograms(histograms, make_gaussian(grid).ravel(), [1] * len(coords)))
+
+        if render:
+            tex_out, sara_list_out = generate_heatmap(input_img, sorted_scores, coords, mode=mode)
+        else:
+            tex_out, sara_list_out = None, generate_sara_list(sorted_scores, mode=mode)
+
+        results[grid] = SaraResult(tex_out, list(reversed(sara_list_out)), saliency_map, grid, tuple(coords))
+
+    return results
+
+
+def select_grid_size(saliency_map, grids=GRID_PYRAMID, object_segments=OBJECT_SEGMENTS) -> int:
+    '''
+    Selects the grid size of the pyramid that best matches the scale of the 
+    salient object. The object scale is estimated from the area of the 
+    saliency map above its Otsu threshold, and the chosen grid is the one in 
+    which the object spans about object_segments segments across. It 
+    returns the grid size.
+    '''
+
+    _, salient_mask = cv2.threshold(saliency_map, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Relative side length of the salient region
+    object_scale = math.sqrt(max(np.count_nonzero(salient_mask) / salient_mask.size, 1e-6))
+
+    return min(grids, key=lambda grid: abs(grid - object_segments / object_scale))
+
+
+def return_sara_batch(images, grid, generator='itti', saliency_maps=None, mode=2, render=True, **saliency_kwargs) -> list:
+    '''
+    Computes the SaRa output for a list of images. The saliency maps (unless 
+    given) are computed with return_saliency_batch, to which any extra 
+    keyword arguments (workers, executor, BATCH_SIZE, ...) are passed. It 
+    returns a list of SaraResults, whose sara_list fields hold the ranked 
+    segments of every image.
+    '''
+
+    images = list(images)
+
+    if saliency_maps is None:
+        saliency_maps = return_saliency_batch(images, generator, **saliency_kwargs)
+
+    return [compute_sara(img, grid, generator, saliency_map=saliency_map, mode=mode, render=render) for img, saliency_map in zip(images, saliency_maps)]
 
 
 def mean_squared_error(image_a, image_b) -> float:
@@ -801,7 +1165,7 @@ def reset():
 
 
 
-def resize_based_on_important_ranks(img, sara_info, grid_size, rate=0.3):
+def resize_based_on_important_ranks(img, sara_info, grid_size, rate=0.3, return_mask=False):
     def generate_segments(image, seg_count) -> dict:
         """
             Function to generate segments of an image
@@ -858,42 +1222,32 @@ def resize_based_on_important_ranks(img, sara_info, grid_size, rate=0.3):
     # Generating segments
     index_info = generate_segments(img, grid_size)
 
-    # Initializing most important ranks image
-    most_imp_ranks = np.zeros_like(img)
-
     # Calculating maximum rank
     max_rank = int(grid_size * grid_size * rate)
-    count = 0
 
-    # Iterating through important ranks and adding them to most important ranks image
-    for rank, info in sorted_sara_dict:
-        # Checking if rank is within maximum rank
-        if count <= max_rank:
-            # Retrieving segment coordinates
-            coords = index_info[rank]
+    # Retrieving the coordinates of the most important ranks (the first max_rank + 1 segments by score)
+    selected_coords = np.array([index_info[rank] for rank, info in sorted_sara_dict[:max_rank + 1]], dtype=int).reshape(-1, 4)
 
-            # Adding segment to most important ranks image by making it white
+    # Initializing most important ranks image only if it is requested, making the selected segments white
+    most_imp_ranks = None
+    if return_mask:
+        most_imp_ranks = np.zeros_like(img)
+        for coords in selected_coords:
             most_imp_ranks[coords[1]:coords[3], coords[0]:coords[2]] = 255
 
-            # Incrementing count
-            count += 1
-        else:
-            break
-    
-    # Retrieving coordinates of most important ranks
-    coords = np.argwhere(most_imp_ranks == 255)
+    # Checking if no important ranks were found (the segments are empty when the image is smaller than the grid) and returning original image
+    if selected_coords.size == 0 or img.shape[1] // grid_size == 0 or img.shape[0] // grid_size == 0:
+        return img, most_imp_ranks, [0, 0, img.shape[1], img.shape[0]]
 
-    # Checking if no important ranks were found and returning original image
-    if coords.size == 0:
-        return img , most_imp_ranks, [0, 0, img.shape[0], img.shape[1]]
+    # Calculating the bounding box of the most important ranks directly from the segment coordinates, in the form [xmin, ymin, xmax, ymax]
+    x0, y0 = selected_coords[:, :2].min(axis=0)
+    x1, y1 = selected_coords[:, 2:].max(axis=0)
 
     # Cropping image based on most important ranks
-    x0, y0 = coords.min(axis=0)[:2]
-    x1, y1 = coords.max(axis=0)[:2] + 1
-    cropped_img = img[x0:x1, y0:y1]
-    return cropped_img , most_imp_ranks, [x0, y0, x1, y1]
+    cropped_img = img[y0:y1, x0:x1]
+    return cropped_img, most_imp_ranks, [int(x0), int(y0), int(x1), int(y1)]
 
-def sara_resize(img, sara_info, grid_size, rate=0.3, iterations=2):
+def sara_resize(img, sara_info, grid_size, rate=0.3, iterations=2, return_mask=False):
     """
         Function to resize an image based on SaRa
 
@@ -903,18 +1257,102 @@ def sara_resize(img, sara_info, grid_size, rate=0.3, iterations=2):
             grid_size: size of the grid
             rate: rate of important ranks
             iterations: number of iterations to resize
+            return_mask: whether to return the most important ranks image of the last iteration (None otherwise)
 
         Returns:
             img: resized image
+            most_imp_ranks: most important ranks image
+            coords: bounding box of the resized image in the input image, as [xmin, ymin, xmax, ymax]
     """
+    # Initializing the bounding box to the whole image
+    coords = [0, 0, img.shape[1], img.shape[0]]
+    most_imp_ranks = None
+
     # Iterating through iterations
     for _ in range(iterations):
         # Resizing image based on important ranks
-        img, most_imp_ranks, coords = resize_based_on_important_ranks(img, sara_info, grid_size, rate=rate)
+        img, most_imp_ranks, crop = resize_based_on_important_ranks(img, sara_info, grid_size, rate=rate, return_mask=return_mask)
+
+        # Offsetting the crop (relative to the previous crop) by the previous bounding box
+        coords = [coords[0] + crop[0], coords[1] + crop[1], coords[0] + crop[2], coords[1] + crop[3]]
 
     # Returning resized image
     return img, most_imp_ranks, coords
 
+def generate_initial_bboxes(images, grid_size, generator='itti', rate=0.3, iterations=1, sara_results=None, **saliency_kwargs):
+    """
+        Function to generate the SaRa initial bounding boxes of a list of images
+
+        Args:
+            images: input images
+            grid_size: size of the grid
+            generator: saliency map generator
+            rate: rate of important ranks
+            iterations: number of iterations to resize
+            sara_results: SaRa results of the images (computed with return_sara_batch if not given)
+
+        Returns:
+            bboxes: initial bounding box of every image
+    """
+    images = list(images)
+
+    # Computing the SaRa rankings of all the images in batch (no heatmap is needed for the bounding boxes)
+    if sara_results is None:
+        sara_results = return_sara_batch(images, grid_size, generator, render=False, **saliency_kwargs)
+
+    # Resizing every image based on its important ranks
+    return [sara_resize(img.copy(), sara_result[:2], grid_size, rate=rate, iterations=iterations)[2] for img, sara_result in zip(images, sara_results)]
+
+def generate_proposals(img, sara_info, grid_size, rate=0.3, max_proposals=4):
+    """
+        Function to generate ranked bounding box proposals from connected clusters of the most important SaRa ranks
+
+        Args:
+            img: input image
+            sara_info: SaRa information
+            grid_size: size of the grid
+            rate: rate of important ranks
+            max_proposals: maximum number of proposals to return
+
+        Returns:
+            proposals: bounding boxes of the clusters as [xmin, ymin, xmax, ymax], ranked by their total score
+    """
+    h, w = img.shape[:2]
+
+    # Calculating width and height intervals for segments from the grid size
+    w_interval = w // grid_size
+    h_interval = h // grid_size
+
+    # Checking if the image is smaller than the grid and returning the whole image
+    if w_interval == 0 or h_interval == 0:
+        return [[0, 0, w, h]]
+
+    # Sorting important ranks by score, as in resize_based_on_important_ranks
+    scores = {info[0]: info[2] for info in sara_info[1]}
+    sorted_indices = sorted(scores, key=lambda index: scores[index], reverse=True)
+
+    # Marking the most important ranks on a grid_size x grid_size grid
+    max_rank = int(grid_size * grid_size * rate)
+    selected = np.zeros((grid_size, grid_size), dtype=np.uint8)
+    score_grid = np.zeros((grid_size, grid_size), dtype=np.float64)
+    for index in sorted_indices[:max_rank + 1]:
+        selected[index // grid_size, index % grid_size] = 1
+        score_grid[index // grid_size, index % grid_size] = scores[index]
+
+    # Clustering the marked segments (8-connectivity), where every cluster gives a proposal
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(selected, connectivity=8)
+
+    proposals = []
+    for label in range(1, num_labels):
+        col, row, cols, rows = stats[label, :4]
+        proposal = [int(col * w_interval), int(row * h_interval), int((col + cols) * w_interval), int((row + rows) * h_interval)]
+        proposals.append((score_grid[labels == label].sum(), proposal))
+
+    # Ranking the proposals by the total score of their segments
+    proposals.sort(key=lambda proposal: proposal[0], reverse=True)
+
+    return [proposal for _, proposal in proposals[:max_proposals]] or [[0, 0, w, h]]
+
 def plot_3D(img, sara_info, grid_size, rate=0.3):
     def generate_segments(image, seg_count) -> dict:
         """
@@ -0,0 +1,444 @@
+#-------------------------------------------------------------------------------
+# Name:        sara_cache.py
+# Purpose:     Caching saliency maps and SaRa results per dataset image.
+#
+# Author:      Matthias Bartolo <matthias.bartolo@ieee.org>
+#
+# Created:     February 24, 2024
+# Copyright:   (c) Matthias Bartolo 2024-
+# Licence:     All rights reserved
+#-------------------------------------------------------------------------------
+import os
+import argparse
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count
+import numpy as np
+
+import SaRLVision.SaRa.saraRC1 as sara
+
+# The maximum number of images whose entries (saliency map, SaRa results and proposals) are kept in memory by the cache.
+SALIENCY_CACHE_SIZE = 512
+# The default directory of the on-disk npz store (set the SARLVISION_SALIENCY_CACHE_DIR environment variable to move it, or to an empty string for keeping the cache in memory only).
+SALIENCY_CACHE_DIR = os.environ.get('SARLVISION_SALIENCY_CACHE_DIR', 'saliency_cache') or None
+# The number of images handed to a worker at a time when precomputing the saliency maps of a dataset.
+PRECOMPUTE_CHUNK_SIZE = 8
+
+
+"""
+    Saliency Cache
+
+    The saliency map (and hence the SaRa result) of an image only depends on the image itself, so it is cached per image id. Entries are kept in an in-memory LRU
+    over images (all the entries of an image are evicted together) and, if a cache directory is given, saliency maps are also stored on disk as npz files (one
+    folder per saliency generator) so that they survive between epochs and runs. A whole dataset split can be stored ahead of training with precompute_saliency,
+    e.g. python -m SaRLVision.SaRa.sara_cache --path ../Datasets/PascalVOC2007Dataset --cache_dir saliency_cache
+"""
+class SaliencyCache():
+    def __init__(self, max_size=SALIENCY_CACHE_SIZE, cache_dir=None):
+        """
+            Constructor of the SaliencyCache class.
+
+            Args:
+                - Max_size: Maximum number of images whose entries are kept in memory
+                - Cache_dir: Directory of the on-disk npz store (None for keeping the cache in memory only)
+        """
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.entries = {}
+        self.images = OrderedDict() # Dictionary mapping every cached image id to the keys of its entries, in least recently used order
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def clear(self):
+        """
+            Function that clears the in-memory entries of the cache (the on-disk store is left untouched).
+        """
+        self.entries.clear()
+        self.images.clear()
+        self.hits = 0
+        self.misses = 0
+        pass
+
+    def _get_entry(self, key):
+        """
+            Function that retrieves an in-memory entry and marks its image as the most recently used.
+
+            Args:
+                - Key: Key of the entry
+
+            Output:
+                - Entry, or None if it is not cached
+        """
+        if key not in self.entries:
+            return None
+
+        # Marking the image of the entry as the most recently used (every key holds the image id second)
+        self.images.move_to_end(key[1])
+        return self.entries[key]
+
+    def _put_entry(self, key, value):
+        """
+            Function that stores an in-memory entry, evicting the entries of the least recently used images when the cache is full.
+
+            Args:
+                - Key: Key of the entry
+                - Value: Value of the entry
+        """
+        self.entries[key] = value
+        self.images.setdefault(key[1], set()).add(key)
+        self.images.move_to_end(key[1])
+
+        # Evicting all the entries of the least recently used images
+        while len(self.images) > self.max_size:
+            _, keys = self.images.popitem(last=False)
+            for evicted_key in keys:
+                del self.entries[evicted_key]
+        pass
+
+    def saliency_path(self, image_id, generator='itti'):
+        """
+            Function that returns the path of the on-disk saliency map of an image.
+
+            Args:
+                - Image_id: Id of the image (e.g. the Pascal VOC filename)
+                - Generator: Saliency map generator
+
+            Output:
+                - Path of the npz file, or None if there is no cache directory
+        """
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, generator, str(image_id) + '.npz')
+
+    def load_saliency(self, image_id, generator='itti'):
+        """
+            Function that loads a saliency map from the on-disk store.
+
+            Args:
+                - Image_id: Id of the image
+                - Generator: Saliency map generator
+
+            Output:
+                - Saliency map, or None if it is not stored
+        """
+        path = self.saliency_path(image_id, generator)
+        if path is None or not os.path.exists(path):
+            return None
+
+        with np.load(path) as data:
+            return data['saliency_map']
+
+    def save_saliency(self, image_id, saliency_map, generator='itti'):
+        """
+            Function that saves a saliency map to the on-disk store.
+
+            Args:
+                - Image_id: Id of the image
+                - Saliency_map: Saliency map of the image
+                - Generator: Saliency map generator
+        """
+        path = self.saliency_path(image_id, generator)
+        if path is None:
+            return
+
+        # Writing to a temporary file first, so that concurrent writers never leave a partially written map behind
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, saliency_map=saliency_map)
+        os.replace(tmp_path, path)
+        pass
+
+    def get_saliency(self, image_id, img, generator='itti'):
+        """
+            Function that returns the saliency map of an image, computing it only if it is neither in memory nor on disk.
+
+            Args:
+                - Image_id: Id of the image (None for computing the saliency map without caching it)
+                - Img: Image
+                - Generator: Saliency map generator
+
+            Output:
+                - Saliency map (read-only, as it is shared between callers)
+        """
+        if image_id is None:
+            return sara.return_saliency(img, generator=generator)
+
+        # Looking up the memory and then the on-disk store
+        key = ('saliency', image_id, generator)
+        saliency_map = self._get_entry(key)
+        if saliency_map is not None:
+            self.hits += 1
+            return saliency_map
+
+        saliency_map = self.load_saliency(image_id, generator)
+        if saliency_map is None:
+            self.misses += 1
+            saliency_map = sara.return_saliency(img, generator=generator)
+            self.save_saliency(image_id, saliency_map, generator)
+        else:
+            self.hits += 1
+
+        saliency_map.setflags(write=False)
+        self._put_entry(key, saliency_map)
+        return saliency_map
+
+    def get_sara(self, image_id, img, grid, generator='itti', mode=2, render=True):
+        """
+            Function that returns the SaRa result of an image, reusing its cached saliency map.
+
+            Args:
+                - Image_id: Id of the image (None for computing the SaRa result without caching it)
+                - Img: Image
+                - Grid: Grid size of the SaRa algorithm
+                - Generator: Saliency map generator
+                - Mode: Heatmap mode of the SaRa algorithm
+                - Render: Whether the heatmap is drawn (False for computing the ranking only)
+
+            Output:
+                - SaraResult
+        """
+        if image_id is None:
+            return sara.compute_sara(img, grid, generator, mode=mode, render=render)
+
+        key = ('sara', image_id, generator, grid, mode, render)
+        sara_result = self._get_entry(key)
+        if sara_result is not None:
+            self.hits += 1
+            return sara_result
+
+        saliency_map = self.get_saliency(image_id, img, generator)
+        sara_result = sara.compute_sara(img, grid, generator, saliency_map=saliency_map, mode=mode, render=render)
+        self._put_entry(key, sara_result)
+        return sara_result
+
+    def get_sara_pyramid(self, image_id, img, grids=sara.GRID_PYRAMID, generator='itti', mode=2, render=False):
+        """
+            Function that returns the SaRa results of an image for every grid size of a pyramid, computing all the uncached ones from a single saliency map.
+
+            Args:
+                - Image_id: Id of the image (None for computing the SaRa results without caching them)
+                - Img: Image
+                - Grids: Grid sizes of the pyramid
+                - Generator: Saliency map generator
+                - Mode: Heatmap mode of the SaRa algorithm
+                - Render: Whether the heatmaps are drawn (False for computing the rankings only)
+
+            Output:
+                - Dictionary of SaraResults keyed by grid size
+        """
+        results = {}
+        if image_id is not None:
+            for grid in grids:
+                sara_result = self._get_entry(('sara', image_id, generator, grid, mode, render))
+                if sara_result is not None:
+                    self.hits += 1
+                    results[grid] = sara_result
+
+        # Computing the missing scales from the (cached) saliency map of the image
+        missing = [grid for grid in grids if grid not in results]
+        if missing:
+            saliency_map = self.get_saliency(image_id, img, generator)
+            for grid, sara_result in sara.compute_sara_pyramid(img, missing, generator, saliency_map=saliency_map, mode=mode, render=render).items():
+                if image_id is not None:
+                    self._put_entry(('sara', image_id, generator, grid, mode, render), sara_result)
+                results[grid] = sara_result
+
+        return {grid: results[grid] for grid in grids}
+
+    def get_proposals(self, image_id, img, grid, generator='itti', rate=0.3, max_proposals=4):
+        """
+            Function that returns the ranked SaRa bounding box proposals of an image.
+
+            Args:
+                - Image_id: Id of the image (None for computing the proposals without caching them)
+                - Img: Image
+                - Grid: Grid size of the SaRa algorithm
+                - Generator: Saliency map generator
+                - Rate: Rate of important ranks clustered into proposals
+                - Max_proposals: Maximum number of proposals
+
+            Output:
+                - Proposals, as [xmin, ymin, xmax, ymax] bounding boxes
+        """
+        key = ('proposals', image_id, generator, grid, rate, max_proposals)
+        proposals = self._get_entry(key) if image_id is not None else None
+        if proposals is not None:
+            self.hits += 1
+            return proposals
+
+        sara_result = self.get_sara(image_id, img, grid, generator, mode=2, render=False)
+        proposals = sara.generate_proposals(img, sara_result, grid, rate=rate, max_proposals=max_proposals)
+        if image_id is not None:
+            self._put_entry(key, proposals)
+        return proposals
+
+    def get_saliency_batch(self, image_ids, images, generator='itti', **saliency_kwargs):
+        """
+            Function that returns the saliency maps of a list of images, computing all the uncached ones in a single batch.
+
+            Args:
+                - Image_ids: Ids of the images
+                - Images: Images
+                - Generator: Saliency map generator
+                - Saliency_kwargs: Extra arguments of the batch saliency computation (workers, executor, BATCH_SIZE, ...)
+
+            Output:
+                - Saliency maps, in the order of the images
+        """
+        image_ids, images = list(image_ids), list(images)
+        saliency_maps = [None] * len(images)
+
+        # Looking up the memory and the on-disk store first (images without an id are always computed)
+        missing = []
+        for i, image_id in enumerate(image_ids):
+            if image_id is not None and (('saliency', image_id, generator) in self.entries or os.path.exists(self.saliency_path(image_id, generator) or '')):
+                saliency_maps[i] = self.get_saliency(image_id, images[i], generator)
+            else:
+                missing.append(i)
+
+        # Computing the missing saliency maps in batch
+        computed = sara.return_saliency_batch([images[i] for i in missing], generator, **saliency_kwargs)
+        for i, saliency_map in zip(missing, computed):
+            if image_ids[i] is not None:
+                self.misses += 1
+                self.save_saliency(image_ids[i], saliency_map, generator)
+                saliency_map.setflags(write=False)
+                self._put_entry(('saliency', image_ids[i], generator), saliency_map)
+            saliency_maps[i] = saliency_map
+
+        return saliency_maps
+
+    def get_sara_batch(self, image_ids, images, grid, generator='itti', mode=2, render=True, **saliency_kwargs):
+        """
+            Function that returns the SaRa results of a list of images, computing all the uncached saliency maps in a single batch (e.g. to prefetch upcoming images).
+
+            Args:
+                - Image_ids: Ids of the images
+                - Images: Images
+                - Grid: Grid size of the SaRa algorithm
+                - Generator: Saliency map generator
+                - Mode: Heatmap mode of the SaRa algorithm
+                - Render: Whether the heatmaps are drawn (False for computing the rankings only)
+                - Saliency_kwargs: Extra arguments of the batch saliency computation (workers, executor, BATCH_SIZE, ...)
+
+            Output:
+                - SaraResults, in the order of the images
+        """
+        image_ids, images = list(image_ids), list(images)
+        saliency_maps = self.get_saliency_batch(image_ids, images, generator, **saliency_kwargs)
+
+        sara_results = []
+        for image_id, img, saliency_map in zip(image_ids, images, saliency_maps):
+            key = ('sara', image_id, generator, grid, mode, render)
+            sara_result = self._get_entry(key) if image_id is not None else None
+            if sara_result is None:
+                sara_result = sara.compute_sara(img, grid, generator, saliency_map=saliency_map, mode=mode, render=render)
+                if image_id is not None:
+                    self._put_entry(key, sara_result)
+            sara_results.append(sara_result)
+
+        return sara_results
+
+
+# Worker state of the precompute pool (every worker opens the dataset once)
+_worker_dataset = None
+_worker_cache = None
+_worker_generator = None
+
+
+def _init_precompute_worker(path, year, image_set, cache_dir, generator):
+    """
+        Function that initialises a precompute worker, by opening the Pascal VOC dataset and the on-disk store.
+
+        Args:
+            - Path: Path to the dataset
+            - Year: Year of the dataset (2007, 2012)
+            - Image_set: Image set of the dataset (train, val, test)
+            - Cache_dir: Directory of the on-disk npz store
+            - Generator: Saliency map generator
+    """
+    global _worker_dataset, _worker_cache, _worker_generator
+    from torchvision import datasets
+
+    _worker_dataset = datasets.VOCDetection(path, year, image_set, download=False)
+    _worker_cache = SaliencyCache(max_size=0, cache_dir=cache_dir)
+    _worker_generator = generator
+    pass
+
+
+def _precompute_image(index):
+    """
+        Function that computes and stores the saliency map of a single dataset image.
+
+        Args:
+            - Index: Index of the image in the dataset
+
+        Output:
+            - Whether the saliency map had to be computed (False if it was already stored)
+    """
+    # Reading the filename from the annotation only, so that stored images are skipped without decoding them
+    annotation = _worker_dataset.parse_voc_xml(ET.parse(_worker_dataset.annotations[index]).getroot())
+    filename = annotation['annotation']['filename']
+    if os.path.exists(_worker_cache.saliency_path(filename, _worker_generator)):
+        return False
+
+    # Computing the saliency map of the image as the environment sees it (RGB numpy array)
+    img, _ = _worker_dataset[index]
+    _worker_cache.get_saliency(filename, np.array(img), _worker_generator)
+    return True
+
+
+def precompute_saliency(path, cache_dir, years=('2007',), image_set='train', generator='itti', processes=None, download=False):
+    """
+        Function that fills the on-disk store with the saliency maps of a whole Pascal VOC split, using a pool of worker processes.
+
+        Args:
+            - Path: Path to the dataset
+            - Cache_dir: Directory of the on-disk npz store
+            - Years: Years of the dataset (e.g. ('2007',) or ('2007', '2012'))
+            - Image_set: Image set of the dataset (train, val, test)
+            - Generator: Saliency map generator
+            - Processes: Number of worker processes (None for all the cores)
+            - Download: Whether to download the dataset or not
+
+        Output:
+            - Number of saliency maps computed
+    """
+    from torchvision import datasets
+
+    computed = 0
+    for year in years:
+        # Opening (and optionally downloading) the dataset once in the main process
+        num_images = len(datasets.VOCDetection(path, year, image_set, download))
+        print('\033[37m' + 'Precomputing ' + generator + ' saliency maps for ' + str(num_images) + ' images of Pascal VOC ' + year + ' ' + image_set + '.' + '\033[0m')
+
+        with Pool(processes or cpu_count(), initializer=_init_precompute_worker, initargs=(path, year, image_set, cache_dir, generator)) as pool:
+            for i, was_computed in enumerate(pool.imap_unordered(_precompute_image, range(num_images), chunksize=PRECOMPUTE_CHUNK_SIZE)):
+                computed += was_computed
+                if (i + 1) % 500 == 0:
+                    print('\033[94m' + 'Processed ' + str(i + 1) + '/' + str(num_images) + ' images.' + '\033[0m')
+
+    print('\033[92m' + 'Saliency maps precomputed successfully (' + str(computed) + ' computed).' + '\033[0m')
+    return computed
+
+
+if __name__ == '__main__':
+    # Precomputing the saliency maps of a Pascal VOC split into the store read by the environments, e.g. python -m SaRLVision.SaRa.sara_cache --path ../Datasets/PascalVOC2007Dataset
+    parser = argparse.ArgumentParser(description='Precompute the saliency maps of a Pascal VOC split.')
+    parser.add_argument('--path', required=True, help='Path to the dataset')
+    parser.add_argument('--cache_dir', default=SALIENCY_CACHE_DIR, help='Directory of the on-disk npz store (defaults to the directory read by the environments)')
+    parser.add_argument('--year', default='2007', help='Year of the dataset (2007, 2012, or 2007+2012)')
+    parser.add_argument('--image_set', default='train', help='Image set of the dataset (train, val, test)')
+    parser.add_argument('--generator', default='itti', help='Saliency map generator')
+    parser.add_argument('--processes', type=int, default=None, help='Number of worker processes (defaults to all the cores)')
+    parser.add_argument('--download', action='store_true', help='Download the dataset if it is missing')
+    args = parser.parse_args()
+
+    precompute_saliency(args.path, args.cache_dir, years=tuple(args.year.split('+')), image_set=args.image_set, generator=args.generator, processes=args.processes, download=args.download)
@@ -10,6 +10,7 @@
 #-------------------------------------------------------------------------------
 from SaRLVision.models import *
 from SaRLVision.utils import *
+from SaRLVision.deploy import OnnxPolicy, ONNX_INTRA_OP_THREADS
 
 import os
 import time
@@ -21,6 +22,7 @@ import numpy as np
 import torch
 import torch.nn as nn
 import itertools
+import pandas as pd
 import random
 import warnings
 warnings.filterwarnings("ignore")
@@ -65,7 +67,7 @@ class DQNAgent():
         self.target_update_freq = target_update_freq
         self.exploration_mode = exploration_mode
         self.ninputs = env.get_state().shape[1]
-        self.noutputs = env.action_space.n
+        self.noutputs = int(env.action_space.n) # As a python integer (gymnasium returns a numpy integer), so that the networks can be scripted
         self.policy_net = network(self.ninputs, self.noutputs).to(device)
         self.target_net = network(self.ninputs, self.noutputs).to(device)
         self.target_net.load_state_dict(self.policy_net.state_dict())
@@ -77,6 +79,8 @@ class DQNAgent():
         self.episodes = 0
         self.episode_info = {"name":name, "episode_avg_rewards": [], "episode_lengths": [], "avg_iou": [], "iou": [], "final_iou": [], "recall": [], "avg_recall": [], "best_episode": {"episode": 0, "avg_reward": np.NINF}, "solved": False, "eps_duration": 0}
         self.display_every_n_episodes = 1000000# Set to a large number to avoid displaying results
+        self.fused_policy = None # The feature extractor and policy network fused for inference (see fuse)
+        self.onnx_policy = None # The exported policy run by ONNX Runtime for selecting the actions (see load_onnx)
 
     def select_action(self, state):
         """ Selects an action using an epsilon greedy policy """
@@ -91,8 +95,11 @@ class DQNAgent():
         else: # Exploitation
             # Selecting the action with the highest Q-value otherwise
             with torch.no_grad():
-                state = torch.from_numpy(state).float().unsqueeze(0).to(device)
-                qvalues = self.policy_net(state)
+                if self.fused_policy is not None: # Fused inference (the state only holds the action history, and the region of interest stays on the device)
+                    qvalues = self.fused_policy(self.env.roi, self.env.get_state_tensor(state).float())
+                else: # Reusing the state kept on the device by the environment in the 'roi' and 'roialign' state modes
+                    state = self.env.get_state_tensor(state).float().unsqueeze(0)
+                    qvalues = (self.onnx_policy if self.onnx_policy is not None else self.policy_net)(state)
                 action = qvalues.argmax().item()
         return action
     
@@ -102,32 +109,12 @@ class DQNAgent():
             Returns:
                 action: The action selected by the expert agent
         """
-        # Creating lists to hold the positive actions and negative actions
-        positive_actions = []
-        negative_actions = []
-        
-        # Retrieving the bounding box from the environment
-        old_state = self.env.bbox
-
-        # Retrieving the target bounding boxes from the environment
-        target_bboxes = self.env.current_gt_bboxes
+        # Calculating the reward of every action at once
+        rewards = self.env.calculate_action_rewards()[:self.noutputs]
 
-        # Looping through the actions
-        for action in range(self.noutputs):
-            # Retrieving the new state
-            new_state = self.env.transform_action(action)
-
-            # Calculating the reward
-            if action < 8:
-                reward = self.env.calculate_reward([new_state], [old_state], target_bboxes)
-            else:
-                reward = self.env.calculate_trigger_reward([new_state], target_bboxes)
-
-            # Appending the action to the positive or negative actions list based on the reward
-            if reward > 0:
-                positive_actions.append(action)
-            else:
-                negative_actions.append(action)
+        # Splitting the actions into the positive and negative actions based on the reward
+        positive_actions = np.flatnonzero(rewards > 0).tolist()
+        negative_actions = np.flatnonzero(rewards <= 0).tolist()
 
         # Returning a random choice from the positive actions if the list is not empty
         if len(positive_actions) > 0:
@@ -183,6 +170,9 @@ class DQNAgent():
 
     def train(self):
         """ Trains the agent for nsteps steps """
+        # Selecting the actions with the torch policy network being trained (rather than an exported ONNX policy)
+        self.unload_onnx()
+
         # Setting networks to training mode
         self.policy_net.train()
         self.target_net.train()
@@ -310,6 +300,9 @@ class DQNAgent():
         # Initialising the replay buffer
         self.replay_buffer.initialize()
 
+        # Selecting the actions with the torch policy network being trained (rather than an exported ONNX policy)
+        self.unload_onnx()
+
         # Setting networks to training mode
         self.policy_net.train()
         self.target_net.train()
@@ -499,10 +492,18 @@ class DQNAgent():
                 # Incrementing the number of episodes
                 self.episodes += 1
 
+                # Reporting the running mean average precision of the streaming metrics (images whose labels are still waiting in the classification queue only count their ground truth boxes)
+                if len(episode_lengths) % EVAL_LOG_FREQ == 0:
+                    running_map = self.env.metrics_accumulator.mean_average_precision()
+                    print("\033[35mEpisode:\033[0m {} \033[35mRunning AP@0.50:\033[0m {:.2f} \033[35mRunning AP@[0.50:0.95]:\033[0m {:.2f}".format(len(episode_lengths), running_map[0], np.mean(running_map)))
+
             # Exiting if the number of epochs is greater than or equal to 1
             if self.env.epochs >= 1:
                 break
         
+        # Classifying the bounding boxes which are still waiting in the classification queue (if any), so that every label and confidence is resolved
+        self.env.flush_classification()
+
         # Retrieving the ending time
         end_time = time.time()
 
@@ -512,6 +513,9 @@ class DQNAgent():
         # Storing the episode lengths
         self.env.evaluation_results["episode_lengths"] = episode_lengths
 
+        # Storing the final streaming metrics, which remain available even when the raw bounding boxes are not stored
+        self.env.evaluation_results["metrics"] = self.env.metrics_accumulator.class_metrics(self.env.current_class)
+
         # Saving the evaluation results
         self.env.save_evaluation_results(path)
 
@@ -550,7 +554,7 @@ class DQNAgent():
         # Playing the environment
         while True:
             # Selecting the action with the highest Q-value
-            action = int(torch.argmax(self.policy_net(torch.from_numpy(obs).float().unsqueeze(0).to(device))).item())
+            action = int(torch.argmax((self.onnx_policy if self.onnx_policy is not None else self.policy_net)(self.env.get_state_tensor(obs).float().unsqueeze(0))).item())
 
             # Taking a step in the environment
             obs, _, terminated, truncated, _ = self.env.step(action)
@@ -607,7 +611,7 @@ class DQNAgent():
         # Playing the environment
         while True:
             # Selecting the action with the highest Q-value
-            action = int(torch.argmax(self.policy_net(torch.from_numpy(obs).float().unsqueeze(0).to(device))).item())
+            action = int(torch.argmax((self.onnx_policy if self.onnx_policy is not None else self.policy_net)(self.env.get_state_tensor(obs).float().unsqueeze(0))).item())
 
             # Taking a step in the environment
             obs, _, terminated, truncated, _ = self.env.step(action)
@@ -660,8 +664,8 @@ class DQNAgent():
         if not os.path.exists(path):
             os.makedirs(path)
 
-        # Saving the model
-        torch.save(self.policy_net.state_dict(), path + "/policy_net.pth")
+        # Saving the model (in full precision, if the agent is quantised)
+        torch.save(getattr(self, 'float_policy_net', self.policy_net).state_dict(), path + "/policy_net.pth")
         torch.save(self.target_net.state_dict(), path + "/target_net.pth")
 
         # Saving optimizer state
@@ -691,6 +695,105 @@ class DQNAgent():
 
         self.epsilon = EPS_END
 
+    def fuse(self, script=True):
+        """ Fusing the feature extractor of the environment and the policy network into a single module for inference, and switching the environment to
+            the 'fused' state mode, so that every step runs one backbone and policy pass on the device, without a numpy round trip of the features
+
+            Args:
+                script (bool): Whether the fused module is compiled to TorchScript
+        """
+        self.policy_net.eval()
+        self.fused_policy = FusedDetectionPolicy(self.env.feature_extractor, self.policy_net).eval()
+        if script:
+            self.fused_policy = torch.jit.script(self.fused_policy)
+        self.env.state_mode = 'fused'
+
+    def unfuse(self, state_mode='crop'):
+        """ Switching back to the separate feature extractor and policy network (e.g. before training)
+
+            Args:
+                state_mode (str): The state mode of the environment ('crop' or 'roi')
+        """
+        self.fused_policy = None
+        self.env.state_mode = state_mode
+
+    def load_onnx(self, path="models/dqn", intra_op_threads=ONNX_INTRA_OP_THREADS):
+        """ Function to select the actions with the policy exported to ONNX (policy_net.onnx, see SaRLVision.deploy), run by ONNX Runtime. The torch
+            policy and target networks are kept, so that the agent can still be trained, saved or synchronised (see unload_onnx)
+
+            Args:
+                path (str): The path of the exported policy
+                intra_op_threads (int): The number of threads used within every operator (None for the number of CPU cores)
+        """
+        self.onnx_policy = OnnxPolicy(os.path.join(path, "policy_net.onnx"), intra_op_threads)
+        self.epsilon = EPS_END
+
+    def unload_onnx(self):
+        """ Switching the action selection back from the ONNX Runtime session to the torch policy network (e.g. before training) """
+        self.onnx_policy = None
+
+    def quantize(self, quantize_feature_extractor=True, calibration_crops=None):
+        """ Switching the agent (and the feature extractor of the environment) to int8 CPU inference, with dynamic quantisation of the policy network
+            and static quantisation of the feature extractor. The full precision networks are kept, so that the agent can be trained, saved or
+            dequantised again.
+
+            Args:
+                quantize_feature_extractor (bool): Whether the feature extractor of the environment is quantised as well
+                calibration_crops (list): The crops used to calibrate the feature extractor (sampled from the dataset of the environment if None)
+        """
+        # Quantising the policy network, which is the only network used for selecting the actions
+        if not hasattr(self, 'float_policy_net'):
+            self.float_policy_net = self.policy_net
+            self.policy_net = quantize_dqn(self.float_policy_net)
+
+        # Quantising the feature extractor of the environment
+        if quantize_feature_extractor and not isinstance(self.env.feature_extractor, QuantizedFeatureExtractor):
+            if calibration_crops is None:
+                calibration_crops = self.env.sample_calibration_crops()
+            self.env.feature_extractor = QuantizedFeatureExtractor(self.env.feature_extractor, calibration_crops, self.env.target_size)
+
+    def dequantize(self):
+        """ Switching the agent (and the feature extractor of the environment) back to the full precision networks """
+        if hasattr(self, 'float_policy_net'):
+            self.policy_net = self.float_policy_net
+            del self.float_policy_net
+        if isinstance(self.env.feature_extractor, QuantizedFeatureExtractor):
+            self.env.feature_extractor = self.env.feature_extractor.float_extractor
+
+    def compare_quantization(self, path="evaluation_results", calibration_crops=None):
+        """ Evaluating the agent in full precision and in int8 on the same images, as an accuracy check of the quantised inference
+
+            Args:
+                path (str): The path to save the evaluation results of both runs to (in the float32 and int8 subdirectories)
+                calibration_crops (list): The crops used to calibrate the feature extractor (sampled from the dataset of the environment if None)
+
+            Returns:
+                A pandas dataframe with the AP@0.50, the AP@[0.50:0.95], the average IoU and the evaluation time per step of both runs
+        """
+        rows = []
+        for precision in ["float32", "int8"]:
+            # Switching the networks to the precision of the run
+            if precision == "int8":
+                self.quantize(calibration_crops=calibration_crops)
+            else:
+                self.dequantize()
+
+            # Restarting the evaluation from the first image of the class
+            self.env.test()
+            self.env.epochs = 0
+            self.env.class_image_index = 0
+
+            # Evaluating the agent
+            self.evaluate(os.path.join(path, precision))
+            metrics = self.env.evaluation_results["metrics"]
+            rows.append({"precision": precision, "AP@0.50": metrics["average_precision"][0] * 100, "AP@[0.50:0.95]": np.mean(metrics["average_precision"]) * 100,
+                         "average_iou": metrics["average_iou"], "ms_per_step": self.env.evaluation_results["eval_time"] * 1000 / max(sum(self.env.evaluation_results["episode_lengths"]), 1)})
+
+        # Returning the comparison, with the int8 run relative to the full precision run
+        comparison = pd.DataFrame(rows).set_index("precision")
+        comparison.loc["difference"] = comparison.loc["int8"] - comparison.loc["float32"]
+        return comparison
+
     def get_episode_info(self):
         """ Returns the episode info """
         return self.episode_info
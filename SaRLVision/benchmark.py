@@ -0,0 +1,248 @@
+#-------------------------------------------------------------------------------
+# Name:        benchmark.py
+# Purpose:     Benchmarking the state modes and the feature extractors of the environment (per-step latency, memory, and mAP of a trained agent on PASCAL VOC).
+#
+# Author:      Matthias Bartolo <matthias.bartolo@ieee.org>
+#
+# Created:     February 24, 2024
+# Copyright:   (c) Matthias Bartolo 2024-
+# Licence:     All rights reserved
+#-------------------------------------------------------------------------------
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from SaRLVision.env import DetectionEnv, TEST_MODE
+from SaRLVision.models import get_model, FEATURE_EXTRACTOR_SPECS
+from SaRLVision.SaRa.benchmark import generate_benchmark_images
+
+"""
+    Defining the state modes which are benchmarked ('crop' is the reference, against which the states of the other modes are compared).
+"""
+BENCHMARK_STATE_MODES = ('crop', 'roi', 'roialign')
+# The feature extractors which are benchmarked.
+BENCHMARK_FEATURE_EXTRACTORS = ('vgg16',)
+# The feature extractors which are compared in the selection table (every feature extractor of the lazy model registry).
+SELECTION_FEATURE_EXTRACTORS = tuple(FEATURE_EXTRACTOR_SPECS.keys())
+# The number of steps per benchmark episode (the default maximum number of steps of an episode).
+BENCHMARK_STEPS = 40
+# The seed of the random actions of the benchmark episodes, so that every state mode sees the same bounding boxes.
+BENCHMARK_SEED = 2024
+
+
+def run_episode(env, image, actions):
+    """
+        Function that runs a benchmark episode on an image with a fixed sequence of movement actions.
+
+        Args:
+            - Env: Environment
+            - Image: Image of the episode
+            - Actions: Sequence of movement actions
+
+        Output:
+            - List of states of the episode and the episode time (in seconds)
+    """
+    height, width = image.shape[:2]
+    start = time.perf_counter()
+
+    # Resetting the environment on the image (the whole image as the ground truth, so that the episode is never triggered early)
+    state, _ = env.reset(env_config={'image': image, 'original_image': image.copy(), 'target_gt_boxes': [[0, 0, width, height]]})
+    states = [state]
+
+    # Moving the bounding box with the actions of the episode
+    for action in actions:
+        state, _, terminated, truncated, _ = env.step(action)
+        states.append(state)
+        if terminated or truncated:
+            break
+
+    return states, time.perf_counter() - start
+
+
+def benchmark_state_modes(images=None, feature_extractors=BENCHMARK_FEATURE_EXTRACTORS, state_modes=BENCHMARK_STATE_MODES, steps=BENCHMARK_STEPS, seed=BENCHMARK_SEED):
+    """
+        Function that benchmarks the per-step latency of the state modes of the environment, and the deviation of their states from the 'crop' mode.
+
+        Args:
+            - Images: List of images (the synthetic SaRa benchmark images if None)
+            - Feature_extractors: Names of the feature extractors
+            - State_modes: State modes of the environment
+            - Steps: Number of steps per episode
+            - Seed: Seed of the actions of the episodes
+
+        Output:
+            - DataFrame with the mean latency per step (including the reset), and the mean relative deviation of the features from the 'crop' mode, per feature extractor and state mode
+    """
+    if images is None:
+        images = list(generate_benchmark_images().values())
+
+    # Drawing the same movement actions for every state mode
+    rng = np.random.default_rng(seed)
+    actions = [rng.integers(0, 8, steps).tolist() for _ in images]
+
+    rows = []
+    for feature_extractor in feature_extractors:
+        reference_states = None
+        for state_mode in state_modes:
+            env = DetectionEnv({'dataset': None, 'image': images[0], 'original_image': images[0].copy(), 'target_gt_boxes': [[0, 0, images[0].shape[1], images[0].shape[0]]],
+                                'feature_extractor': feature_extractor, 'state_mode': state_mode, 'max_steps': steps + 1, 'use_sara': False})
+
+            # Warming up the feature extractor
+            run_episode(env, images[0], actions[0][:1])
+
+            # Running the benchmark episodes
+            episode_states, latencies = [], []
+            for image, image_actions in zip(images, actions):
+                states, episode_time = run_episode(env, image, image_actions)
+                episode_states.append(np.concatenate(states, axis=0))
+                latencies.append(episode_time / len(states))
+
+            # Comparing the features of the states with those of the 'crop' mode (the action histories are identical)
+            if state_mode == 'crop':
+                reference_states = episode_states
+            deviation = np.nan
+            if reference_states is not None and state_mode != 'fused':
+                deviation = np.mean([np.linalg.norm(s - r, axis=1).mean() / max(np.linalg.norm(r, axis=1).mean(), 1e-12) for s, r in zip(episode_states, reference_states)])
+
+            rows.append({'feature_extractor': feature_extractor, 'state_mode': state_mode, 'ms_per_step': np.mean(latencies) * 1000, 'state_deviation': deviation})
+
+    return pd.DataFrame(rows).round(4)
+
+
+def evaluate_state_modes(agent_path, dataset, feature_extractor='vgg16', state_modes=BENCHMARK_STATE_MODES, network='DQN', current_class=None, path='evaluation_results'):
+    """
+        Function that evaluates a trained agent on PASCAL VOC with every state mode of the environment, for comparing their mAP.
+
+        Args:
+            - Agent_path: Path of the saved agent (as saved by DQNAgent.save)
+            - Dataset: Path of the PASCAL VOC dataset
+            - Feature_extractor: Name of the feature extractor the agent was trained with
+            - State_modes: State modes of the environment
+            - Network: Network of the agent ('DQN' or 'DuelingDQN')
+            - Current_class: Class to evaluate (the first class of the dataset if None)
+            - Path: Path of the evaluation results
+
+        Output:
+            - DataFrame with the AP@0.50, the AP@[0.50:0.95], the average IoU and the evaluation time per step, per state mode
+    """
+    # Importing the agents only when evaluating, as they depend on the rendering stack
+    from SaRLVision.agents import DQNAgent, DuelingDQNAgent
+    from SaRLVision.utils import Replay_Buffer
+
+    rows = []
+    for state_mode in state_modes:
+        env_config = {'dataset': dataset, 'feature_extractor': feature_extractor, 'state_mode': state_mode}
+        if current_class is not None:
+            env_config['current_class'] = current_class
+        env = DetectionEnv(env_config)
+        env.env_mode = TEST_MODE
+
+        # Loading the agent and evaluating it with the state mode
+        agent = {'DQN': DQNAgent, 'DuelingDQN': DuelingDQNAgent}[network](env, Replay_Buffer(env, fullsize=1, minsize=1))
+        agent.load(agent_path)
+        env.test()
+        agent.evaluate(os.path.join(path, state_mode))
+
+        metrics = env.evaluation_results['metrics']
+        rows.append({'state_mode': state_mode, 'AP@0.50': metrics['average_precision'][0] * 100, 'AP@[0.50:0.95]': np.mean(metrics['average_precision']) * 100,
+                     'average_iou': metrics['average_iou'], 'ms_per_step': env.evaluation_results['eval_time'] * 1000 / max(sum(env.evaluation_results['episode_lengths']), 1)})
+
+    return pd.DataFrame(rows).round(4)
+
+
+def benchmark_feature_extractors(images=None, feature_extractors=SELECTION_FEATURE_EXTRACTORS, state_mode='crop', steps=BENCHMARK_STEPS, seed=BENCHMARK_SEED):
+    """
+        Function that builds the selection table of the feature extractors, with their per-step latency, memory, and state size.
+
+        Args:
+            - Images: List of images (the synthetic SaRa benchmark images if None)
+            - Feature_extractors: Names of the feature extractors
+            - State_mode: State mode of the environment
+            - Steps: Number of steps per episode
+            - Seed: Seed of the actions of the episodes
+
+        Output:
+            - DataFrame with the input size, the size of the feature vector, the memory of the weights (in MB) and the mean latency per step, per feature extractor (by increasing latency)
+    """
+    latencies = benchmark_state_modes(images, feature_extractors, (state_mode,), steps, seed)
+
+    rows = []
+    for feature_extractor, ms_per_step in zip(latencies['feature_extractor'], latencies['ms_per_step']):
+        # Measuring the memory of the weights and buffers of the feature extractor (constructed once, by the benchmark episodes)
+        model = get_model(feature_extractor)
+        memory = sum(tensor.numel() * tensor.element_size() for tensor in list(model.parameters()) + list(model.buffers()))
+        spec = FEATURE_EXTRACTOR_SPECS[feature_extractor]
+        rows.append({'feature_extractor': feature_extractor, 'input_size': 'x'.join(str(size) for size in spec['target_size']), 'feature_dim': spec['feature_dim'],
+                     'weights_mb': memory / 1024 ** 2, 'ms_per_step': ms_per_step})
+
+    return pd.DataFrame(rows).sort_values('ms_per_step').round(4).reset_index(drop=True)
+
+
+def evaluate_feature_extractors(agent_path, dataset, feature_extractors=SELECTION_FEATURE_EXTRACTORS, network='DQN', current_class=None, path='evaluation_results'):
+    """
+        Function that evaluates the agents trained with every feature extractor on PASCAL VOC, for adding their mAP to the selection table.
+
+        Args:
+            - Agent_path: Path of the saved agents, with a {feature_extractor} placeholder for the name of the feature extractor (e.g. models/dqn_{feature_extractor})
+            - Dataset: Path of the PASCAL VOC dataset
+            - Feature_extractors: Names of the feature extractors
+            - Network: Network of the agents ('DQN' or 'DuelingDQN')
+            - Current_class: Class to evaluate (the first class of the dataset if None)
+            - Path: Path of the evaluation results
+
+        Output:
+            - DataFrame with the AP@0.50, the AP@[0.50:0.95], the average IoU and the evaluation time per step, per feature extractor
+    """
+    evaluations = []
+    for feature_extractor in feature_extractors:
+        # Evaluating the agent trained with the feature extractor with the default state mode
+        evaluation = evaluate_state_modes(agent_path.format(feature_extractor=feature_extractor), dataset, feature_extractor, ('crop',), network, current_class,
+                                          os.path.join(path, feature_extractor))
+        evaluations.append(evaluation.drop(columns='state_mode').assign(feature_extractor=feature_extractor))
+
+    evaluations = pd.concat(evaluations, ignore_index=True)
+    return evaluations[['feature_extractor'] + [column for column in evaluations.columns if column != 'feature_extractor']]
+
+
+if __name__ == '__main__':
+    # Running the benchmark, e.g. python -m SaRLVision.benchmark (add --agent_path and --dataset for the mAP of a trained agent on PASCAL VOC,
+    # and --selection for the selection table of the feature extractors, e.g. --selection --agent_path models/dqn_{feature_extractor})
+    parser = argparse.ArgumentParser(description='Benchmark the state modes and the feature extractors of the environment.')
+    parser.add_argument('--feature_extractors', nargs='+', default=None, help='Feature extractors to benchmark (vgg16, or every feature extractor of the registry with --selection)')
+    parser.add_argument('--state_modes', nargs='+', default=list(BENCHMARK_STATE_MODES), help='State modes to benchmark')
+    parser.add_argument('--steps', type=int, default=BENCHMARK_STEPS, help='Number of steps per episode')
+    parser.add_argument('--agent_path', default=None, help='Path of a saved agent, for evaluating the mAP of every state mode (with a {feature_extractor} placeholder with --selection)')
+    parser.add_argument('--dataset', default=None, help='Path of the PASCAL VOC dataset, for evaluating the mAP of every state mode')
+    parser.add_argument('--network', default='DQN', choices=['DQN', 'DuelingDQN'], help='Network of the saved agent')
+    parser.add_argument('--current_class', default=None, help='Class to evaluate')
+    parser.add_argument('--selection', action='store_true', help='Build the selection table of the feature extractors instead of benchmarking the state modes')
+    parser.add_argument('--save_path', default=None, help='Path of a CSV file to save the benchmark results to')
+    args = parser.parse_args()
+
+    if args.selection:
+        feature_extractors = args.feature_extractors if args.feature_extractors is not None else list(SELECTION_FEATURE_EXTRACTORS)
+        results = benchmark_feature_extractors(feature_extractors=feature_extractors, steps=args.steps)
+
+        # Adding the mAP of the agents trained with every feature extractor
+        if args.agent_path is not None and args.dataset is not None:
+            evaluation = evaluate_feature_extractors(args.agent_path, args.dataset, feature_extractors, args.network, args.current_class)
+            results = results.merge(evaluation.drop(columns='ms_per_step'), on='feature_extractor', how='left')
+
+        print('\033[37m' + 'Feature extractor selection table (input size, feature vector size, weight memory, latency per step and mAP):' + '\033[0m')
+        print(results.to_string(index=False))
+    else:
+        feature_extractors = args.feature_extractors if args.feature_extractors is not None else list(BENCHMARK_FEATURE_EXTRACTORS)
+        results = benchmark_state_modes(feature_extractors=feature_extractors, state_modes=args.state_modes, steps=args.steps)
+        print('\033[37m' + 'State mode benchmark (latency per step and deviation of the states from the crop mode):' + '\033[0m')
+        print(results.to_string(index=False))
+
+        if args.agent_path is not None and args.dataset is not None:
+            for feature_extractor in feature_extractors:
+                evaluation = evaluate_state_modes(args.agent_path, args.dataset, feature_extractor, args.state_modes, args.network, args.current_class)
+                print('\033[37m' + 'State mode evaluation (' + feature_extractor + '):' + '\033[0m')
+                print(evaluation.to_string(index=False))
+
+    if args.save_path is not None:
+        results.to_csv(args.save_path, index=False)
@@ -0,0 +1,171 @@
+#-------------------------------------------------------------------------------
+# Name:        deploy.py
+# Purpose:     Exporting the feature extractor and the trained policy to ONNX, and running them with ONNX Runtime for CPU deployment.
+#
+# Author:      Matthias Bartolo <matthias.bartolo@ieee.org>
+#
+# Created:     February 24, 2024
+# Copyright:   (c) Matthias Bartolo 2024-
+# Licence:     All rights reserved
+#-------------------------------------------------------------------------------
+import os
+import inspect
+import argparse
+import numpy as np
+import torch
+
+from SaRLVision.models import get_model, DQN, DuelingDQN, VGG16_TARGET_SIZE, FEATURE_EXTRACTOR_SPECS
+
+"""
+    Defining the ONNX opset of the exported graphs.
+"""
+ONNX_OPSET = 17
+# The number of intra-op threads of the ONNX Runtime sessions (None for the number of CPU cores).
+ONNX_INTRA_OP_THREADS = None
+# The input sizes of the feature extractors, by name.
+FEATURE_EXTRACTOR_TARGET_SIZES = {name: spec['target_size'] for name, spec in FEATURE_EXTRACTOR_SPECS.items()}
+# The policy networks, by name.
+NETWORKS = {'DQN': DQN, 'DuelingDQN': DuelingDQN}
+
+
+def _export(model, example_input, path, input_name, output_name):
+    """ Exporting a model to ONNX with a dynamic batch dimension (with the TorchScript based exporter, on the PyTorch versions which default to another one) """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    kwargs = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(model, (example_input,), path, input_names=[input_name], output_names=[output_name],
+                          dynamic_axes={input_name: {0: 'batch'}, output_name: {0: 'batch'}}, opset_version=ONNX_OPSET, **kwargs)
+    return path
+
+
+def export_feature_extractor(feature_extractor, path, target_size=VGG16_TARGET_SIZE):
+    """
+        Exporting a feature extractor (including its global average pooling) to ONNX.
+
+        Args:
+            feature_extractor: The feature extractor (or its name in the lazy model registry).
+            path: The path of the ONNX graph.
+            target_size: The input size of the feature extractor.
+
+        Returns:
+            The path of the ONNX graph.
+    """
+    feature_extractor = get_model(feature_extractor).cpu().eval()
+    return _export(feature_extractor, torch.zeros(1, 3, *target_size), path, 'image', 'features')
+
+
+def load_policy(policy_path, network=DQN, noutputs=None):
+    """
+        Loading a trained policy network (policy_net.pth, as saved by DQNAgent.save), with its input and output sizes read from its weights.
+
+        Args:
+            policy_path: The path of the weights of the policy network.
+            network: The network of the policy (DQN or DuelingDQN).
+            noutputs: The number of actions (read from the last layer if None).
+
+        Returns:
+            The policy network, in evaluation mode on the CPU.
+    """
+    state_dict = torch.load(policy_path, map_location='cpu')
+    weights = [weight for weight in state_dict.values() if weight.dim() == 2]
+    policy_net = network(weights[0].shape[1], noutputs if noutputs is not None else weights[-1].shape[0])
+    policy_net.load_state_dict(state_dict)
+    return policy_net.eval()
+
+
+def export_policy(policy_net, path):
+    """
+        Exporting a policy network to ONNX.
+
+        Args:
+            policy_net: The policy network (DQN or DuelingDQN).
+            path: The path of the ONNX graph.
+
+        Returns:
+            The path of the ONNX graph.
+    """
+    policy_net = policy_net.cpu().eval()
+    ninputs = [weight for weight in policy_net.state_dict().values() if weight.dim() == 2][0].shape[1]
+    return _export(policy_net, torch.zeros(1, ninputs), path, 'state', 'qvalues')
+
+
+def create_session(path, intra_op_threads=ONNX_INTRA_OP_THREADS):
+    """
+        Creating an ONNX Runtime session on the CPU, tuned for the single image batches of the environment.
+
+        Args:
+            path: The path of the ONNX graph.
+            intra_op_threads: The number of threads used within every operator (None for the number of CPU cores).
+
+        Returns:
+            The ONNX Runtime inference session.
+    """
+    # Importing ONNX Runtime only when it is used, as it is an optional dependency for deployment
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = intra_op_threads if intra_op_threads is not None else (os.cpu_count() or 1)
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+"""
+    ONNX Runtime Model, which runs an exported graph behind the interface of the torch modules it replaces (tensors in, tensors out).
+"""
+class OnnxModel():
+    def __init__(self, path, intra_op_threads=ONNX_INTRA_OP_THREADS):
+        """
+            Constructor of the OnnxModel class.
+
+            Args:
+                path: The path of the ONNX graph.
+                intra_op_threads: The number of threads used within every operator (None for the number of CPU cores).
+        """
+        self.path = path
+        self.session = create_session(path, intra_op_threads)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def __call__(self, x):
+        # Running the graph on the input (moved to the CPU), and returning the output as a tensor
+        output = self.session.run([self.output_name], {self.input_name: np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)})[0]
+        return torch.from_numpy(output)
+
+    def to(self, *args, **kwargs):# The graph always runs on the CPU
+        return self
+
+    def eval(self):# The graph is always in inference mode
+        return self
+
+
+"""
+    ONNX Runtime Feature Extractor, which can be given to DetectionEnv as its feature extractor.
+"""
+class OnnxFeatureExtractor(OnnxModel):
+    pass
+
+
+"""
+    ONNX Runtime Policy, which a DQN agent can select its actions with instead of its policy network (see DQNAgent.load_onnx).
+"""
+class OnnxPolicy(OnnxModel):
+    pass
+
+
+if __name__ == '__main__':
+    # Exporting the feature extractor and the trained policy, e.g. python -m SaRLVision.deploy --model_path models/dqn --feature_extractor vgg16
+    parser = argparse.ArgumentParser(description='Export the feature extractor and the trained policy to ONNX.')
+    parser.add_argument('--model_path', required=True, help='Path of the saved agent (the directory of policy_net.pth)')
+    parser.add_argument('--feature_extractor', default='vgg16', choices=list(FEATURE_EXTRACTOR_TARGET_SIZES.keys()), help='Feature extractor of the environment')
+    parser.add_argument('--network', default='DQN', choices=list(NETWORKS.keys()), help='Network of the policy')
+    parser.add_argument('--save_path', default=None, help='Directory of the ONNX graphs (the model path if not given)')
+    args = parser.parse_args()
+
+    save_path = args.save_path if args.save_path is not None else args.model_path
+    feature_extractor_path = export_feature_extractor(args.feature_extractor, os.path.join(save_path, args.feature_extractor + '.onnx'), FEATURE_EXTRACTOR_TARGET_SIZES[args.feature_extractor])
+    policy_path = export_policy(load_policy(os.path.join(args.model_path, 'policy_net.pth'), NETWORKS[args.network]), os.path.join(save_path, 'policy_net.onnx'))
+
+    print('\033[92m' + 'Feature extractor exported to: ' + feature_extractor_path + '\033[0m')
+    print('\033[92m' + 'Policy exported to: ' + policy_path + '\033[0m')
@@ -16,9 +16,11 @@ import torch
 import torch.nn as nn
 import torchvision 
 from torchvision import datasets
+from torchvision.ops import roi_align
 import matplotlib.pyplot as plt
 from SaRLVision.utils import *
 from SaRLVision.models import *
+from SaRLVision.label_mapping import decode_mapped_predictions
 import time
 import math
 import colorsys
@@ -26,16 +28,22 @@ import pygame
 import os
 import sys
 import json
-import importlib
+from functools import partial
 
 # Importing SaRa (Saliency Ranking (Seychell et al. IEEE IC3D))
 import SaRLVision.SaRa.saraRC1 as sara
+from SaRLVision.SaRa.sara_cache import SaliencyCache, SALIENCY_CACHE_DIR
 # Saliency Map Generator (Itti Model)
 generator = 'itti' 
-# Optimal Grid Size for the Saliency Map
+# Optimal Grid Size for the Saliency Map ('auto' selects the grid size of the SaRa grid pyramid per image, based on the scale of the salient object)
 GRID_SIZE =  9
 # Boolean flag to use the SARA model for initial bounding box prediction
 USE_SARA = False#True
+# Cache of the saliency maps and SaRa results per dataset image, shared by the environments. The saliency maps are also kept on disk in SALIENCY_CACHE_DIR (the
+# SARLVISION_SALIENCY_CACHE_DIR environment variable), so that later epochs and runs reuse them; precompute_saliency (python -m SaRLVision.SaRa.sara_cache) fills it ahead of training.
+SALIENCY_CACHE = SaliencyCache(cache_dir=SALIENCY_CACHE_DIR)
+# The number of SaRa proposals (clusters of top-ranked segments) from which successive searches start in multiple object episodes, when SaRa is used (0 for restarting from the image corners).
+SARA_PROPOSALS = 4
 
 # Importing Mask To Annotation (Creating Annotations from Masks (IEEE ISM 2023))
 import SaRLVision.MaskToAnnotation.coco as coco
@@ -46,6 +54,18 @@ import SaRLVision.MaskToAnnotation.annotation_helper as ah
 # Defining constants
 # The number of actions is 9 because we have 8 actions + 1 trigger action (move right, move left, move up, move down, make bigger, make smaller, make fatter, make taller, trigger).
 NUMBER_OF_ACTIONS = 9
+# The action deltas table holds, for every action, the multipliers applied to (alpha_w, alpha_h, alpha_w, alpha_h) to move the [xmin, ymin, xmax, ymax] coordinates of the bounding box (the trigger action leaves the bounding box unchanged).
+ACTION_DELTAS = np.array([
+    [ 1,  0,  1,  0], # 0: Move right
+    [-1,  0, -1,  0], # 1: Move left
+    [ 0, -1,  0, -1], # 2: Move up
+    [ 0,  1,  0,  1], # 3: Move down
+    [-1, -1,  1,  1], # 4: Make bigger
+    [ 1,  1, -1, -1], # 5: Make smaller
+    [ 0,  1,  0, -1], # 6: Make fatter
+    [ 1,  0, -1,  0], # 7: Make taller
+    [ 0,  0,  0,  0], # 8: Trigger
+])
 # The size of the action history which controls the number of actions that the environment will remember.
 ACTION_HISTORY_SIZE = 10
 # The action history is a binary matrix of size NUMBER_OF_ACTIONS x ACTION_HISTORY_SIZE, where each row corresponds to an action and each column corresponds to a step.
@@ -62,16 +82,30 @@ MAX_STEPS = 200
 TRIGGER_STEPS = 40
 # The environment render mode is used to render the environment in different modes (None, human, trigger_image, bbox, rgb_array).
 RENDER_MODE = None
-# The feature extractor is the CNN used to extract the features of the image in the environment.
-FEATURE_EXTRACTOR = VGG16FeatureExtractor()
+# The feature extractor is the CNN used to extract the features of the image in the environment (a model name of the lazy model registry, constructed on first use).
+FEATURE_EXTRACTOR = 'vgg16'
 # The target size is the size of the image that will be used as input to the feature extractor.
 TARGET_SIZE = VGG16_TARGET_SIZE
-# The classifier is the CNN used to classify the image ROI in the environment.
-CLASSIFIER = ResNet50V2()
+# The quantise flag is used to specify whether the feature extractor is statically quantised to int8 for CPU inference (True), calibrated on crops of the dataset images, or kept in full precision (False).
+QUANTIZE = False
+# The number of calibration crops used when quantising the feature extractor.
+CALIBRATION_CROPS = 64
+# The state mode is used to specify how the features of the state are computed ('crop' for cropping and resizing the region of interest on the CPU, 'roi' for cropping and resizing it on the device (with the antialiased bilinear filter of the PIL resize of 'crop', but without its rounding to 8 bits, so the pixels differ by less than one grey level), 'roialign' for RoIAlign pooling the region of interest from the feature map of the whole image, 'fused' for leaving the features to a FusedDetectionPolicy, in which case the state only holds the action history).
+STATE_MODE = 'crop'
+# The longest side of the image when computing its feature map in the 'roialign' state mode (larger images are downscaled).
+ROIALIGN_MAX_SIZE = 640
+# The output size of RoIAlign in the 'roialign' state mode (the size of the feature map of a region of interest resized to the target size, e.g. 7 x 7 for 224 x 224 inputs).
+ROIALIGN_OUTPUT_SIZE = (7, 7)
+# The classifier is the CNN used to classify the image ROI in the environment (a model name of the lazy model registry, constructed on first use; 'torch_resnet50' or 'torch_mobilenetv2' keep the environment on a single (torch) runtime).
+CLASSIFIER = 'resnet50v2'
 # The classifier target size is the size of the image that will be used as input to the classifier.
 CLASSIFIER_TARGET_SIZE = RESNET50_TARGET_SIZE
+# The label mapping is the detection dataset whose labels the ImageNet predictions of the classifier are mapped to ('voc' or 'coco'), or None for keeping the ImageNet labels (the default, so that the labels only change when a mapping is opted into).
+LABEL_MAPPING = None
 # The reward function is the function used to calculate the reward of the environment.
 REWARD_FUNC = calculate_best_iou
+# The reward matrix function is the vectorised counterpart of the reward function, used to score all the candidate actions at once.
+REWARD_MATRIX_FUNC = iou_matrix
 # The environment mode is used to specify whether the environment is in training or testing mode (0 for training, 1 for testing).
 ENV_MODE = TRAIN_MODE
 # The use dataset is used to specify whether the environment will use the dataset or not (None for not using the dataset, or the path of the dataset ('PascalVOC2007_2012Dataset')).
@@ -87,6 +121,12 @@ MULTI_OBJ = 1
 OBJ_COFIGURATION = SINGLE_OBJ
 # The allow classification is used to specify whether the environment will allow classification or not (True for allowing classification, False for not allowing classification).
 ALLOW_CLASSIFICATION = False
+# The shared backbone classification is used to specify whether the triggered bounding boxes are classified by the ImageNet head of the feature extractor on the feature map already computed for their state (True), instead of a second backbone pass of the classifier on the cropped image (False).
+SHARED_BACKBONE_CLASSIFICATION = False
+# The classification queue is used to classify the bounding boxes of many finished episodes in large batches, with the labels resolved asynchronously (None for classifying the bounding boxes of every image as soon as its episode ends, a batch size for a queue of this environment, or a ClassificationQueue shared by several environments).
+CLASSIFICATION_QUEUE = None
+# The store evaluation boxes flag is used to specify whether the raw ground truth and predicted bounding boxes of every image are kept in the evaluation results (False keeps only the streaming metrics, bounding the memory of long evaluations).
+STORE_EVALUATION_BOXES = True
 
 
 """
@@ -114,17 +154,27 @@ class DetectionEnv(Env):
                 - 'image': The image to be used in the environment.
                 - 'original_image': The original image to be used in the environment.
                 - 'target_gt_boxes': The target bounding boxes to be used in the environment.
-                - 'target_size': The size of the image that will be used as input to the feature extractor.
+                - 'target_size': The size of the image that will be used as input to the feature extractor (the input size of the feature extractor, if it is named in the lazy model registry).
                 - 'use_sara': Whether the environment will use the SARA model for initial bounding box prediction (True for using the SARA model, False for not using the SARA model).
-                - 'feature_extractor': The CNN used to extract the features of the image in the environment.
+                - 'saliency_cache': The cache of the saliency maps and SaRa results per dataset image (a SaliencyCache).
+                - 'saliency_cache_dir': The directory of the on-disk saliency maps, for a cache of this environment only (None for keeping it in memory only).
+                - 'grid_size': The grid size of the SaRa algorithm (or 'auto' for selecting it per image from the SaRa grid pyramid).
+                - 'sara_proposals': The number of SaRa proposals from which successive searches start in multiple object episodes (0 for restarting from the image corners).
+                - 'feature_extractor': The CNN used to extract the features of the image in the environment (or its name in the lazy model registry, e.g. 'vgg16', or one of the lightweight backbones 'resnet18', 'shufflenetv2' and 'efficientnetb0', or an OnnxFeatureExtractor for running it with ONNX Runtime).
+                - 'state_mode': How the features of the state are computed ('crop', 'roi', 'roialign' or 'fused', where 'roialign' runs the feature extractor once per image and RoIAlign pools every state from its feature map, and the state of the 'fused' mode only holds the action history, and the region of interest is left in self.roi for a FusedDetectionPolicy).
+                - 'quantize': Whether the feature extractor is statically quantised to int8 for CPU inference, calibrated on crops of the dataset images.
                 - 'max_steps': The maximum number of steps in the environment.
                 - 'trigger_steps': The number of steps before the trigger in the environment.
                 - 'alpha': The scaling factor for bounding box movements in the environment.
                 - 'nu': The trigger reward in the environment.
                 - 'threshold': The IoU threshold for the trigger action positive or negative reward in the environment.
-                - 'classifier': The CNN used to classify the image ROI in the environment.
+                - 'classifier': The CNN used to classify the image ROI in the environment (or its name in the lazy model registry, e.g. 'resnet50v2').
                 - 'classifier_target_size': The size of the image that will be used as input to the classifier.
                 - 'allow_classification': Whether the environment will allow classification or not (True for allowing classification, False for not allowing classification).
+                - 'shared_backbone_classification': Whether the triggered bounding boxes are classified by the ImageNet head of the feature extractor, reusing the feature map of their state instead of running the classifier.
+                - 'label_mapping': The detection dataset whose labels the ImageNet predictions are mapped to ('voc' or 'coco'), or None for the ImageNet labels.
+                - 'classification_queue': None for classifying the bounding boxes as soon as an episode ends, a batch size, or a ClassificationQueue (shared by several environments) for classifying the bounding boxes of many episodes in batches.
+                - 'store_evaluation_boxes': Whether the raw bounding boxes of every evaluated image are kept in the evaluation results (False for keeping only the streaming metrics).
                 - 'render_mode': The render mode of the environment (None, human, trigger_image, bbox, rgb_array).
                 
             Returns:
@@ -135,6 +185,9 @@ class DetectionEnv(Env):
         self.current_gt_bboxes = []
         self.current_gt_index =0
 
+        # Initialising the current image name (None for images which are not from the dataset, which are never cached)
+        self.current_img_name = None
+
         # dataset variables
         if 'dataset' in env_config:
             self.use_dataset = env_config['dataset']
@@ -173,6 +226,13 @@ class DetectionEnv(Env):
         else:
             self.obj_configuration = OBJ_COFIGURATION
 
+        # Setting whether the raw bounding boxes are kept in the evaluation results
+        if 'store_evaluation_boxes' in env_config:
+            self.store_evaluation_boxes = env_config['store_evaluation_boxes']
+            del env_config['store_evaluation_boxes']
+        else:
+            self.store_evaluation_boxes = STORE_EVALUATION_BOXES
+
         # Loading the dataset if self.use_dataset is not None
         if self.use_dataset is not None:
             # Loading the training dataset if the dataset year is 2007+2012, else loading user specified dataset
@@ -195,7 +255,8 @@ class DetectionEnv(Env):
 
             # For Evaluation, if the environment mode is testing, then create the evaluation results dictionary
             if self.env_mode == TEST_MODE: # Testing mode
-                self.evaluation_results = {'class': self.current_class, 'gt_boxes': {}, 'bounding_boxes': {}, 'total_images': len(self.dataset[self.current_class]), 'labels': {}, 'confidences': {}}
+                self.evaluation_results = {'class': self.current_class, 'gt_boxes': {}, 'bounding_boxes': {}, 'total_images': len(self.dataset[self.current_class]), 'labels': {}, 'confidences': {}, 'difficult': {}}
+                self.metrics_accumulator = DetectionMetricsAccumulator()
 
             # Extracting the first image
             self.extract()
@@ -228,6 +289,9 @@ class DetectionEnv(Env):
         if 'target_size' in env_config:
             self.target_size = env_config['target_size']
             del env_config['target_size']
+        elif env_config.get('feature_extractor', FEATURE_EXTRACTOR) in FEATURE_EXTRACTOR_SPECS:
+            # Using the input size of the feature extractor of the lazy model registry (e.g. 'efficientnetb0' or 'shufflenetv2')
+            self.target_size = FEATURE_EXTRACTOR_SPECS[env_config.get('feature_extractor', FEATURE_EXTRACTOR)]['target_size']
         else:
             self.target_size = TARGET_SIZE
 
@@ -238,6 +302,30 @@ class DetectionEnv(Env):
         else:
             self.use_sara = USE_SARA
 
+        # Extracting the saliency cache
+        if 'saliency_cache' in env_config:
+            self.saliency_cache = env_config['saliency_cache']
+            del env_config['saliency_cache']
+        elif 'saliency_cache_dir' in env_config:
+            self.saliency_cache = SaliencyCache(cache_dir=env_config['saliency_cache_dir'])
+            del env_config['saliency_cache_dir']
+        else:
+            self.saliency_cache = SALIENCY_CACHE
+
+        # Extracting the grid size of the SaRa algorithm
+        if 'grid_size' in env_config:
+            self.grid_size = env_config['grid_size']
+            del env_config['grid_size']
+        else:
+            self.grid_size = GRID_SIZE
+
+        # Extracting the number of SaRa proposals
+        if 'sara_proposals' in env_config:
+            self.sara_proposals = env_config['sara_proposals']
+            del env_config['sara_proposals']
+        else:
+            self.sara_proposals = SARA_PROPOSALS
+
         # Initialising the actions history and the number of episodes.
         self.actions_history = []
         self.num_episodes = 0
@@ -248,21 +336,58 @@ class DetectionEnv(Env):
 
         # If use_sara is True, then invoke the generate_initial_bbox function
         if self.use_sara:
-            # Reloading SaRa (Saliency Ranking (Seychell et al. IEEE IC3D))
-            importlib.reload(sara)
             # Generating the initial bounding box using SaRa
             self.bbox = self.generate_initial_bbox()
 
+        # Generating the SaRa proposals for multiple object episodes
+        self.proposals = self.generate_proposals()
+        self.visited_proposals = []
+
         # Initialising the feature extractor and the transform method.
         if 'feature_extractor' in env_config:
-            self.feature_extractor = env_config['feature_extractor']
+            self.feature_extractor = get_model(env_config['feature_extractor'])
             del env_config['feature_extractor']
         else:
-            self.feature_extractor = FEATURE_EXTRACTOR
+            self.feature_extractor = get_model(FEATURE_EXTRACTOR)
 
         # Setting the feature extractor to the device (for GPU or CPU usage)
         self.feature_extractor.to(device)
 
+        # Quantising the feature extractor to int8, if enabled (calibrated on crops of the dataset images, or of the given image)
+        if 'quantize' in env_config:
+            self.quantize = env_config['quantize']
+            del env_config['quantize']
+        else:
+            self.quantize = QUANTIZE
+        if self.quantize:
+            self.feature_extractor = QuantizedFeatureExtractor(self.feature_extractor, self.sample_calibration_crops(), self.target_size)
+
+        # Initialising the state mode, together with the image tensor on the device (and the image it was converted from) and the region of interest of the last state.
+        if 'state_mode' in env_config:
+            self.state_mode = env_config['state_mode']
+            del env_config['state_mode']
+        else:
+            self.state_mode = STATE_MODE
+        self.image_tensor = None
+        self.image_tensor_source = None
+        self.roi = None
+        self.state_tensor = None
+        self.state_array = None
+        self.image_feature_map = None
+        self.image_feature_map_source = None
+
+        # Initialising flag to classify the triggered bounding boxes from the feature maps of the feature extractor
+        if 'shared_backbone_classification' in env_config:
+            self.shared_backbone_classification = env_config['shared_backbone_classification']
+            del env_config['shared_backbone_classification']
+        else:
+            self.shared_backbone_classification = SHARED_BACKBONE_CLASSIFICATION
+
+        # Initialising the feature map of the last state (and its bounding box), and the feature maps of the triggered bounding boxes.
+        self.last_feature_map = None
+        self.last_feature_bbox = None
+        self.classification_features = []
+
         # Setting the transform method to the device (for GPU or CPU usage)
         self.transform = transform_input(self.image, self.target_size)
 
@@ -357,6 +482,25 @@ class DetectionEnv(Env):
         else:
             self.classifier_target_size = CLASSIFIER_TARGET_SIZE
 
+        # Initialising the classification queue (a batch size creates a queue for this environment).
+        if 'classification_queue' in env_config:
+            self.classification_queue = env_config['classification_queue']
+            del env_config['classification_queue']
+        else:
+            self.classification_queue = CLASSIFICATION_QUEUE
+        # Initialising the label mapping.
+        if 'label_mapping' in env_config:
+            self.label_mapping = env_config['label_mapping']
+            del env_config['label_mapping']
+        else:
+            self.label_mapping = LABEL_MAPPING
+
+        if isinstance(self.classification_queue, int):
+            self.classification_queue = ClassificationQueue(self.classifier, batch_size=self.classification_queue, label_mapping=self.label_mapping)
+
+        # Initialising the pending classification request of the current image (None if its labels are not waiting in the classification queue).
+        self.pending_classification = None
+
         # Rendering part (Retrieving a random color for the bounding box).
         self.color = self.generate_random_color()
 
@@ -413,13 +557,14 @@ class DetectionEnv(Env):
         # For Classification, if the environment mode is testing, then allow classification
         self.allow_classification = True
 
-        # Checking if the classification dictionary is empty, then we get the labels
-        if self.classification_dictionary['label'] == [] and self.classification_dictionary['bbox'] != []:
+        # Checking if the classification dictionary is empty (and not waiting in the classification queue), then we get the labels
+        if self.classification_dictionary['label'] == [] and self.classification_dictionary['bbox'] != [] and self.pending_classification is None:
             self.get_labels()
 
         # For Evaluation, if the environment mode is testing, then create the evaluation results dictionary
         if self.use_dataset is not None:
-            self.evaluation_results = {'class': self.current_class, 'gt_boxes': {}, 'bounding_boxes': {}, 'total_images': len(self.dataset[self.current_class]), 'labels': {}, 'confidences': {}}
+            self.evaluation_results = {'class': self.current_class, 'gt_boxes': {}, 'bounding_boxes': {}, 'total_images': len(self.dataset[self.current_class]), 'labels': {}, 'confidences': {}, 'difficult': {}}
+            self.metrics_accumulator = DetectionMetricsAccumulator()
         pass
 
     def eval(self):
@@ -432,13 +577,14 @@ class DetectionEnv(Env):
         # For Classification, if the environment mode is testing, then allow classification
         self.allow_classification = True
 
-        # Checking if the classification dictionary is empty, then we get the labels
-        if self.classification_dictionary['label'] == [] and self.classification_dictionary['bbox'] != []:
+        # Checking if the classification dictionary is empty (and not waiting in the classification queue), then we get the labels
+        if self.classification_dictionary['label'] == [] and self.classification_dictionary['bbox'] != [] and self.pending_classification is None:
             self.get_labels()
 
         # For Evaluation, if the environment mode is testing, then create the evaluation results dictionary
         if self.use_dataset is not None:
-            self.evaluation_results = {'class': self.current_class, 'gt_boxes': {}, 'bounding_boxes': {}, 'total_images': len(self.dataset[self.current_class]), 'labels': {}, 'confidences': {}}
+            self.evaluation_results = {'class': self.current_class, 'gt_boxes': {}, 'bounding_boxes': {}, 'total_images': len(self.dataset[self.current_class]), 'labels': {}, 'confidences': {}, 'difficult': {}}
+            self.metrics_accumulator = DetectionMetricsAccumulator()
         pass
 
     def calculate_reward(self, current_state, previous_state, target_bbox, reward_function=REWARD_FUNC):
@@ -498,7 +644,46 @@ class DetectionEnv(Env):
         # Else return -1 * nu.
         # Multiplying the negative reward by the IoU is not necessary, as doing so would be downscaling the negative reward, which makes the agent trigger on IoUs lower than the threshold.
         return -1*self.nu
-    
+
+    def calculate_action_rewards(self, target_bboxes=None, reward_function=REWARD_MATRIX_FUNC):
+        """
+            Calculating the reward of every action at once, without applying any of them.
+
+            The successor bounding boxes of all the actions are computed as a (9 x 4) array, and their IoUs against the ground truth bounding boxes as a (9 x G) matrix.
+            The rewards are identical to calling calculate_reward (actions 0-7) and calculate_trigger_reward (action 8) for every action.
+
+            Input:
+                - Target bounding boxes (defaults to the current ground truth bounding boxes)
+                - Reward matrix function
+
+            Output:
+                - Rewards of all the actions
+        """
+        # Retrieving the target bounding boxes.
+        if target_bboxes is None:
+            target_bboxes = self.current_gt_bboxes
+
+        # Calculating the successor bounding boxes of every action.
+        candidate_bboxes = self.transform_actions()
+
+        # Calculating the best IoU of the successor bounding boxes and of the current bounding box against the target bounding boxes.
+        if len(target_bboxes) > 0:
+            ious = reward_function(candidate_bboxes, target_bboxes).max(axis=1)
+            iou_previous = reward_function([self.bbox], target_bboxes).max()
+        else:
+            ious = np.full(NUMBER_OF_ACTIONS, -np.inf)
+            iou_previous = -np.inf
+
+        # Enabling binary reward in the range of {-1, 1} for the movement actions (including the equal to zero case as to mitigate redundant actions).
+        with np.errstate(invalid='ignore'):
+            rewards = np.where(ious - iou_previous > 0, 1.0, -1.0)
+
+        # Calculating the trigger reward (nu * 2 * IoU if the IoU is larger or equal to the threshold, else -1 * nu).
+        rewards[-1] = self.nu * 2 * ious[-1] if ious[-1] >= self.threshold else -1*self.nu
+
+        # Returning the rewards.
+        return rewards
+
     def get_features(self, image, dtype=FloatTensor):
         """
             Getting the features of the image.
@@ -514,7 +699,12 @@ class DetectionEnv(Env):
         image = transform_input(image, target_size=self.target_size)
 
         # Retrieving the features of the image (unsqueeze is added since it is expecting a batch, and squeeze is added to remove the batch dimension).
-        features = self.feature_extractor(image.unsqueeze(0).to(device)).squeeze(0)
+        if self.shared_backbone_classification and hasattr(self.feature_extractor, 'forward_features'):
+            # Keeping the feature map before the pooling, so that the region of interest can be classified without a second backbone pass
+            self.last_feature_map = self.feature_extractor.forward_features(image.unsqueeze(0).to(device)).data
+            features = self.feature_extractor.pooling(self.last_feature_map).squeeze(0)
+        else:
+            features = self.feature_extractor(image.unsqueeze(0).to(device)).squeeze(0)
 
         # Returning the features.
         return features.data
@@ -529,6 +719,11 @@ class DetectionEnv(Env):
             Output:
                 - State of the environment
         """
+        # Computing the state on the device, if the regions of interest are cropped (or RoIAlign pooled) on the device
+        if self.state_mode in ('roi', 'roialign', 'fused'):
+            return self.get_roi_state(dtype)
+        self.state_tensor = self.state_array = None
+
         # Extracting current bounding box
         bbox = self.bbox
 
@@ -549,6 +744,9 @@ class DetectionEnv(Env):
         # Retrieving the features of the image.
         features = self.get_features(image)
 
+        # Storing the bounding box of the feature map (which is the bounding box that is classified if the next action is the trigger)
+        self.last_feature_bbox = list(bbox)
+
         # Transposing the features and detaching it from the GPU (view is added to flatten the tensor and detach is added to remove the gradient from the tensor)
         features = features.view(1, -1).detach().cpu()
 
@@ -561,6 +759,123 @@ class DetectionEnv(Env):
         # Returning the state.
         return state.numpy()
     
+    def get_image_tensor(self):
+        """
+            Getting the current image as a tensor on the device, converting it only when the image changes (e.g. a new image, or an IoR cross).
+
+            Output:
+                - Image tensor (1 x channels x height x width)
+        """
+        if self.image_tensor_source is not self.image:
+            self.image_tensor = image_to_tensor(self.image)
+            self.image_tensor_source = self.image
+        return self.image_tensor
+
+    def get_roi_state(self, dtype=FloatDType):
+        """
+            Getting the state of the environment with the region of interest cropped and resized on the device, so that the features and the action
+            history only leave the device once (or, in the 'fused' state mode, leaving the features to a FusedDetectionPolicy, which selects the action
+            from self.roi and the action history of the state). The state is also kept on the device in self.state_tensor, so that the agent selects
+            the action without copying the returned state back to the device. The region of interest is resized with the antialiased bilinear filter
+            of the PIL resize of the 'crop' state mode, but it is not rounded to 8 bits, so its pixels differ from the 'crop' ones by less than one grey
+            level (about 0.3 on average).
+
+            Args:
+                - dtype: Data type
+
+            Output:
+                - State of the environment (numpy array, as returned to gymnasium)
+        """
+        # Extracting current bounding box
+        bbox = self.bbox
+
+        # Ensuring that the region of interest is not empty (in which case the whole image is used)
+        if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
+            self.truncated = True
+
+        # Flattenning the action history and converting it to a tensor on the device
+        action_history = torch.tensor(self.actions_history, dtype=dtype).view(1, -1)
+        action_history_tensor = action_history.to(device)
+
+        # Pooling the features of the region of interest from the feature map of the whole image in the 'roialign' state mode
+        if self.state_mode == 'roialign':
+            with torch.no_grad():
+                self.last_feature_map = self.get_roialign_feature_map(bbox)
+                features = self.feature_extractor.pooling(self.last_feature_map)
+            self.last_feature_bbox = list(bbox)
+            self.state_tensor = torch.cat((action_history_tensor, features.view(1, -1).to(dtype)), 1)
+            self.state_array = self.state_tensor.cpu().numpy()
+            return self.state_array
+
+        # Cropping and resizing the region of interest on the device
+        self.roi = crop_roi(self.get_image_tensor(), bbox, self.target_size)
+
+        # Returning only the action history in the 'fused' state mode, as the features are computed by the fused policy (so nothing leaves the device)
+        if self.state_mode == 'fused':
+            self.last_feature_bbox = None
+            self.state_tensor = action_history_tensor
+            self.state_array = action_history.numpy()
+            return self.state_array
+
+        # Retrieving the features of the region of interest (keeping the feature map before the pooling for the shared backbone classification)
+        with torch.no_grad():
+            if self.shared_backbone_classification and hasattr(self.feature_extractor, 'forward_features'):
+                self.last_feature_map = self.feature_extractor.forward_features(self.roi)
+                features = self.feature_extractor.pooling(self.last_feature_map)
+            else:
+                features = self.feature_extractor(self.roi)
+        self.last_feature_bbox = list(bbox)
+
+        # Concatenating the action history and the features, and returning the state (copied off the device once, for gymnasium)
+        self.state_tensor = torch.cat((action_history_tensor, features.view(1, -1).to(dtype)), 1)
+        self.state_array = self.state_tensor.cpu().numpy()
+        return self.state_array
+
+    def get_state_tensor(self, state):
+        """
+            Getting a state returned by the environment as a tensor on the device, reusing the copy kept on the device by get_roi_state when it is the
+            last state returned (so the 'roi', 'roialign' and 'fused' state modes never copy the state back to the device).
+
+            Args:
+                - state: State of the environment (numpy array)
+
+            Output:
+                - State of the environment on the device (1 x state size)
+        """
+        if self.state_tensor is not None and state is self.state_array:
+            return self.state_tensor
+        return torch.from_numpy(state).to(device).view(1, -1)
+
+    def get_roialign_feature_map(self, bbox):
+        """
+            Getting the feature map of a region of interest by RoIAlign pooling it from the feature map of the whole image, which is computed once per
+            image (and again only when the image changes, e.g. after an IoR cross), instead of running the feature extractor on every region of interest.
+
+            Input:
+                - Bounding box of the region of interest
+
+            Output:
+                - Feature map of the region of interest (1 x channels x ROIALIGN_OUTPUT_SIZE)
+        """
+        # Computing the feature map of the whole image (downscaled so that its longest side is at most ROIALIGN_MAX_SIZE)
+        if self.image_feature_map_source is not self.image:
+            image_tensor = self.get_image_tensor()
+            scale = min(1.0, ROIALIGN_MAX_SIZE / max(self.width, self.height))
+            if scale < 1.0:
+                image_tensor = F.interpolate(image_tensor, scale_factor=scale, mode='bilinear', align_corners=False, antialias=True, recompute_scale_factor=False)
+            self.image_feature_map = self.feature_extractor.forward_features(image_tensor)
+            self.image_feature_map_source = self.image
+
+        # Scaling the bounding box to the coordinates of the feature map (using the whole image if the bounding box is empty)
+        if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
+            bbox = [0, 0, self.width, self.height]
+        scale_x = self.image_feature_map.shape[3] / self.width
+        scale_y = self.image_feature_map.shape[2] / self.height
+        boxes = torch.tensor([[0, bbox[0] * scale_x, bbox[1] * scale_y, bbox[2] * scale_x, bbox[3] * scale_y]], dtype=self.image_feature_map.dtype, device=self.image_feature_map.device)
+
+        # Pooling the region of interest from the feature map
+        return roi_align(self.image_feature_map, boxes, output_size=ROIALIGN_OUTPUT_SIZE, spatial_scale=1.0, sampling_ratio=2, aligned=True)
+
     def update_history(self, action):
         """
             Function that updates the history of the actions by adding the last one.
@@ -611,58 +926,34 @@ class DetectionEnv(Env):
 
             Output:
                 - Bounding box of the image
-        
+
         """
-        # Retrieving the bounding box of the image.
-        bbox = self.bbox
+        # Retrieving the successor bounding box of the action from the successor bounding boxes of all the actions (as a list of python integers).
+        return self.transform_actions()[action].tolist()
 
-        # Retrieving the coordinates of the bounding box.
-        xmin, xmax, ymin, ymax = bbox[0], bbox[2], bbox[1], bbox[3]
+    def transform_actions(self):
+        """
+            Function that applies every action to the current bounding box at once, using the action deltas table.
+
+            Output:
+                - Array (9 x 4) of the successor bounding boxes [xmin, ymin, xmax, ymax], one row per action
+        """
+        # Retrieving the coordinates of the bounding box, keeping integer coordinates integral and fractional ones in float64 (so that they are not truncated, as in the per-action updates).
+        bbox = np.asarray(self.bbox)
+        if bbox.dtype.kind not in 'iu':
+            bbox = bbox.astype(np.float64)
+        xmin, ymin, xmax, ymax = self.bbox[0], self.bbox[1], self.bbox[2], self.bbox[3]
 
         # Calculating the alpha_h and alpha_w mentioned in the paper (scaling factor for bounding box movements).
         alpha_h = int(self.alpha * (  ymax - ymin ))
         alpha_w = int(self.alpha * (  xmax - xmin ))
 
-        # If the action is 0, we move the bounding box to the right.
-        if action == 0:
-            xmin += alpha_w
-            xmax += alpha_w
-        # If the action is 1, we move the bounding box to the left. 
-        elif action == 1:
-            xmin -= alpha_w
-            xmax -= alpha_w
-        # If the action is 2, we move the bounding box up.
-        elif action == 2:
-            ymin -= alpha_h
-            ymax -= alpha_h
-        # If the action is 3, we move the bounding box down.
-        elif action == 3:
-            ymin += alpha_h
-            ymax += alpha_h
-        # If the action is 4, we make the bounding box bigger.
-        elif action == 4:
-            ymin -= alpha_h
-            ymax += alpha_h
-            xmin -= alpha_w
-            xmax += alpha_w
-        # If the action is 5, we make the bounding box smaller.
-        elif action == 5:
-            ymin += alpha_h
-            ymax -= alpha_h
-            xmin += alpha_w
-            xmax -= alpha_w
-        # If the action is 6, we make the bounding box fatter.
-        elif action == 6:
-            ymin += alpha_h
-            ymax -= alpha_h
-        # If the action is 7, we make the bounding box taller.
-        elif action == 7:
-            xmin += alpha_w
-            xmax -= alpha_w
+        # Applying the action deltas table to the bounding box to retrieve the successor bounding boxes of all the actions.
+        bboxes = bbox + ACTION_DELTAS * np.array([alpha_w, alpha_h, alpha_w, alpha_h])
+
+        # Returning the bounding boxes, whilst ensuring that the bounding boxes are within the image dimensions.
+        return np.clip(bboxes, 0, [self.width, self.height, self.width, self.height])
 
-        # Returning the bounding box, whilst ensuring that the bounding box is within the image dimensions.
-        return [self.rewrap(xmin, self.width), self.rewrap(ymin, self.height), self.rewrap(xmax, self.width), self.rewrap(ymax, self.height)]
-    
     def get_actions(self):
         """
             Function that prints the name of the actions.
@@ -729,6 +1020,9 @@ class DetectionEnv(Env):
             Output:
                 - Information dictionary of the environment
         """
+        # Calculating the best IoU and recall of the current bounding box in a single pass
+        best_iou, best_recall = calculate_best_iou_recall([self.bbox], self.current_gt_bboxes)
+
         return {
             'target_bbox': self.target_bbox,
             'height': self.height,
@@ -745,8 +1039,8 @@ class DetectionEnv(Env):
             'bbox': self.bbox,
             'feature_extractor': self.feature_extractor,
             'transform': self.transform,
-            'iou': calculate_best_iou([self.bbox], self.current_gt_bboxes),
-            'recall': calculate_best_recall([self.bbox], self.current_gt_bboxes),
+            'iou': best_iou,
+            'recall': best_recall,
             'gt_bboxes': self.current_gt_bboxes,
             'threshold': self.threshold,
             'classification_dictionary': self.classification_dictionary,
@@ -799,8 +1093,8 @@ class DetectionEnv(Env):
                 - 'original_image': The original image to be used in the environment.
                 - 'target_bbox': The target bounding box to be used in the environment.
                 - 'target_gt_boxes': The target bounding boxes to be used in the environment.
-                - 'classifier': The CNN used to classify the image ROI in the environment.
-                - 'classifier_target_size': The size of the image that will be used as input to the classifier.
+                - 'classifier': The CNN used to classify the image ROI in the environment (or its name in the lazy model registry, e.g. 'resnet50v2'), replacing the classifier of the environment.
+                - 'classifier_target_size': The size of the image that will be used as input to the classifier, replacing the classifier target size of the environment.
                 
             Output:
                 - State and information of the environment
@@ -817,6 +1111,7 @@ class DetectionEnv(Env):
                 self.image = env_config['image']
                 self.height = self.image.shape[0]
                 self.width = self.image.shape[1]
+                self.current_img_name = None
                 del env_config['image']
             else:
                 # If the image is not in the environment configuration, then take the original image as the image was changed during the process.
@@ -859,23 +1154,31 @@ class DetectionEnv(Env):
         if self.use_sara:
             self.bbox = self.generate_initial_bbox()
 
-        # Classification part (Resetting the classification dictionary).
+        # Generating the SaRa proposals for multiple object episodes
+        self.proposals = self.generate_proposals()
+        self.visited_proposals = []
+
+        # Classification part (Resetting the classification dictionary and the feature maps of the triggered bounding boxes).
         self.classification_dictionary = {'label': [], 'confidence': [], 'bbox': [], 'color': []}
+        self.last_feature_map = None
+        self.last_feature_bbox = None
+        self.classification_features = []
+        self.pending_classification = None
+
+        # Running the callbacks of the batches that were already classified by the classification queue (without waiting for those in progress)
+        if self.classification_queue is not None:
+            self.classification_queue.resolve()
 
         # For Classification
-        # Initialising the classifier.
+        # Overriding the classifier (the classifier of the constructor is kept otherwise).
         if 'classifier' in env_config:
             self.classifier = env_config['classifier']
             del env_config['classifier']
-        else:
-            self.classifier = CLASSIFIER
 
-        # Initialising the classifier target size.
+        # Overriding the classifier target size (the classifier target size of the constructor is kept otherwise).
         if 'classifier_target_size' in env_config:
             self.classifier_target_size = env_config['classifier_target_size']
             del env_config['classifier_target_size']
-        else:
-            self.classifier_target_size = CLASSIFIER_TARGET_SIZE
 
         # Rendering part (resetting the window size, the window and the clock for rendering).
         if self.is_render:
@@ -902,9 +1205,30 @@ class DetectionEnv(Env):
             Output:
                 - Labels of the images
         """
+        # Classifying the bounding boxes from the feature maps of the feature extractor, if enabled
+        if self.shared_backbone_classification and hasattr(self.feature_extractor, 'classify_features'):
+            self.get_shared_backbone_labels()
+            return
+
         # Initialising an empty list to store the labels.
         images = []
 
+        # Queueing the bounding boxes for classification in a batch with those of other images, if a classification queue is used
+        if self.classification_queue is not None:
+            if self.classification_dictionary['bbox'] != []:
+                images = np.stack([cv2.resize(self.original_image[y1:y2, x1:x2], self.classifier_target_size) for x1, y1, x2, y2 in self.classification_dictionary['bbox']])
+                request = self.classification_queue.submit(images, partial(self.store_labels, self.classification_dictionary))
+                # Keeping the request only while its labels are not resolved (a synchronous queue may resolve it within submit)
+                self.pending_classification = None if request['resolved'] else request
+            return
+
+        # Constructing the classifier on first use, if it is given by name
+        self.classifier = get_model(self.classifier)
+
+        # Retrieving the preprocessing and decoding functions of the classifier (torch classifiers define their own, Keras classifiers use the module ones)
+        classifier_preprocess_input = getattr(self.classifier, 'preprocess_input', preprocess_input)
+        classifier_decode_predictions = getattr(self.classifier, 'decode_predictions', decode_predictions)
+
         # Iterating through the bounding boxes
         for bbox in self.classification_dictionary['bbox']:
             # Retrieving the bounding box coordinates.
@@ -917,7 +1241,7 @@ class DetectionEnv(Env):
             image = cv2.resize(image, self.classifier_target_size)
 
             # Preparing the image for the Classifier
-            image = preprocess_input(image)
+            image = classifier_preprocess_input(image)
 
             # Expanding the dimensions to match the model's expectations
             image = np.expand_dims(image, axis=0)
@@ -933,18 +1257,73 @@ class DetectionEnv(Env):
             # Predicting the classes
             preds = self.classifier.predict(images, verbose=0)
 
-            # Decoding the predictions
-            labels = decode_predictions(preds, top=1)
+            # Decoding the predictions (to the labels of the detection dataset, if a label mapping is used)
+            labels = decode_mapped_predictions(preds, self.label_mapping, top=1) if self.label_mapping is not None else classifier_decode_predictions(preds, top=1)
+
+            # Storing the labels in the classification dictionary
+            self.store_labels(self.classification_dictionary, [label[0] for label in labels])
+        pass
+
+    def store_labels(self, classification_dictionary, labels):
+        """
+            Function that stores the labels of the bounding boxes of an image in its classification dictionary (also called by the classification queue,
+            once the labels of an earlier image are resolved).
+
+            Args:
+                - Classification_dictionary: Classification dictionary of the image
+                - Labels: (Class index, class name, confidence) tuple of every bounding box
+        """
+        # Iterating through the labels of the bounding boxes
+        for label in labels:
+            # Storing the label, the confidence and the color of the bounding box in the classification dictionary.
+            classification_dictionary['label'].append(label[1])
+            classification_dictionary['confidence'].append(label[2])
+            classification_dictionary['color'].append(self.generate_random_color())
+        pass
+
+    def flush_classification(self):
+        """
+            Function that classifies all the bounding boxes waiting in the classification queue and resolves their labels (e.g. at the end of an evaluation).
+        """
+        if self.classification_queue is not None:
+            self.classification_queue.join()
+        pass
 
-            # Iterating through the predictions and the bounding boxes
-            for label, bbox in zip(labels, self.classification_dictionary['bbox']):
-                # Retrieving the Label and the confidence of the image.
-                label = label[0]
+    def get_shared_backbone_labels(self):
+        """
+            Function that labels the bounding boxes with the ImageNet head of the feature extractor, applied on the feature maps that were
+            already computed for their states (so the backbone is not run a second time per detection).
 
-                # Storing the label, the confidence and the bounding box of the image in the classification dictionary.
-                self.classification_dictionary['label'].append(label[1])
-                self.classification_dictionary['confidence'].append(label[2])
-                self.classification_dictionary['color'].append(self.generate_random_color())
+            Output:
+                - Labels of the images
+        """
+        # Ensuring that there are bounding boxes to classify
+        if self.classification_dictionary['bbox'] == []:
+            return
+
+        # Retrieving the feature maps of the bounding boxes
+        feature_maps = []
+        for index, bbox in enumerate(self.classification_dictionary['bbox']):
+            feature_map = self.classification_features[index] if index < len(self.classification_features) else None
+
+            # Computing the feature map if it was not stored (e.g. the bounding box was added without a state being computed for it)
+            if feature_map is None:
+                x1, y1, x2, y2 = bbox
+                image = self.original_image[y1:y2, x1:x2]
+                if image.size == 0:
+                    image = self.original_image
+                self.get_features(image)
+                feature_map = self.last_feature_map
+
+            feature_maps.append(feature_map)
+
+        # Predicting the classes of all the bounding boxes in a single batch (the feature maps share the target size of the feature extractor)
+        with torch.no_grad():
+            preds = F.softmax(self.feature_extractor.classify_features(torch.cat(feature_maps, dim=0)), dim=1).cpu().numpy()
+
+        # Decoding the predictions (to the labels of the detection dataset, if a label mapping is used) and storing the labels in the classification dictionary
+        labels = decode_mapped_predictions(preds, self.label_mapping, top=1) if self.label_mapping is not None else self.feature_extractor.decode_predictions(preds, top=1)
+        self.store_labels(self.classification_dictionary, [label[0] for label in labels])
         pass
     
     def predict(self, do_display=True, do_save=False, save_path=None):
@@ -959,6 +1338,9 @@ class DetectionEnv(Env):
             Output:
                 - Image
         """
+        # Resolving the labels which are still waiting in the classification queue.
+        self.flush_classification()
+
         # Displaying the image.
         image = self.display(mode='detection', do_display=do_display, text_display=True)
         
@@ -996,8 +1378,18 @@ class DetectionEnv(Env):
         # Adding the current bounding box to the classification dictionary
         self.classification_dictionary['bbox'].append(self.bbox)
 
-        # Resetting bounding box to start from either of the corners and instead of having the whole image size, it will have a 75% of the image size
-        if self.env_mode == TEST_MODE: # Testing mode
+        # Storing the feature map of the current bounding box for the shared backbone classification (None if the state was not computed for it)
+        if self.shared_backbone_classification:
+            self.classification_features.append(self.last_feature_map if self.last_feature_bbox == list(self.bbox) else None)
+
+        # Retrieving the next unvisited SaRa proposal (None if there are no proposals left)
+        proposal_index = self.next_proposal()
+
+        # Resetting bounding box to start from the next SaRa proposal, or else from either of the corners and instead of having the whole image size, it will have a 75% of the image size
+        if self.env_mode == TEST_MODE and proposal_index is not None: # Testing mode (SaRa proposals)
+            self.visited_proposals.append(proposal_index)
+            self.bbox = list(self.proposals[proposal_index])
+        elif self.env_mode == TEST_MODE: # Testing mode
             if self.no_of_triggers % 4 == 0:
                 self.bbox = [0, 0, int(self.width*0.75), int(self.height*0.75)]
             elif self.no_of_triggers % 4 == 1:
@@ -1018,12 +1410,20 @@ class DetectionEnv(Env):
             bbox4 = [int(self.width*0.25), int(self.height*0.25), self.width, self.height]
             start_boxes = [bbox1, bbox2, bbox3, bbox4]
 
-            # Retrieving the best IoU from the four bounding boxes and setting the bounding box to the current initial bounding box
-            ious = [iou(bbox1, self.target_bbox), iou(bbox2, self.target_bbox), iou(bbox3, self.target_bbox), iou(bbox4, self.target_bbox)]
+            # Adding the unvisited SaRa proposals to the starting bounding boxes
+            proposal_indices = [i for i in range(len(self.proposals)) if i not in self.visited_proposals]
+            start_boxes += [list(self.proposals[i]) for i in proposal_indices]
+
+            # Retrieving the best IoU from the starting bounding boxes and setting the bounding box to the current initial bounding box
+            ious = iou_matrix(start_boxes, [self.target_bbox])[:, 0]
 
             # Finding the argmax of the IoUs
             best_iou_index = np.argmax(ious)
 
+            # Marking the proposal as visited if it was selected
+            if best_iou_index >= 4:
+                self.visited_proposals.append(proposal_indices[best_iou_index - 4])
+
             # Setting the bounding box to the best bounding box
             self.bbox = start_boxes[best_iou_index]
 
@@ -1031,6 +1431,42 @@ class DetectionEnv(Env):
         self.no_of_triggers += 1
         pass
         
+    def generate_proposals(self, threshold=0.3):
+        """
+            Function that generates the ranked SaRa proposals from which successive searches start in multiple object episodes.
+
+            Args:
+                - Threshold: Threshold for the Saliency Ranking algorithm
+
+            Output:
+                - SaRa proposals (empty if SaRa is not used, the environment uses a single object or no proposals are requested)
+        """
+        if not self.use_sara or self.obj_configuration != MULTI_OBJ or self.sara_proposals <= 0:
+            return []
+
+        # SaRa proposals (cached per dataset image, as they only depend on the image)
+        return self.saliency_cache.get_proposals(self.current_img_name, self.image, self.get_grid_size(), generator, rate=threshold, max_proposals=self.sara_proposals)
+
+    def next_proposal(self):
+        """
+            Function that retrieves the next SaRa proposal to start a search from, skipping the visited proposals and the ones already covered by an IoR (Inhibition of Return) cross.
+
+            Output:
+                - Index of the next proposal, or None if there are no proposals left
+        """
+        # Iterating through the proposals in their rank order
+        for i, (x1, y1, x2, y2) in enumerate(self.proposals):
+            if i in self.visited_proposals:
+                continue
+
+            # Checking whether the proposal already contains the centre of an IoR cross, i.e. of a bounding box which was already triggered
+            if any(x1 <= (bx1 + bx2) // 2 < x2 and y1 <= (by1 + by2) // 2 < y2 for bx1, by1, bx2, by2 in self.classification_dictionary['bbox']):
+                self.visited_proposals.append(i)
+                continue
+
+            return i
+        return None
+
     def draw_ior_cross(self, image, bbox, color=(0, 0, 0)):
         """
             Function that draws an IoR (Inhibition of Return) cross on the image based on the current bounding box.
@@ -1137,7 +1573,7 @@ class DetectionEnv(Env):
                 self.restart_and_change_state()
 
             # For classification, retrieve the labels if the classification dictionary is empty
-            if self.allow_classification and self.classification_dictionary['label']==[]:
+            if self.allow_classification and self.classification_dictionary['label']==[] and self.pending_classification is None:
                 self.get_labels()
             self.filter_bboxes() # Saving to evaluation results
 
@@ -1576,6 +2012,9 @@ class DetectionEnv(Env):
         # Resetting the segmentation dictionary
         self.segmentation_dictionary = {'names': [], 'masks': [], 'bboxes': [], 'labels': [], 'colors': []}
 
+        # Calculating the Itti Saliency Map once for all the objects, as it only depends on the image
+        saliency_map_itti = self.saliency_cache.get_saliency(self.current_img_name, self.original_image.copy(), generator=generator)
+
         # Iterating through the classification dictionary
         for label_idx in range(len(self.classification_dictionary['label'])):
             # Extracting the information from the classification dictionary
@@ -1625,13 +2064,7 @@ class DetectionEnv(Env):
             for _ in range(4):
                 mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
 
-            # Creating a filled polygon annotation for the object mask on a copy of the original image.
-            image_copy = self.original_image.copy()       
-
-            # SaRa algorithm
-            sara.reset()
-            # Calculating Itti Saliency Map
-            saliency_map_itti = sara.return_saliency(image_copy.copy(), generator=generator)
+            # Converting the Itti Saliency Map
             saliency_map_rgb_itti = cv2.cvtColor(saliency_map_itti, cv2.COLOR_BGR2RGB)
             saliency_map_gray_itti = cv2.cvtColor(saliency_map_rgb_itti, cv2.COLOR_RGB2GRAY)
 
@@ -1971,7 +2404,9 @@ class DetectionEnv(Env):
             # Iterating through the objects to retrieve the object bounding box and size for every class
             for c_object in range(len(target['annotation']['object'])):
                 classe = target['annotation']['object'][c_object]["name"]
-                org[classe].append([target['annotation']['object'][c_object]["bndbox"], target['annotation']['size']])
+                # Storing the difficult flag alongside the bounding box, so that difficult objects can be ignored during evaluation
+                bndbox = dict(target['annotation']['object'][c_object]["bndbox"], difficult=target['annotation']['object'][c_object].get("difficult", "0"))
+                org[classe].append([bndbox, target['annotation']['size']])
             
             # Iterating through the classes
             for c_class in self.classes:
@@ -2008,6 +2443,7 @@ class DetectionEnv(Env):
 
         # Extracting the image information
         img_information = extracted_imgs_per_class[img_name][0]
+        self.current_img_name = img_name
 
         # Extracting the image
         self.image = img_information[0]
@@ -2029,6 +2465,9 @@ class DetectionEnv(Env):
         # Removing odd indices from the list which correspond to the width and height of the image
         gt_bboxes_dict = [gt_bboxes_dict[i] for i in range(len(gt_bboxes_dict)) if i % 2 == 0]
 
+        # Extracting the difficult flags of the ground truth bounding boxes
+        self.current_gt_difficult = [bool(int(gt_bbox_dict.get('difficult', 0))) for gt_bbox_dict in gt_bboxes_dict]
+
         # For each entry in the list, which is a dictionary, we change it in the form of [x1, y1, x2, y2]
         for i in range(len(gt_bboxes_dict)):
             gt_bboxes_dict[i] = [int(gt_bboxes_dict[i]['xmin']), int(gt_bboxes_dict[i]['ymin']), int(gt_bboxes_dict[i]['xmax']), int(gt_bboxes_dict[i]['ymax'])]
@@ -2045,7 +2484,12 @@ class DetectionEnv(Env):
         # For Evaluation, appending the ground truth bounding boxes to the evaluation results
         if self.env_mode == TEST_MODE: # Testing mode
             # Appending the ground truth bounding boxes to the evaluation results
-            self.evaluation_results['gt_boxes'][img_name] = self.current_gt_bboxes
+            if self.store_evaluation_boxes:
+                self.evaluation_results['gt_boxes'][img_name] = self.current_gt_bboxes
+                self.evaluation_results['difficult'][img_name] = self.current_gt_difficult
+
+            # Updating the streaming metrics with the ground truth bounding boxes of the image
+            self.metrics_accumulator.update(self.current_class, img_name, self.current_gt_bboxes, difficult=self.current_gt_difficult)
         pass
 
     def save_evaluation_results(self, path='evaluation_results'):
@@ -2084,11 +2528,71 @@ class DetectionEnv(Env):
 
             # Appending the bounding boxes to the evaluation results
             # In this case no regression or cascading is done, and all bounding boxes are accepted
-            self.evaluation_results['bounding_boxes'][img_name] = self.classification_dictionary['bbox']
-            self.evaluation_results['labels'][img_name] = self.classification_dictionary['label']
-            self.evaluation_results['confidences'][img_name] = self.classification_dictionary['confidence']
+            if self.store_evaluation_boxes:
+                self.evaluation_results['bounding_boxes'][img_name] = self.classification_dictionary['bbox']
+                self.evaluation_results['labels'][img_name] = self.classification_dictionary['label']
+                self.evaluation_results['confidences'][img_name] = self.classification_dictionary['confidence']
+
+            # Updating the streaming metrics with the bounding boxes of the image, as the episode has finished
+            update_metrics = partial(self.metrics_accumulator.update, self.current_class, img_name, self.current_gt_bboxes, self.classification_dictionary['bbox'],
+                                     self.classification_dictionary['confidence'], self.current_gt_difficult)
+
+            # Deferring the update until the confidences are resolved, if the labels are still waiting in the classification queue
+            if self.pending_classification is not None and not self.pending_classification['resolved']:
+                self.pending_classification['callbacks'].append(lambda labels: update_metrics())
+            else:
+                update_metrics()
         pass
         
+    def sample_calibration_crops(self, num_crops=CALIBRATION_CROPS, seed=0):
+        """
+            Function that samples random crops of the dataset images (or of the current image, if no dataset is used), with sizes ranging from a quarter
+            to the whole image as the bounding boxes of the episodes do, for calibrating a quantised feature extractor.
+
+            Args:
+                - Num_crops: Number of crops
+                - Seed: Seed of the sampled crops
+
+            Output:
+                - List of crops
+        """
+        rng = np.random.default_rng(seed)
+        crops = []
+
+        for _ in range(num_crops):
+            # Sampling an image of a random class from the dataset, or using the current image
+            if self.use_dataset is not None:
+                images_per_class = self.dataset[self.classes[rng.integers(len(self.classes))]]
+                if len(images_per_class) == 0:
+                    continue
+                img_name = list(images_per_class.keys())[rng.integers(len(images_per_class))]
+                image = np.array(images_per_class[img_name][0][0])
+            else:
+                image = self.original_image
+
+            # Sampling a bounding box covering between a quarter and the whole of every side of the image
+            height, width = image.shape[:2]
+            crop_width, crop_height = int(width * rng.uniform(0.25, 1.0)), int(height * rng.uniform(0.25, 1.0))
+            x1, y1 = int(rng.integers(0, width - crop_width + 1)), int(rng.integers(0, height - crop_height + 1))
+            crops.append(image[y1:y1 + crop_height, x1:x1 + crop_width])
+
+        # Returning the crops
+        return crops
+
+    def get_grid_size(self):
+        """
+            Function that retrieves the grid size of the SaRa algorithm for the current image.
+
+            Output:
+                - Grid size (selected from the SaRa grid pyramid based on the scale of the salient object if the grid size is 'auto')
+        """
+        if self.grid_size != 'auto':
+            return self.grid_size
+
+        # Selecting the grid size from the (cached) saliency map of the image
+        saliency_map = self.saliency_cache.get_saliency(self.current_img_name, self.image, generator)
+        return sara.select_grid_size(saliency_map)
+
     def generate_initial_bbox(self, threshold=0.3, iterations=1):
         """
             Function that generates an initial bounding box prediction based on Saliency Ranking.
@@ -2100,17 +2604,15 @@ class DetectionEnv(Env):
             Output:
                 - Initial bounding box prediction
         """
-        # Resetting the SaRa algorithm
-        sara.reset()
-
         # Creating a copy of the original image
         image = self.image.copy()
 
-        # SaRa algorithm
-        sara_info = sara.return_sara(image, GRID_SIZE, generator, mode=2)
+        # SaRa algorithm (cached per dataset image, as it only depends on the image), computing the ranking only since the heatmap is not needed for the bounding box
+        grid_size = self.get_grid_size()
+        sara_info = self.saliency_cache.get_sara(self.current_img_name, image, grid_size, generator, mode=2, render=False)[:2]
 
         # Calculating the most important ranks to retain for the initial bounding box prediction based on the threshold and the number of iterations
-        _ , _, sara_bbox = sara.sara_resize(self.image.copy(), sara_info, GRID_SIZE, rate=threshold, iterations=iterations)
+        _ , _, sara_bbox = sara.sara_resize(self.image.copy(), sara_info, grid_size, rate=threshold, iterations=iterations)
 
         # Returning the initial bounding box prediction
         return sara_bbox
@@ -2122,16 +2624,14 @@ class DetectionEnv(Env):
             Args:
                 - Threshold: Threshold for the Saliency Ranking algorithm
         """
-        # Resetting the SaRa algorithm
-        sara.reset()
-        
         # Creating a copy of the original image
         image = self.image.copy()
 
-        # SaRa algorithm
-        sara_info = sara.return_sara(image, GRID_SIZE, generator, mode=1)
+        # SaRa algorithm (cached per dataset image, as it only depends on the image)
+        grid_size = self.get_grid_size()
+        sara_info = self.saliency_cache.get_sara(self.current_img_name, image, grid_size, generator, mode=1)[:2]
 
         # Plotting a 3D graph of the Saliency Ranking algorithm
-        sara.plot_3D(self.image.copy(), sara_info, GRID_SIZE, rate=threshold)
+        sara.plot_3D(self.image.copy(), sara_info, grid_size, rate=threshold)
         
         return sara_info
\ No newline at end of file
@@ -0,0 +1,206 @@
+#-------------------------------------------------------------------------------
+# Name:        label_mapping.py
+# Purpose:     Mapping the ImageNet predictions of the classifiers to the labels of the detection datasets (PASCAL VOC and COCO).
+#
+# Author:      Matthias Bartolo <matthias.bartolo@ieee.org>
+#
+# Created:     February 24, 2024
+# Copyright:   (c) Matthias Bartolo 2024-
+# Licence:     All rights reserved
+#-------------------------------------------------------------------------------
+import numpy as np
+
+"""
+    Defining the number of ImageNet classes predicted by the classifiers.
+"""
+IMAGENET_CLASSES = 1000
+
+
+"""
+    Defining the PASCAL VOC classes, together with the ImageNet class indices which belong to every class.
+"""
+VOC_CLASSES = ['aeroplane', 'bicycle', 'bird', 'boat', 'bottle', 'bus', 'car', 'cat', 'chair', 'cow', 'diningtable', 'dog', 'horse', 'motorbike', 'person',
+               'pottedplant', 'sheep', 'sofa', 'train', 'tvmonitor']
+
+IMAGENET_TO_VOC = {
+    'aeroplane': [404, 895, 908],
+    'bicycle': [444, 671],
+    'bird': list(range(7, 25)) + list(range(80, 101)) + list(range(127, 147)),
+    'boat': [403, 472, 484, 510, 554, 576, 625, 628, 724, 780, 814, 833, 871, 914],
+    'bottle': [440, 720, 737, 898, 907],
+    'bus': [654, 779, 874],
+    'car': [407, 436, 468, 511, 609, 627, 656, 661, 717, 734, 751, 817],
+    'cat': list(range(281, 286)),
+    'chair': [423, 559, 765, 857],
+    'cow': [345, 346],
+    'diningtable': [532],
+    'dog': list(range(151, 269)),
+    'horse': [339],
+    'motorbike': [665, 670],
+    'person': [981, 982, 983],
+    'pottedplant': [738],
+    'sheep': [348],
+    'sofa': [831],
+    'train': [466, 547, 565, 705, 820, 829],
+    'tvmonitor': [527, 664, 782, 851],
+}
+
+
+"""
+    Defining the COCO classes, together with the ImageNet class indices which belong to every class (the COCO classes without an ImageNet
+    counterpart, e.g. giraffe or toothbrush, are never predicted).
+"""
+COCO_CLASSES = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat', 'traffic light', 'fire hydrant', 'stop sign',
+                'parking meter', 'bench', 'bird', 'cat', 'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe', 'backpack', 'umbrella',
+                'handbag', 'tie', 'suitcase', 'frisbee', 'skis', 'snowboard', 'sports ball', 'kite', 'baseball bat', 'baseball glove', 'skateboard',
+                'surfboard', 'tennis racket', 'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich', 'orange',
+                'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch', 'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop',
+                'mouse', 'remote', 'keyboard', 'cell phone', 'microwave', 'oven', 'toaster', 'sink', 'refrigerator', 'book', 'clock', 'vase', 'scissors',
+                'teddy bear', 'hair drier', 'toothbrush']
+
+IMAGENET_TO_COCO = {
+    'person': IMAGENET_TO_VOC['person'],
+    'bicycle': IMAGENET_TO_VOC['bicycle'],
+    'car': [407, 436, 468, 511, 609, 627, 656, 661, 751, 817],
+    'motorcycle': IMAGENET_TO_VOC['motorbike'],
+    'airplane': IMAGENET_TO_VOC['aeroplane'],
+    'bus': IMAGENET_TO_VOC['bus'],
+    'train': IMAGENET_TO_VOC['train'],
+    'truck': [555, 569, 675, 717, 734],
+    'boat': IMAGENET_TO_VOC['boat'],
+    'traffic light': [920],
+    'parking meter': [704],
+    'bench': [703],
+    'bird': IMAGENET_TO_VOC['bird'],
+    'cat': IMAGENET_TO_VOC['cat'],
+    'dog': IMAGENET_TO_VOC['dog'],
+    'horse': IMAGENET_TO_VOC['horse'],
+    'sheep': IMAGENET_TO_VOC['sheep'],
+    'cow': IMAGENET_TO_VOC['cow'],
+    'elephant': [101, 385, 386],
+    'bear': [294, 295, 296, 297],
+    'zebra': [340],
+    'backpack': [414],
+    'umbrella': [879],
+    'handbag': [748],
+    'tie': [457, 906],
+    'skis': [795],
+    'sports ball': [429, 430, 574, 768, 805, 852, 890],
+    'tennis racket': [752],
+    'bottle': IMAGENET_TO_VOC['bottle'],
+    'cup': [504, 968],
+    'knife': [499],
+    'spoon': [910],
+    'bowl': [659, 809],
+    'banana': [954],
+    'apple': [948],
+    'orange': [950],
+    'broccoli': [937],
+    'hot dog': [934],
+    'pizza': [963],
+    'chair': IMAGENET_TO_VOC['chair'],
+    'couch': IMAGENET_TO_VOC['sofa'],
+    'potted plant': IMAGENET_TO_VOC['pottedplant'],
+    'bed': [520, 564],
+    'dining table': IMAGENET_TO_VOC['diningtable'],
+    'toilet': [861],
+    'tv': [664, 782, 851],
+    'laptop': [620],
+    'mouse': [673],
+    'remote': [761],
+    'keyboard': [508],
+    'cell phone': [487],
+    'microwave': [651],
+    'toaster': [859],
+    'sink': [896],
+    'refrigerator': [760],
+    'book': [921],
+    'clock': [409, 530, 892],
+    'vase': [883],
+    'teddy bear': [850],
+    'hair drier': [589],
+}
+
+
+"""
+    Defining the label mappings by dataset name (class names and ImageNet class indices per class).
+"""
+LABEL_MAPPINGS = {
+    'voc': (VOC_CLASSES, IMAGENET_TO_VOC),
+    'coco': (COCO_CLASSES, IMAGENET_TO_COCO),
+}
+
+# The aggregation matrices built so far, by dataset name
+_mapping_matrices = {}
+
+
+def mapping_matrix(dataset='voc'):
+    """
+        Retrieving the aggregation matrix of a label mapping, which sums the ImageNet probabilities of the classes belonging to every dataset class.
+
+        Args:
+            dataset: The name of the label mapping ('voc' or 'coco').
+
+        Returns:
+            The class names of the dataset, and the aggregation matrix (1000 x number of dataset classes), built once per process.
+    """
+    if dataset not in LABEL_MAPPINGS:
+        raise ValueError('Unknown label mapping ' + str(dataset) + ', possible label mappings are: ' + str(list(LABEL_MAPPINGS.keys())))
+
+    if dataset not in _mapping_matrices:
+        classes, mapping = LABEL_MAPPINGS[dataset]
+        matrix = np.zeros((IMAGENET_CLASSES, len(classes)), dtype=np.float32)
+        for class_index, class_name in enumerate(classes):
+            matrix[mapping.get(class_name, []), class_index] = 1.0
+        _mapping_matrices[dataset] = (classes, matrix)
+
+    return _mapping_matrices[dataset]
+
+
+def map_predictions(preds, dataset='voc', top=1, from_logits=False):
+    """
+        Reducing ImageNet predictions to the top-k classes of a detection dataset, for all the predictions at once.
+
+        Args:
+            preds: The ImageNet class probabilities (or logits) (batch x 1000).
+            dataset: The name of the label mapping ('voc' or 'coco').
+            top: The number of top dataset classes to return.
+            from_logits: Whether the predictions are logits, to which a softmax is applied first.
+
+        Returns:
+            The indices (batch x top) and scores (batch x top) of the top dataset classes, by decreasing score, and the class names of the dataset.
+    """
+    classes, matrix = mapping_matrix(dataset)
+    preds = np.asarray(preds, dtype=np.float32)
+
+    # Converting the logits to probabilities
+    if from_logits:
+        preds = np.exp(preds - preds.max(axis=1, keepdims=True))
+        preds /= preds.sum(axis=1, keepdims=True)
+
+    # Summing the probabilities of the ImageNet classes of every dataset class
+    scores = preds @ matrix
+
+    # Selecting the top classes, and ranking only those
+    top = min(top, len(classes))
+    indices = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1), classes
+
+
+def decode_mapped_predictions(preds, dataset='voc', top=1, from_logits=False):
+    """
+        Decoding ImageNet predictions to the labels of a detection dataset, in the same format as the Keras decode_predictions function.
+
+        Args:
+            preds: The ImageNet class probabilities (or logits) (batch x 1000).
+            dataset: The name of the label mapping ('voc' or 'coco').
+            top: The number of top dataset classes to return.
+            from_logits: Whether the predictions are logits.
+
+        Returns:
+            A list of (class index, class name, score) tuples per prediction, where the class index is that of the dataset class.
+    """
+    indices, scores, classes = map_predictions(preds, dataset, top, from_logits)
+    return [[(int(i), classes[i], float(s)) for i, s in zip(row_indices, row_scores)] for row_indices, row_scores in zip(indices, scores)]
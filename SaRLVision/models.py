@@ -9,21 +9,22 @@
 # Licence:     All rights reserved
 #-------------------------------------------------------------------------------
 import math
+import numpy as np
 import torch
 import torch.nn as nn
 from torch.nn.init import  uniform_
 import torch.nn.functional as F
 import torchvision
 import torchvision.transforms as transforms
+import copy
+import importlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from torchvision.models import vgg16, VGG16_Weights, resnet50, ResNet50_Weights, mobilenet_v2, MobileNet_V2_Weights
-from keras.applications.vgg16 import VGG16, decode_predictions, preprocess_input
-from keras.applications.resnet_v2 import ResNet50V2, decode_predictions, preprocess_input
-from keras.applications.mobilenet_v2 import MobileNetV2, decode_predictions, preprocess_input
-from keras.applications.efficientnet_v2 import EfficientNetV2B3, decode_predictions, preprocess_input
-from keras.applications.xception import Xception, decode_predictions, preprocess_input
-from keras.applications.inception_v3 import InceptionV3, decode_predictions, preprocess_input
+from torchvision.models import resnet18, ResNet18_Weights, shufflenet_v2_x1_0, ShuffleNet_V2_X1_0_Weights, efficientnet_b0, EfficientNet_B0_Weights
 
 from SaRLVision.utils import device
+from SaRLVision.label_mapping import decode_mapped_predictions
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -34,60 +35,482 @@ warnings.filterwarnings("ignore")
 VGG16_TARGET_SIZE = (224, 224)
 RESNET50_TARGET_SIZE = (224, 224)
 MOBILENETV2_TARGET_SIZE = (224, 224)
+RESNET18_TARGET_SIZE = (224, 224)
+SHUFFLENETV2_TARGET_SIZE = (224, 224)
+EFFICIENTNETB0_TARGET_SIZE = (224, 224)
 EFFICIENTNETV2_TARGET_SIZE = (300, 300)
 XCEPTION_TARGET_SIZE = (299, 299)
 INCEPTIONV3_TARGET_SIZE = (299, 299)
 
 
+"""
+    Keras applications (classifiers), which are only imported on first use since importing Keras loads its whole backend.
+    Every name is defined in this module as a function which imports its application when it is called, so the names are still exported by star imports
+    (e.g. from SaRLVision.models import *; ResNet50V2()) without importing Keras.
+"""
+KERAS_APPLICATIONS = {
+    'VGG16': 'keras.applications.vgg16',
+    'ResNet50V2': 'keras.applications.resnet_v2',
+    'MobileNetV2': 'keras.applications.mobilenet_v2',
+    'EfficientNetV2B3': 'keras.applications.efficientnet_v2',
+    'Xception': 'keras.applications.xception',
+    'InceptionV3': 'keras.applications.inception_v3',
+}
+
+
+def _lazy_keras_application(name):
+    """
+        Creating the function of a Keras application which imports the application only when it is called.
+
+        Args:
+            name: The name of the Keras application (a key of KERAS_APPLICATIONS).
+
+        Returns:
+            The function, which takes the arguments of the Keras application and returns its model.
+    """
+    def application(*args, **kwargs):
+        return getattr(importlib.import_module(KERAS_APPLICATIONS[name]), name)(*args, **kwargs)
+    application.__name__ = application.__qualname__ = name
+    return application
+
+
+# Defining the Keras applications as module attributes (e.g. ResNet50V2, VGG16), so that star imports export them
+globals().update({name: _lazy_keras_application(name) for name in KERAS_APPLICATIONS})
+
+
+def preprocess_input(x):
+    """
+        Preparing the input of the Keras classifiers (scaling the pixels between -1 and 1, as the ResNet50V2 classifier expects).
+
+        Args:
+            x: The input image (or batch of images).
+
+        Returns:
+            The preprocessed input.
+    """
+    return importlib.import_module('keras.applications.resnet_v2').preprocess_input(x)
+
+
+def decode_predictions(preds, top=5):
+    """
+        Decoding the ImageNet predictions of the Keras classifiers.
+
+        Args:
+            preds: The predictions of the classifier.
+            top: The number of top predictions to return.
+
+        Returns:
+            A list of (class id, class name, score) tuples per prediction.
+    """
+    return importlib.import_module('keras.applications.resnet_v2').decode_predictions(preds, top=top)
+
+
+def decode_imagenet_predictions(preds, categories, top=5):
+    """
+        Decoding ImageNet class probabilities, as the Keras decode_predictions function does.
+
+        Args:
+            preds: The class probabilities (batch x 1000).
+            categories: The ImageNet class names.
+            top: The number of top predictions to return.
+
+        Returns:
+            A list of (class index, class name, score) tuples per prediction.
+    """
+    results = []
+    for pred in preds:
+        top_indices = np.argsort(pred)[::-1][:top]
+        results.append([(int(i), categories[i], float(pred[i])) for i in top_indices])
+    return results
+
+
+"""
+    Base Feature Extractor, which exposes the feature map before the global average pooling and the ImageNet head of the pretrained model,
+    so that the features of a region of interest can also be classified without a second backbone pass.
+
+    Feature extractors with an ImageNet head define classify_features(feature_map), which maps a feature map (as returned by forward_features) to the
+    ImageNet logits (batch x 1000); feature extractors without one leave it undefined, so that the environment falls back to its classifier.
+"""
+class FeatureExtractor(nn.Module):
+    def forward_features(self, x):# Forwarding the input through the feature extraction part of the model, without pooling
+        return self.features(x)
+
+    def forward(self, x):# Forwarding the input through the model
+        x = self.forward_features(x)  # Applying the feature extraction part of the model
+        x = self.pooling(x)  # Applying the global average pooling
+        return x
+
+    def decode_predictions(self, preds, top=5):
+        """
+            Decoding the ImageNet class probabilities of classify_features.
+        """
+        return decode_imagenet_predictions(preds, self.categories, top=top)
+
+
 """
     VGG16 Feature Extractor (Feature Learning Model).
 """
-class VGG16FeatureExtractor(nn.Module):
+class VGG16FeatureExtractor(FeatureExtractor):
     def __init__(self):
         super(VGG16FeatureExtractor, self).__init__()
         self.vgg16_model = vgg16(weights=VGG16_Weights.DEFAULT).to(device) # Loading the pretrained model
         self.vgg16_model.eval() # Setting the model in evaluation mode to not do dropout.
         self.features = self.vgg16_model.features  # Retrieving the feature extraction part of the model
         self.pooling = nn.AdaptiveAvgPool2d((1, 1))  # Adding a global average pooling layer
+        self.categories = [category.replace(' ', '_') for category in VGG16_Weights.DEFAULT.meta['categories']] # ImageNet class names
 
-    def forward(self, x):# Forwarding the input through the model
-        x = self.features(x)  # Applying the feature extraction part of the model
-        x = self.pooling(x)  # Applying the global average pooling
-        return x
+    def classify_features(self, feature_map):# Applying the pooling and the fully connected layers of the model
+        return self.vgg16_model.classifier(torch.flatten(self.vgg16_model.avgpool(feature_map), 1))
     
     
 """
     ResNet50 Feature Extractor (Feature Learning Model).
 """
-class ResNet50FeatureExtractor(nn.Module):
+class ResNet50FeatureExtractor(FeatureExtractor):
     def __init__(self):
         super(ResNet50FeatureExtractor, self).__init__()
         self.resnet50_model = resnet50(weights=ResNet50_Weights.DEFAULT).to(device) # Loading the pretrained model
         self.resnet50_model.eval() # Setting the model in evaluation mode to not do dropout.
         self.features = nn.Sequential(*list(self.resnet50_model.children())[:-2])# Retrieving the image feature extraction part of the model (excluding the last two layers which are the average pooling and the fully connected layer)
         self.pooling = nn.AdaptiveAvgPool2d((1, 1))  # Adding a global average pooling layer
+        self.categories = [category.replace(' ', '_') for category in ResNet50_Weights.DEFAULT.meta['categories']] # ImageNet class names
 
-    def forward(self, x):# Forwarding the input through the model
-        x = self.features(x) # Applying the image feature extraction part of the model
-        x = self.pooling(x)
-        return x
+    def classify_features(self, feature_map):# Applying the average pooling and the fully connected layer of the model
+        return self.resnet50_model.fc(torch.flatten(self.resnet50_model.avgpool(feature_map), 1))
     
     
 """
     MobileNetV2 Feature Extractor (Feature Learning Model).
 """
-class MobileNetV2FeatureExtractor(nn.Module):
+class MobileNetV2FeatureExtractor(FeatureExtractor):
     def __init__(self):
         super(MobileNetV2FeatureExtractor, self).__init__()
         self.mobilenetv2 = mobilenet_v2(pretrained=True).to(device) # Loading the pretrained model
         self.mobilenetv2.eval() # Setting the model in evaluation mode to not do dropout.
         self.features = self.mobilenetv2.features  # Retrieving the feature extraction part of the model
         self.pooling = nn.AdaptiveAvgPool2d((1, 1))  # Adding a global average pooling layer
+        self.categories = [category.replace(' ', '_') for category in MobileNet_V2_Weights.DEFAULT.meta['categories']] # ImageNet class names
+
+    def classify_features(self, feature_map):# Applying the global average pooling and the classifier of the model
+        return self.mobilenetv2.classifier(torch.flatten(F.adaptive_avg_pool2d(feature_map, (1, 1)), 1))
+
+    
+    
+"""
+    ResNet18 Feature Extractor (Lightweight Feature Learning Model).
+"""
+class ResNet18FeatureExtractor(FeatureExtractor):
+    def __init__(self):
+        super(ResNet18FeatureExtractor, self).__init__()
+        self.resnet18_model = resnet18(weights=ResNet18_Weights.DEFAULT).to(device) # Loading the pretrained model
+        self.resnet18_model.eval() # Setting the model in evaluation mode.
+        self.features = nn.Sequential(*list(self.resnet18_model.children())[:-2]) # Retrieving the image feature extraction part of the model (excluding the average pooling and the fully connected layer)
+        self.pooling = nn.AdaptiveAvgPool2d((1, 1))  # Adding a global average pooling layer
+        self.categories = [category.replace(' ', '_') for category in ResNet18_Weights.DEFAULT.meta['categories']] # ImageNet class names
+
+    def classify_features(self, feature_map):# Applying the average pooling and the fully connected layer of the model
+        return self.resnet18_model.fc(torch.flatten(self.resnet18_model.avgpool(feature_map), 1))
+    
+    
+"""
+    ShuffleNetV2 Feature Extractor (Lightweight Feature Learning Model).
+"""
+class ShuffleNetV2FeatureExtractor(FeatureExtractor):
+    def __init__(self):
+        super(ShuffleNetV2FeatureExtractor, self).__init__()
+        self.shufflenetv2 = shufflenet_v2_x1_0(weights=ShuffleNet_V2_X1_0_Weights.DEFAULT).to(device) # Loading the pretrained model
+        self.shufflenetv2.eval() # Setting the model in evaluation mode.
+        self.features = nn.Sequential(self.shufflenetv2.conv1, self.shufflenetv2.maxpool, self.shufflenetv2.stage2, self.shufflenetv2.stage3,
+                                      self.shufflenetv2.stage4, self.shufflenetv2.conv5) # Retrieving the feature extraction part of the model (excluding the fully connected layer)
+        self.pooling = nn.AdaptiveAvgPool2d((1, 1))  # Adding a global average pooling layer
+        self.categories = [category.replace(' ', '_') for category in ShuffleNet_V2_X1_0_Weights.DEFAULT.meta['categories']] # ImageNet class names
+
+    def classify_features(self, feature_map):# Applying the global average pooling and the fully connected layer of the model
+        return self.shufflenetv2.fc(feature_map.mean([2, 3]))
+    
+    
+"""
+    EfficientNetB0 Feature Extractor (Lightweight Feature Learning Model).
+"""
+class EfficientNetB0FeatureExtractor(FeatureExtractor):
+    def __init__(self):
+        super(EfficientNetB0FeatureExtractor, self).__init__()
+        self.efficientnetb0 = efficientnet_b0(weights=EfficientNet_B0_Weights.DEFAULT).to(device) # Loading the pretrained model
+        self.efficientnetb0.eval() # Setting the model in evaluation mode to not do dropout.
+        self.features = self.efficientnetb0.features  # Retrieving the feature extraction part of the model
+        self.pooling = nn.AdaptiveAvgPool2d((1, 1))  # Adding a global average pooling layer
+        self.categories = [category.replace(' ', '_') for category in EfficientNet_B0_Weights.DEFAULT.meta['categories']] # ImageNet class names
+
+    def classify_features(self, feature_map):# Applying the average pooling and the classifier of the model
+        return self.efficientnetb0.classifier(torch.flatten(self.efficientnetb0.avgpool(feature_map), 1))
+
+
+"""
+    Torch Classifier (ImageNet classification with torchvision, behind the same interface as the Keras classifiers).
+"""
+class TorchClassifier(nn.Module):
+    # ImageNet normalisation of the torchvision classifiers
+    MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    def __init__(self, architecture='resnet50', feature_extractor=None):
+        """
+            Constructor of the TorchClassifier class.
+
+            Args:
+                architecture: The torchvision architecture ('resnet50' or 'mobilenetv2').
+                feature_extractor: A feature extractor of the same architecture whose pretrained model is shared instead of loading a second copy (optional).
+        """
+        super(TorchClassifier, self).__init__()
+        if architecture == 'resnet50':
+            weights = ResNet50_Weights.DEFAULT
+            shared_model = getattr(feature_extractor, 'resnet50_model', None)
+            self.model = shared_model if shared_model is not None else resnet50(weights=weights).to(device) # Loading (or sharing) the pretrained model
+        elif architecture == 'mobilenetv2':
+            weights = MobileNet_V2_Weights.DEFAULT
+            shared_model = getattr(feature_extractor, 'mobilenetv2', None)
+            self.model = shared_model if shared_model is not None else mobilenet_v2(weights=weights).to(device) # Loading (or sharing) the pretrained model
+        else:
+            raise ValueError('Unknown architecture ' + str(architecture) + ', possible architectures are: resnet50, mobilenetv2')
+        self.model.eval() # Setting the model in evaluation mode to not do dropout.
+        self.categories = [category.replace(' ', '_') for category in weights.meta['categories']] # ImageNet class names (in the Keras naming style)
+
+    def preprocess_input(self, x):
+        """
+            Preparing the input of the classifier (RGB images with pixels between 0 and 255, in height x width x channels layout).
+
+            Args:
+                x: The input image (or batch of images).
+
+            Returns:
+                The normalised input, in the same layout.
+        """
+        return (np.asarray(x, dtype=np.float32) / 255.0 - self.MEAN) / self.STD
 
     def forward(self, x):# Forwarding the input through the model
-        x = self.features(x)  # Applying the feature extraction part of the model
-        x = self.pooling(x)  # Applying the global average pooling
-        return x
+        return self.model(x)
+
+    def predict(self, images, verbose=0, batch_size=32):
+        """
+            Predicting the ImageNet class probabilities of a batch of preprocessed images, as the Keras predict method does.
+
+            Args:
+                images: The preprocessed images (batch x height x width x channels).
+                verbose: Unused, kept for compatibility with the Keras classifiers.
+                batch_size: The number of images per forward pass.
+
+            Returns:
+                The class probabilities (batch x 1000).
+        """
+        preds = []
+        with torch.no_grad():
+            for i in range(0, len(images), batch_size):
+                batch = torch.from_numpy(np.ascontiguousarray(np.asarray(images[i:i + batch_size], dtype=np.float32).transpose(0, 3, 1, 2))).to(device)
+                preds.append(F.softmax(self.model(batch), dim=1).cpu().numpy())
+        return np.concatenate(preds, axis=0) if preds else np.zeros((0, len(self.categories)), dtype=np.float32)
+
+    def decode_predictions(self, preds, top=5):
+        """
+            Decoding the predictions of the classifier, as the Keras decode_predictions function does.
+
+            Args:
+                preds: The class probabilities.
+                top: The number of top predictions to return.
+
+            Returns:
+                A list of (class index, class name, score) tuples per prediction.
+        """
+        return decode_imagenet_predictions(preds, self.categories, top=top)
+
+
+"""
+    Lazy model registry, which constructs the feature extractors and classifiers on first use and caches them per process.
+"""
+MODEL_REGISTRY = {
+    'vgg16': VGG16FeatureExtractor,
+    'resnet50': ResNet50FeatureExtractor,
+    'mobilenetv2': MobileNetV2FeatureExtractor,
+    'resnet18': ResNet18FeatureExtractor,
+    'shufflenetv2': ShuffleNetV2FeatureExtractor,
+    'efficientnetb0': EfficientNetB0FeatureExtractor,
+    'torch_resnet50': lambda: TorchClassifier('resnet50', feature_extractor=_model_cache.get('resnet50')),
+    'torch_mobilenetv2': lambda: TorchClassifier('mobilenetv2', feature_extractor=_model_cache.get('mobilenetv2')),
+    'resnet50v2': lambda: ResNet50V2(),
+    'keras_vgg16': lambda: VGG16(),
+    'keras_mobilenetv2': lambda: MobileNetV2(),
+    'efficientnetv2b3': lambda: EfficientNetV2B3(),
+    'xception': lambda: Xception(),
+    'inceptionv3': lambda: InceptionV3(),
+}
+
+# The models constructed in this process, by name
+_model_cache = {}
+
+"""
+    Specifications of the torch feature extractors of the registry (the size of their feature vector and their input size), so that the environment
+    can size its state and its inputs from the name of the feature extractor alone.
+"""
+FEATURE_EXTRACTOR_SPECS = {
+    'vgg16': {'feature_dim': 512, 'target_size': VGG16_TARGET_SIZE},
+    'resnet50': {'feature_dim': 2048, 'target_size': RESNET50_TARGET_SIZE},
+    'mobilenetv2': {'feature_dim': 1280, 'target_size': MOBILENETV2_TARGET_SIZE},
+    'resnet18': {'feature_dim': 512, 'target_size': RESNET18_TARGET_SIZE},
+    'shufflenetv2': {'feature_dim': 1024, 'target_size': SHUFFLENETV2_TARGET_SIZE},
+    'efficientnetb0': {'feature_dim': 1280, 'target_size': EFFICIENTNETB0_TARGET_SIZE},
+}
+
+
+def register_model(name, constructor):
+    """
+        Registering a model constructor under a name.
+
+        Args:
+            name: The name of the model.
+            constructor: A function without arguments which constructs the model.
+    """
+    MODEL_REGISTRY[name] = constructor
+    _model_cache.pop(name, None)
+
+
+def get_model(name):
+    """
+        Retrieving a model by name, constructing it on first use.
+
+        Args:
+            name: The name of the model (or an already constructed model, which is returned as is).
+
+        Returns:
+            The model, shared by all the callers in this process.
+    """
+    if not isinstance(name, str):
+        return name
+    if name not in MODEL_REGISTRY:
+        raise ValueError('Unknown model ' + name + ', possible models are: ' + str(list(MODEL_REGISTRY.keys())))
+    if name not in _model_cache:
+        _model_cache[name] = MODEL_REGISTRY[name]()
+    return _model_cache[name]
+
+
+"""
+    Defining the default number of regions of interest classified per batch by the classification queue.
+"""
+CLASSIFICATION_BATCH_SIZE = 64
+
+
+"""
+    Classification Queue, which accumulates the regions of interest of many finished episodes (or of many environments sharing it) and classifies them
+    in large batches, since every classifier predict call has a high fixed overhead.
+"""
+class ClassificationQueue():
+    def __init__(self, classifier=None, batch_size=CLASSIFICATION_BATCH_SIZE, asynchronous=True, label_mapping=None):
+        """
+            Constructor of the ClassificationQueue class.
+
+            Args:
+                classifier: The classifier (or its name in the lazy model registry), resolved on the first batch.
+                batch_size: The number of regions of interest after which a batch is classified.
+                asynchronous: Whether the batches are classified on a background thread (True), while the episodes continue, or in the calling thread (False).
+                label_mapping: The detection dataset whose labels the ImageNet predictions are mapped to ('voc' or 'coco'), or None for the ImageNet labels.
+        """
+        self.classifier = classifier
+        self.label_mapping = label_mapping
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=1) if asynchronous else None
+        self.pending = [] # The requests (images and callbacks) that were not classified yet
+        self.pending_images = 0
+        self.batches = deque() # The classified (or in progress) batches, whose callbacks were not run yet
+
+    def submit(self, images, callback):
+        """
+            Submitting the regions of interest of an image for classification.
+
+            Args:
+                images: The regions of interest, resized to the input size of the classifier (number of images x height x width x channels, not preprocessed).
+                callback: A function called with the (class index, class name, score) tuple of every image once they are classified.
+
+            Returns:
+                The request, whose list of callbacks can be extended (e.g. to update the metrics once the labels are known) while it is not resolved. A
+                request can already be resolved when it is returned (an image without regions of interest, or a synchronous queue reaching its batch size).
+        """
+        request = {'images': images, 'callbacks': [callback], 'resolved': False}
+
+        # Resolving an image without regions of interest right away
+        if len(images) == 0:
+            callback([])
+            request['resolved'] = True
+            return request
+
+        self.pending.append(request)
+        self.pending_images += len(images)
+
+        # Classifying a batch once enough regions of interest are queued
+        if self.pending_images >= self.batch_size:
+            self.flush()
+        return request
+
+    def _classify(self, images):
+        """ Classifying a batch of regions of interest with the classifier (on the background thread if the queue is asynchronous) """
+        self.classifier = get_model(self.classifier)
+        classifier_preprocess_input = getattr(self.classifier, 'preprocess_input', preprocess_input)
+        classifier_decode_predictions = getattr(self.classifier, 'decode_predictions', decode_predictions)
+        preds = self.classifier.predict(classifier_preprocess_input(images), verbose=0)
+        labels = decode_mapped_predictions(preds, self.label_mapping, top=1) if self.label_mapping is not None else classifier_decode_predictions(preds, top=1)
+        return [label[0] for label in labels]
+
+    def flush(self):
+        """
+            Classifying the queued regions of interest as one batch, without waiting for the result if the queue is asynchronous.
+        """
+        if self.pending_images == 0:
+            self.pending = []
+            return
+
+        # Concatenating the regions of interest of all the queued requests
+        requests, self.pending, self.pending_images = self.pending, [], 0
+        images = np.concatenate([np.asarray(request['images'], dtype=np.float32) for request in requests], axis=0)
+
+        # Classifying the batch
+        result = self.executor.submit(self._classify, images) if self.executor is not None else self._classify(images)
+        self.batches.append((requests, result))
+
+        # Resolving the labels right away if the batch was classified in the calling thread
+        if self.executor is None:
+            self.resolve()
+
+    def resolve(self, wait=False):
+        """
+            Running the callbacks of the classified batches, in the order in which they were submitted (always in the calling thread, so that the
+            callbacks can safely update the environment).
+
+            Args:
+                wait: Whether to wait for the batches in progress (True), or only resolve those which are already classified (False).
+        """
+        while self.batches:
+            requests, result = self.batches[0]
+            if self.executor is not None:
+                if not wait and not result.done():
+                    break
+                result = result.result()
+            self.batches.popleft()
+
+            # Splitting the labels of the batch between the requests
+            start = 0
+            for request in requests:
+                labels = result[start:start + len(request['images'])]
+                start += len(request['images'])
+                for callback in request['callbacks']:
+                    callback(labels)
+                request['resolved'] = True
+
+    def join(self):
+        """
+            Classifying all the queued regions of interest and waiting for every label to be resolved.
+        """
+        self.flush()
+        self.resolve(wait=True)
+
+    def __len__(self):
+        return self.pending_images
 
 
 """
@@ -112,6 +535,70 @@ def transform_input(image, target_size):
     return transform(image)
 
 
+def image_to_tensor(image):
+    """
+        Converting an image to a tensor on the device, with the same scaling as transform_input (pixels between 0 and 1), so that the regions of
+        interest can be cropped and resized on the device.
+
+        Args:
+            image: The input image (height x width x channels).
+
+        Returns:
+            The image tensor (1 x channels x height x width).
+    """
+    return torch.from_numpy(np.ascontiguousarray(image)).to(device).permute(2, 0, 1).unsqueeze(0).float().div_(255.0)
+
+
+def crop_roi(image_tensor, bbox, target_size):
+    """
+        Cropping a region of interest from an image tensor and resizing it to the input size of the feature extractor, on the device.
+
+        Args:
+            image_tensor: The image tensor (1 x channels x height x width), as returned by image_to_tensor.
+            bbox: The bounding box of the region of interest [xmin, ymin, xmax, ymax].
+            target_size: The input size of the feature extractor.
+
+        Returns:
+            The region of interest (1 x channels x target height x target width), or the whole image resized if the region of interest is empty.
+    """
+    roi = image_tensor[:, :, bbox[1]:bbox[3], bbox[0]:bbox[2]]
+    if roi.numel() == 0:
+        roi = image_tensor
+    return F.interpolate(roi, size=tuple(target_size), mode='bilinear', align_corners=False, antialias=True)
+
+
+"""
+    Fused Detection Policy, which runs the feature extractor and the policy network as a single module for inference: it takes the regions of interest
+    and the action histories, and returns the Q-values without leaving the device (so it can be scripted or compiled as one graph).
+"""
+class FusedDetectionPolicy(nn.Module):
+    def __init__(self, feature_extractor, policy_net):
+        """
+            Constructor of the FusedDetectionPolicy class.
+
+            Args:
+                feature_extractor: The feature extractor of the environment.
+                policy_net: The trained policy network (DQN or DuelingDQN).
+        """
+        super(FusedDetectionPolicy, self).__init__()
+        self.feature_extractor = feature_extractor
+        self.policy_net = policy_net
+
+    def forward(self, roi, action_history):
+        """
+            Forwarding the regions of interest and the action histories through the feature extractor and the policy network.
+
+            Args:
+                roi: The regions of interest (batch x channels x height x width).
+                action_history: The flattened action histories (batch x history size).
+
+            Returns:
+                The Q-values (batch x number of actions).
+        """
+        features = torch.flatten(self.feature_extractor(roi), 1)
+        return self.policy_net(torch.cat((action_history, features), 1))
+
+
 """
     Architecture of the Vanilla (Standard) DQN model.
 """
@@ -231,3 +718,77 @@ class DuelingDQN(nn.Module):
         adv = self.advfunc(o)
         # Returning the value and advantage functions combined into the Q function (Q = V + A - mean(A))
         return value + adv - adv.mean(dim=-1, keepdim=True)
+
+
+"""
+    Defining the quantisation backend of the int8 CPU inference mode ('x86' for x86 servers, 'qnnpack' for ARM).
+"""
+QUANTIZATION_BACKEND = 'x86'
+# The number of calibration crops per batch when calibrating a statically quantised feature extractor.
+CALIBRATION_BATCH_SIZE = 16
+
+
+def _check_quantization_device():
+    """ Ensuring that the models run on the CPU, since the int8 kernels of PyTorch are only available on the CPU """
+    if device.type != 'cpu':
+        raise ValueError('The int8 quantised models only run on the CPU, but the device is ' + str(device))
+
+
+def quantize_dqn(model):
+    """
+        Quantising a DQN (or Dueling DQN) for CPU inference, with dynamic int8 quantisation of its linear layers (the weights are stored in int8 and the
+        activations are quantised on the fly, so no calibration is needed).
+
+        Args:
+            model: The trained DQN or Dueling DQN.
+
+        Returns:
+            A quantised copy of the model, in evaluation mode (the quantised model can not be trained).
+    """
+    _check_quantization_device()
+    torch.backends.quantized.engine = QUANTIZATION_BACKEND
+    model = copy.deepcopy(model).cpu().eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+"""
+    Quantised Feature Extractor, which statically quantises the convolutional trunk of a feature extractor to int8 (FX graph mode quantisation),
+    calibrated on a sample of crops like those seen by the environment, while the ImageNet head stays in full precision.
+"""
+class QuantizedFeatureExtractor(FeatureExtractor):
+    def __init__(self, feature_extractor, calibration_crops, target_size=VGG16_TARGET_SIZE, backend=QUANTIZATION_BACKEND):
+        """
+            Constructor of the QuantizedFeatureExtractor class.
+
+            Args:
+                feature_extractor: The (full precision) feature extractor, e.g. VGG16FeatureExtractor or MobileNetV2FeatureExtractor.
+                calibration_crops: The calibration crops (images in height x width x channels layout), from which the activation ranges are observed.
+                target_size: The input size of the feature extractor.
+                backend: The quantisation backend ('x86' or 'qnnpack').
+        """
+        super(QuantizedFeatureExtractor, self).__init__()
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+        _check_quantization_device()
+        torch.backends.quantized.engine = backend
+
+        # Transforming the calibration crops as the environment does
+        calibration_images = torch.stack([transform_input(crop, target_size) for crop in calibration_crops])
+
+        # Inserting the observers in a copy of the trunk, and observing the activation ranges of the calibration crops
+        features = copy.deepcopy(feature_extractor.features).cpu().eval()
+        prepared = prepare_fx(features, get_default_qconfig_mapping(backend), example_inputs=(calibration_images[:1],))
+        with torch.no_grad():
+            for i in range(0, len(calibration_images), CALIBRATION_BATCH_SIZE):
+                prepared(calibration_images[i:i + CALIBRATION_BATCH_SIZE])
+
+        # Converting the observed trunk to int8
+        self.features = convert_fx(prepared)
+        self.pooling = feature_extractor.pooling
+        self.float_extractor = feature_extractor # The full precision feature extractor, whose ImageNet head classifies the (dequantised) feature maps
+        self.categories = getattr(feature_extractor, 'categories', None)
+
+    @property
+    def classify_features(self):# The full precision ImageNet head of the feature extractor (undefined if the feature extractor has none)
+        return self.float_extractor.classify_features
@@ -74,6 +74,10 @@ RANDOM_EXPLORE = 0
 GUIDED_EXPLORE = 1
 # Setting Exploration Mode
 EXPLORATION_MODE = RANDOM_EXPLORE
+# The evaluation log frequency is the number of episodes between reports of the running mean average precision during evaluation.
+EVAL_LOG_FREQ = 100
+# The IoU thresholds used for COCO-style evaluation (0.50:0.05:0.95)
+COCO_IOU_THRESHOLDS = np.round(np.arange(0.5, 0.951, 0.05), 2)
 
 # Defining the transition tuple
 Transition = namedtuple('Transition', ('state', 'action', 'reward', 'done', 'next_state'))
@@ -238,6 +242,172 @@ def recall(bbox, target_bbox):
     # Returning the recall
     return recall
 
+def _pairwise_overlaps(bounding_boxes, gt_boxes):
+    """
+        Calculating the pairwise intersection areas and box areas between every bounding box and every ground truth box.
+
+        If either of the inputs is a torch tensor, the computation is carried out in torch on the device of that tensor, otherwise numpy is used.
+
+        Args:
+            bounding_boxes: The predicted bounding boxes (N x 4), unpacked in the same way as iou().
+            gt_boxes: The ground truth bounding boxes (M x 4), unpacked in the same way as iou().
+
+        Returns:
+            The N x M intersection areas, the N x 1 bounding box areas and the 1 x M ground truth box areas, together with the array library used.
+    """
+    # Selecting the array library based on the type of the inputs
+    if isinstance(bounding_boxes, torch.Tensor) or isinstance(gt_boxes, torch.Tensor):
+        # Retrieving the device of the tensor input, so that the other input is moved alongside it
+        device = bounding_boxes.device if isinstance(bounding_boxes, torch.Tensor) else gt_boxes.device
+        lib = torch
+        boxes = torch.as_tensor(bounding_boxes, dtype=FloatDType, device=device).reshape(-1, 1, 4)
+        targets = torch.as_tensor(gt_boxes, dtype=FloatDType, device=device).reshape(1, -1, 4)
+    else:
+        lib = np
+        boxes = np.asarray(bounding_boxes, dtype=np.float64).reshape(-1, 1, 4)
+        targets = np.asarray(gt_boxes, dtype=np.float64).reshape(1, -1, 4)
+
+    # Calculating the overlaps of the (N x 1) and (1 x M) boxes, so that broadcasting yields every pair
+    return _box_overlaps(boxes, targets, lib) + (lib,)
+
+def _box_overlaps(boxes, targets, lib=np):
+    """
+        Calculating the intersection areas and box areas between two broadcastable arrays of boxes, whose last dimension holds the 4 coordinates.
+
+        The boxes are read as (x, y, w, h), in the same way as iou(), so that the reward and get_info() values of the environment are unchanged. The
+        detection evaluators use _xyxy_box_overlaps() instead.
+
+        Args:
+            boxes: The predicted bounding boxes (... x 4), unpacked in the same way as iou().
+            targets: The ground truth bounding boxes (... x 4), unpacked in the same way as iou().
+            lib: The array library used (numpy or torch).
+
+        Returns:
+            The intersection areas, the bounding box areas and the ground truth box areas.
+    """
+    # Unpacking the bounding boxes
+    x1, y1, w1, h1 = boxes[..., 0], boxes[..., 1], boxes[..., 2], boxes[..., 3]
+    x_gt, y_gt, w_gt, h_gt = targets[..., 0], targets[..., 1], targets[..., 2], targets[..., 3]
+
+    # Calculating the intersection area, whilst ensuring that the width and height are not negative
+    inter_width = lib.clip(lib.minimum(x1 + w1, x_gt + w_gt) - lib.maximum(x1, x_gt), 0, None)
+    inter_height = lib.clip(lib.minimum(y1 + h1, y_gt + h_gt) - lib.maximum(y1, y_gt), 0, None)
+    inter_area = inter_width * inter_height
+
+    # Returning the intersection areas, the bounding box areas and the ground truth box areas
+    return inter_area, w1 * h1, w_gt * h_gt
+
+def _xyxy_box_overlaps(boxes, targets, lib=np):
+    """
+        Calculating the intersection areas and box areas between two broadcastable arrays of boxes in the [xmin, ymin, xmax, ymax] format, in which the
+        environment stores both its detections and its ground truth boxes (continuous coordinates, as in the COCO evaluation).
+
+        Args:
+            boxes: The predicted bounding boxes (... x 4), as [xmin, ymin, xmax, ymax].
+            targets: The ground truth bounding boxes (... x 4), as [xmin, ymin, xmax, ymax].
+            lib: The array library used (numpy or torch).
+
+        Returns:
+            The intersection areas, the bounding box areas and the ground truth box areas.
+    """
+    # Unpacking the bounding boxes
+    x1, y1, x2, y2 = boxes[..., 0], boxes[..., 1], boxes[..., 2], boxes[..., 3]
+    x1_gt, y1_gt, x2_gt, y2_gt = targets[..., 0], targets[..., 1], targets[..., 2], targets[..., 3]
+
+    # Calculating the intersection area, whilst ensuring that the width and height are not negative
+    inter_width = lib.clip(lib.minimum(x2, x2_gt) - lib.maximum(x1, x1_gt), 0, None)
+    inter_height = lib.clip(lib.minimum(y2, y2_gt) - lib.maximum(y1, y1_gt), 0, None)
+    inter_area = inter_width * inter_height
+
+    # Returning the intersection areas, the bounding box areas and the ground truth box areas (degenerate boxes have no area)
+    box_area = lib.clip(x2 - x1, 0, None) * lib.clip(y2 - y1, 0, None)
+    gt_area = lib.clip(x2_gt - x1_gt, 0, None) * lib.clip(y2_gt - y1_gt, 0, None)
+    return inter_area, box_area, gt_area
+
+def _safe_divide(numerator, denominator, lib):
+    """ Dividing two arrays elementwise, returning 0 wherever the denominator is 0 """
+    # Handling the torch path
+    if lib is torch:
+        return torch.where(denominator != 0, numerator / denominator, torch.zeros_like(numerator))
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+def iou_matrix(bounding_boxes, gt_boxes):
+    """
+        Calculating the pairwise IoU between every bounding box and every ground truth box in a single array operation.
+
+        Formula:
+            IoU(b, g) = area(b ∩ g) / area(b U g)
+
+        Args:
+            bounding_boxes: The predicted bounding boxes (N x 4), unpacked in the same way as iou(). May be a torch tensor.
+            gt_boxes: The ground truth bounding boxes (M x 4), unpacked in the same way as iou(). May be a torch tensor.
+
+        Returns:
+            An N x M matrix holding the IoU between every bounding box and every ground truth box.
+    """
+    # Calculating the intersection and box areas of every pair
+    inter_area, box_area, gt_area, lib = _pairwise_overlaps(bounding_boxes, gt_boxes)
+
+    # Calculating the union area (area of the two bounding boxes - intersection area)
+    union_area = box_area + gt_area - inter_area
+
+    # Calculating the IoU, whilst handling the case where union_area might be zero to avoid division by zero
+    return _safe_divide(inter_area, union_area, lib)
+
+def recall_matrix(bounding_boxes, gt_boxes):
+    """
+        Calculating the pairwise recall between every bounding box and every ground truth box in a single array operation.
+
+        Formula:
+            Recall(b, g) = area(b ∩ g) / area(g)
+
+        Args:
+            bounding_boxes: The predicted bounding boxes (N x 4), unpacked in the same way as recall(). May be a torch tensor.
+            gt_boxes: The ground truth bounding boxes (M x 4), unpacked in the same way as recall(). May be a torch tensor.
+
+        Returns:
+            An N x M matrix holding the recall between every bounding box and every ground truth box.
+    """
+    # Calculating the intersection and box areas of every pair
+    inter_area, _, gt_area, lib = _pairwise_overlaps(bounding_boxes, gt_boxes)
+
+    # Calculating the recall, whilst handling the case where the ground truth area is 0
+    return _safe_divide(inter_area, gt_area, lib)
+
+def best_match(matrix, axis=1):
+    """
+        Reducing a pairwise IoU or recall matrix to the best match of every row (axis=1) or of every column (axis=0).
+
+        Args:
+            matrix: The N x M pairwise matrix, as returned by iou_matrix() or recall_matrix().
+            axis: The axis along which the best match is taken.
+
+        Returns:
+            The best values and the indices of the best matches. When there is nothing to match against, the values are -inf and the indices are -1.
+    """
+    # Handling the case where there is nothing to match against
+    if matrix.shape[axis] == 0:
+        shape = matrix.shape[1 - axis]
+        if isinstance(matrix, torch.Tensor):
+            return torch.full((shape,), -np.inf, device=matrix.device), torch.full((shape,), -1, dtype=LongDType, device=matrix.device)
+        return np.full(shape, -np.inf), np.full(shape, -1, dtype=np.int64)
+
+    # Handling the torch path
+    if isinstance(matrix, torch.Tensor):
+        values, indices = matrix.max(dim=axis)
+        return values, indices
+
+    # Retrieving the indices of the best matches (first occurrence on ties) and their values
+    indices = matrix.argmax(axis=axis)
+    return np.take_along_axis(matrix, np.expand_dims(indices, axis), axis=axis).squeeze(axis), indices
+
+def _best_value(matrix):
+    """ Retrieving the best value in a pairwise matrix as a float, or -inf if there is nothing to compare """
+    # Handling the case where there are no bounding boxes or no ground truth boxes
+    if matrix.shape[0] == 0 or matrix.shape[1] == 0:
+        return -np.inf
+    return float(matrix.max())
+
 def calculate_best_iou(bounding_boxes, gt_boxes):
     """
         Calculating the best IoU between the bounding boxes and the ground truth boxes.
@@ -247,23 +417,10 @@ def calculate_best_iou(bounding_boxes, gt_boxes):
             gt_boxes: The ground truth bounding boxes.
 
         Returns:
-            The best IoU between the bounding boxes and the ground truth boxes.
+            The best IoU between the bounding boxes and the ground truth boxes (-inf if either is empty).
     """
-    # Initialising the best IoU
-    best_iou = -np.inf
-
-    # Iterating through the bounding boxes
-    for bbox in bounding_boxes:
-        # Iterating through the ground truth boxes
-        for gt_box in gt_boxes:
-            # Calculating the IoU
-            current_iou = iou(bbox, gt_box)
-
-            # Updating the best IoU
-            best_iou = max(best_iou, current_iou)
-
-    # Returning the best IoU
-    return best_iou
+    # Calculating the IoU of every pair and retrieving the best one
+    return _best_value(iou_matrix(bounding_boxes, gt_boxes))
 
 def calculate_best_recall(bounding_boxes, gt_boxes):
     """
@@ -274,23 +431,31 @@ def calculate_best_recall(bounding_boxes, gt_boxes):
             gt_boxes: The ground truth bounding boxes.
 
         Returns:
-            The best recall between the bounding boxes and the ground truth boxes.
+            The best recall between the bounding boxes and the ground truth boxes (-inf if either is empty).
     """
-    # Initialising the best recall
-    best_recall = -np.inf
+    # Calculating the recall of every pair and retrieving the best one
+    return _best_value(recall_matrix(bounding_boxes, gt_boxes))
 
-    # Iterating through the bounding boxes
-    for bbox in bounding_boxes:
-        # Iterating through the ground truth boxes
-        for gt_box in gt_boxes:
-            # Calculating the recall
-            recall_score = recall(bbox, gt_box)
+def calculate_best_iou_recall(bounding_boxes, gt_boxes):
+    """
+        Calculating both the best IoU and the best recall between the bounding boxes and the ground truth boxes, sharing the intersection areas.
 
-            # Updating the best recall
-            best_recall = max(best_recall, recall_score)
+        Args:
+            bounding_boxes: The predicted bounding boxes.
+            gt_boxes: The ground truth bounding boxes.
 
-    # Returning the best recall
-    return best_recall
+        Returns:
+            The best IoU and the best recall between the bounding boxes and the ground truth boxes (-inf if either is empty).
+    """
+    # Calculating the intersection and box areas of every pair once
+    inter_area, box_area, gt_area, lib = _pairwise_overlaps(bounding_boxes, gt_boxes)
+
+    # Calculating the IoU and recall matrices from the shared areas
+    ious = _safe_divide(inter_area, box_area + gt_area - inter_area, lib)
+    recalls = _safe_divide(inter_area, gt_area, lib)
+
+    # Returning the best IoU and the best recall
+    return _best_value(ious), _best_value(recalls)
 
 def calculate_precision_recall(bounding_boxes, gt_boxes, ovthresh):
     """
@@ -299,7 +464,7 @@ def calculate_precision_recall(bounding_boxes, gt_boxes, ovthresh):
         Args:
             bounding_boxes: The predicted bounding boxes.
             gt_boxes: The ground truth bounding boxes.
-            ovthresh: The IoU threshold.
+            ovthresh: The IoU threshold, or an array of IoU thresholds (T) which are all evaluated from the same IoUs.
 
         Returns:
             precision (tp / (tp + fp))
@@ -307,6 +472,8 @@ def calculate_precision_recall(bounding_boxes, gt_boxes, ovthresh):
             f1 score (2 * (precision * recall) / (precision + recall))
             average IoU (sum of IoUs / number of bounding boxes)
             average precision (sum of precisions / number of bounding boxes)
+
+            If an array of thresholds is given, the precision, recall, f1 score and average precision have a leading threshold dimension (T).
     """
     # Retrieving the number of bounding boxes
     num_bounding_boxes = len(bounding_boxes)
@@ -315,39 +482,22 @@ def calculate_precision_recall(bounding_boxes, gt_boxes, ovthresh):
     # Ensuring that the number of bounding boxes is the same as the number of ground truth boxes
     assert num_bounding_boxes == num_gt_boxes, "Evaluation Error: The number of bounding boxes must be the same as the number of ground truth boxes."
 
-    # Initialising the true positives, false positives and false negatives
-    tp = np.zeros(num_bounding_boxes)
-    fp = np.zeros(num_bounding_boxes)
-    fn = np.zeros(num_bounding_boxes)
-
-    # Initialising the IoU, precision and recall
-    ious = np.zeros(num_bounding_boxes)
-    precision = np.zeros(num_bounding_boxes)
-    recall = np.zeros(num_bounding_boxes)
-
     # Retrieving img_ids
     img_ids = list(bounding_boxes.keys())
 
-    # Iterating through the bounding boxes
-    for index in range(num_bounding_boxes):
-        # Retrieving the bounding boxes
-        prediction = bounding_boxes[img_ids[index]]
-        target = gt_boxes[img_ids[index]]
+    # Calculating the best IoU of every image
+    ious = np.array([calculate_best_iou(bounding_boxes[img_id], gt_boxes[img_id]) for img_id in img_ids], dtype=np.float64)
 
-        # Calculating the IoU
-        ious[index] = calculate_best_iou(prediction, target)
-
-        # Calculating the precision and recall
-        if ious[index] > ovthresh:
-            tp[index] = 1.0
-        else:
-            fp[index] = 1.0
-            fn[index] = 1.0
+    # Calculating the true positives, false positives and false negatives at every threshold at once (T x N)
+    thresholds = np.asarray(ovthresh, dtype=np.float64)
+    tp = (ious[np.newaxis, :] > thresholds.reshape(-1, 1)).astype(np.float64)
+    fp = 1.0 - tp
+    fn = fp
 
     # Calculating the precision and recall
-    tp = np.cumsum(tp)
-    fp = np.cumsum(fp)
-    fn = np.cumsum(fn)
+    tp = np.cumsum(tp, axis=-1)
+    fp = np.cumsum(fp, axis=-1)
+    fn = np.cumsum(fn, axis=-1)
 
     # Calculating the precision and recall for each bounding box (finfo is used to avoid division by zero)
     precision = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
@@ -360,7 +510,11 @@ def calculate_precision_recall(bounding_boxes, gt_boxes, ovthresh):
     avg_iou = np.mean(ious)
 
     # Calculating the average precision
-    avg_precision = np.mean(precision)
+    avg_precision = np.mean(precision, axis=-1)
+
+    # Removing the threshold dimension if a single threshold is given
+    if thresholds.ndim == 0:
+        precision, recall, f1_score, avg_precision = precision[0], recall[0], f1_score[0], avg_precision[0]
 
     # Returning the precision, recall, f1 score, average IoU and average precision
     return precision, recall, f1_score, avg_iou, avg_precision
@@ -370,45 +524,70 @@ def voc_ap(rec, prec, voc2007=False):
     Calculating the Average Precision (AP) and Recall.
 
         Args:
-            rec: Array of recall values.
-            prec: Array of precision values.
+            rec: Array of recall values, or a stack of recall curves (... x N) such as (classes x thresholds x N).
+            prec: Array of precision values, with the same shape as rec.
             voc2007: Boolean flag indicating whether to use the method recommended by the PASCAL VOC 2007 paper (11-point method).
 
         Returns:
-            The average precision (AP).
+            The average precision (AP), with the shape of the leading dimensions of the stack.
 
         More information:
         - If voc2007 is True, then the method recommended by the PASCAL VOC 2007 paper (11-point method) is used.
         - If voc2007 is False, then the method recommended by the PASCAL VOC 2010 paper is used.
+        - Curves of different lengths can be stacked by padding them with their last recall value and a precision of 0, which leaves their AP unchanged.
     """
-    # Ensuring inputs are numpy arrays
-    rec = np.array(rec)
-    prec = np.array(prec)
+    # Ensuring inputs are contiguous numpy arrays (so that the summation order, and hence the result, does not depend on the memory layout)
+    rec = np.ascontiguousarray(rec, dtype=np.float64)
+    prec = np.ascontiguousarray(prec, dtype=np.float64)
 
     if voc2007:
         # PASCAL VOC 2007 11-point method
-        ap = 0.0
-        for t in np.arange(0.0, 1.1, 0.1):
-            # Finding the maximum precision at recall levels greater than or equal to the threshold
-            p = np.max(prec[rec >= t]) if np.sum(rec >= t) > 0 else 0
-            # Calculating AP using the 11-point method
-            ap += p / 11.0
+        # Finding the maximum precision at recall levels greater than or equal to every threshold (0 if there are none)
+        thresholds = np.arange(0.0, 1.1, 0.1)
+        mask = rec[..., np.newaxis, :] >= thresholds[:, np.newaxis]
+        p = np.max(np.where(mask, prec[..., np.newaxis, :], 0.0), axis=-1, initial=0.0)
+
+        # Calculating AP using the 11-point method
+        ap = np.sum(p / 11.0, axis=-1)
     else:
         # PASCAL VOC 2010 method
         # Concatenating arrays with 0 and 1 to ensure that precision is interpolated correctly
-        mrec = np.concatenate(([0.0], rec, [1.0]))
-        mpre = np.concatenate(([0.0], prec, [0.0]))
+        pad_shape = rec.shape[:-1] + (1,)
+        mrec = np.concatenate((np.zeros(pad_shape), rec, np.ones(pad_shape)), axis=-1)
+        mpre = np.concatenate((np.zeros(pad_shape), prec, np.zeros(pad_shape)), axis=-1)
 
         # Interpolating precision at different recall levels by taking the maximum precision at a recall level greater than the current recall level
-        for i in range(mpre.size - 1, 0, -1):
-            mpre[i - 1] = np.maximum(mpre[i - 1], mpre[i])
+        mpre = np.maximum.accumulate(mpre[..., ::-1], axis=-1)[..., ::-1]
 
-        # Calculating the average precision by integrating the precision-recall curve
-        i = np.where(mrec[1:] != mrec[:-1])[0]
-        ap = np.sum((mrec[i + 1] - mrec[i]) * mpre[i + 1])
+        # Calculating the average precision by integrating the precision-recall curve (points where the recall does not change contribute 0)
+        ap = np.sum((mrec[..., 1:] - mrec[..., :-1]) * mpre[..., 1:], axis=-1)
 
     return ap
 
+def stack_curves(curves):
+    """
+        Stacking precision-recall curves of different lengths, so that their AP can be computed with a single call of voc_ap().
+
+        Args:
+            curves: A list of (recall, precision) pairs, each of shape (... x N_i) with the same leading dimensions.
+
+        Returns:
+            The stacked recall and precision curves (number of curves x ... x max N_i), padded with the last recall value and a precision of 0.
+    """
+    # Retrieving the maximum length of the curves
+    length = max([np.shape(rec)[-1] for rec, _ in curves] + [0])
+
+    # Padding every curve to the maximum length
+    stacked_rec, stacked_prec = [], []
+    for rec, prec in curves:
+        rec, prec = np.asarray(rec, dtype=np.float64), np.asarray(prec, dtype=np.float64)
+        last = rec[..., -1:] if rec.shape[-1] > 0 else np.zeros(rec.shape[:-1] + (1,))
+        stacked_rec.append(np.concatenate((rec, np.repeat(last, length - rec.shape[-1], axis=-1)), axis=-1))
+        stacked_prec.append(np.concatenate((prec, np.zeros(prec.shape[:-1] + (length - prec.shape[-1],))), axis=-1))
+
+    # Returning the stacked curves
+    return np.stack(stacked_rec), np.stack(stacked_prec)
+
 def calculate_class_detection_metrics(current_class, bounding_boxes, gt_boxes, ovthresh):
     """
         Calculating the VOC detection metric.
@@ -444,23 +623,8 @@ def calculate_detection_metrics(results_path, save_path=None, threshold_list=[0.
             mAps: The mean average precision for each class at given IoU thresholds.
             pre_rec_f1: Precision, recall, and F1-score for each class at given IoU thresholds.
     """
-    # Declaring the results dictionary
-    results = {}
-
-    # Loading all files in the results path directory
-    for file in os.listdir(results_path):
-        # Skipping files that are not .npy files
-        if not file.endswith(".npy"):
-            continue
-        
-        # Loading the results
-        current_results = np.load(os.path.join(results_path, file), allow_pickle=True).item()
-
-        # Retrieving the class
-        current_class = current_results["class"]
-
-        # Storing the results in the results dictionary
-        results[current_class] = current_results
+    # Loading the results
+    results = load_detection_results(results_path)
 
     # Retrieving the classes
     classes = list(results.keys())
@@ -468,35 +632,35 @@ def calculate_detection_metrics(results_path, save_path=None, threshold_list=[0.
     # Initialising list of dataframes to store the detection metrics for each class and mean average precision
     dfs = []
     mAps = {}
-    pre_rec_f1 = {}
+    pre_rec_f1 = {ovthresh: {} for ovthresh in threshold_list}
 
-    # Iterating through the threshold values
-    for ovthresh in threshold_list:
-        # Storing the average precision for each class at given IoU thresholds
-        aps = {}
+    # Calculating the precision and recall of every class at all the thresholds at once (each of shape thresholds x images)
+    class_metrics = {}
+    for current_class in classes:
+        class_metrics[current_class] = calculate_precision_recall(results[current_class]["bounding_boxes"], results[current_class]["gt_boxes"], threshold_list)
 
-        pre_rec_f1[ovthresh] = {}
+    # Calculating the average precision of all the classes at all the thresholds in a single call (classes x thresholds)
+    aps = np.zeros((0, len(threshold_list)))
+    if len(classes) > 0:
+        rec, prec = stack_curves([(class_metrics[current_class][1], class_metrics[current_class][0]) for current_class in classes])
+        aps = voc_ap(rec, prec).reshape(len(classes), len(threshold_list))
 
+    # Iterating through the threshold values
+    for t, ovthresh in enumerate(threshold_list):
         # Creating a dictionary to store the detection metrics
         detection_metrics_dict = {}
 
         # Iterating through the classes
-        for current_class in classes:
-            # Retrieving the bounding boxes and ground truth boxes
-            bounding_boxes = results[current_class]["bounding_boxes"]
-            gt_boxes = results[current_class]["gt_boxes"]
-
-            # Calculating the detection metrics
-            detection_metrics, pre_rec_f1[ovthresh][current_class] = calculate_class_detection_metrics(current_class, bounding_boxes, gt_boxes, ovthresh)
+        for c, current_class in enumerate(classes):
+            # Retrieving the metrics of the class at the current threshold
+            prec, rec, f1_score, avg_iou, avg_precision = class_metrics[current_class]
+            pre_rec_f1[ovthresh][current_class] = {"precision": prec[t], "recall": rec[t], "f1_score": f1_score[t]}
 
             # Adding the detection metrics to the detection metrics dictionary
-            detection_metrics_dict[current_class] = detection_metrics
-
-            # Storing the average precision for each class at given IoU thresholds
-            aps[current_class] = detection_metrics["average_precision_voc"]
+            detection_metrics_dict[current_class] = {"class": current_class, "average_iou": avg_iou, "average_precision": avg_precision[t], "average_precision_voc": aps[c, t], "iou_threshold": ovthresh, "num_images": len(results[current_class]["bounding_boxes"])}
 
         # Calculating the mean average precision for each class at given IoU thresholds
-        mAps[ovthresh] = np.mean(list(aps.values()))*100
+        mAps[ovthresh] = np.mean(aps[:, t])*100
 
         # Transforming the detection metrics dictionary into a dataframe
         df = pd.DataFrame(detection_metrics_dict).T
@@ -533,3 +697,339 @@ def calculate_detection_metrics(results_path, save_path=None, threshold_list=[0.
     # Returning the list of dataframes and the mean average precision
     return dfs, mAps
 
+
+def load_detection_results(results_path):
+    """
+        Loading the per-class evaluation results saved by the environment.
+
+        Args:
+            results_path: Path to the directory containing detection results.
+
+        Returns:
+            A dictionary mapping every class to its evaluation results.
+    """
+    # Declaring the results dictionary
+    results = {}
+
+    # Loading all files in the results path directory
+    for file in sorted(os.listdir(results_path)):
+        # Skipping files that are not .npy files
+        if not file.endswith(".npy"):
+            continue
+
+        # Loading the results
+        current_results = np.load(os.path.join(results_path, file), allow_pickle=True).item()
+
+        # Storing the results in the results dictionary
+        results[current_results["class"]] = current_results
+
+    # Returning the results
+    return results
+
+def _match_detections(ovmax, keys, ignored, iou_thresholds):
+    """
+        Greedily matching detections, already sorted by decreasing confidence, to the ground truth boxes at every IoU threshold at once (PASCAL VOC protocol).
+
+        A detection is a true positive if its best overlap is above the threshold and its best matching ground truth box has not already been claimed by a
+        higher ranked detection, otherwise it is a false positive. Detections whose best match is a difficult ground truth box are ignored.
+
+        Args:
+            ovmax: The best overlap of every detection (D).
+            keys: An identifier of the best matching ground truth box of every detection, unique across images (D).
+            ignored: Whether the best matching ground truth box of every detection is flagged as difficult (D).
+            iou_thresholds: The IoU thresholds (T).
+
+        Returns:
+            The true positive and false positive flags (T x D).
+    """
+    # Determining which detections overlap their best ground truth box enough at every threshold
+    hits = ovmax[np.newaxis, :] > np.asarray(iou_thresholds, dtype=np.float64).reshape(-1, 1)
+    candidates = hits & ~ignored[np.newaxis, :]
+
+    # Marking the first detection claiming every ground truth box as a true positive
+    tp = np.zeros(hits.shape, dtype=bool)
+    for t in range(hits.shape[0]):
+        indices = np.flatnonzero(candidates[t])
+        _, first = np.unique(keys[indices], return_index=True)
+        tp[t, indices[first]] = True
+
+    # Marking every other detection which is not ignored as a false positive
+    fp = ~tp & ~(hits & ignored[np.newaxis, :])
+
+    # Returning the true positive and false positive flags
+    return tp, fp
+
+def _rank_and_match_detections(bounding_boxes, gt_boxes, confidences=None, iou_thresholds=COCO_IOU_THRESHOLDS, difficult=None):
+    """
+        Ranking the detections of a single class by confidence and matching them greedily to the ground truth boxes of their image at every IoU threshold.
+
+        Args:
+            bounding_boxes: Dictionary mapping every image to its predicted bounding boxes, as [xmin, ymin, xmax, ymax].
+            gt_boxes: Dictionary mapping every image to its ground truth bounding boxes, as [xmin, ymin, xmax, ymax].
+            confidences: Dictionary mapping every image to the confidences of its predicted bounding boxes (missing confidences are treated as equal).
+            iou_thresholds: The IoU thresholds (T).
+            difficult: Dictionary mapping every image to the difficult flags of its ground truth boxes (None if no box is difficult).
+
+        Returns:
+            The confidences (D), true positive and false positive flags (T x D) and best overlaps (D) of the detections sorted by decreasing confidence,
+            together with the number of ground truth boxes which are not difficult.
+    """
+    # Retrieving the images, the ground truth boxes padded to the same number per image, and their difficult flags
+    img_ids = list(gt_boxes.keys()) + [img_id for img_id in bounding_boxes.keys() if img_id not in gt_boxes]
+    img_index = {img_id: index for index, img_id in enumerate(img_ids)}
+    max_gt = max([len(gt_boxes.get(img_id, [])) for img_id in img_ids] + [1])
+    gts = np.zeros((len(img_ids), max_gt, 4))
+    valid = np.zeros((len(img_ids), max_gt), dtype=bool)
+    ignored = np.zeros((len(img_ids), max_gt), dtype=bool)
+    for index, img_id in enumerate(img_ids):
+        boxes = gt_boxes.get(img_id, [])
+        if len(boxes) > 0:
+            gts[index, :len(boxes)] = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+            valid[index, :len(boxes)] = True
+            if difficult is not None and img_id in difficult:
+                ignored[index, :len(boxes)] = np.asarray(difficult[img_id], dtype=bool)
+
+    # Calculating the number of ground truth boxes which are not difficult
+    npos = int(np.sum(valid & ~ignored))
+
+    # Flattening the detections of all images, together with their image index and confidence (missing confidences are set to 1)
+    det_images, det_boxes, det_conf = [], [], []
+    for img_id, boxes in bounding_boxes.items():
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        conf = np.ones(len(boxes))
+        if confidences is not None and img_id in confidences:
+            scores = np.asarray(confidences[img_id], dtype=np.float64).ravel()[:len(boxes)]
+            conf[:len(scores)] = scores
+        det_images.append(np.full(len(boxes), img_index[img_id], dtype=np.int64))
+        det_boxes.append(boxes)
+        det_conf.append(conf)
+    det_images = np.concatenate(det_images) if det_images else np.zeros(0, dtype=np.int64)
+    det_boxes = np.concatenate(det_boxes) if det_boxes else np.zeros((0, 4))
+    det_conf = np.concatenate(det_conf) if det_conf else np.zeros(0)
+
+    # Sorting the detections by decreasing confidence (stable, so equal confidences keep their order)
+    order = np.argsort(-det_conf, kind='stable')
+    det_images, det_boxes, det_conf = det_images[order], det_boxes[order], det_conf[order]
+
+    # Calculating the IoU of every detection with every ground truth box of its image in a single batch
+    inter_area, box_area, gt_area = _xyxy_box_overlaps(det_boxes[:, np.newaxis, :], gts[det_images])
+    overlaps = _safe_divide(inter_area, box_area + gt_area - inter_area, np)
+    overlaps[~valid[det_images]] = -np.inf
+
+    # Retrieving the best overlap and best matching ground truth box of every detection
+    jmax = overlaps.argmax(axis=1) if len(det_images) > 0 else np.zeros(0, dtype=np.int64)
+    ovmax = overlaps[np.arange(len(det_images)), jmax]
+
+    # Matching the detections at every threshold
+    tp, fp = _match_detections(ovmax, det_images * max_gt + jmax, ignored[det_images, jmax], iou_thresholds)
+
+    # Returning the ranked confidences, the matches, the best overlaps and the number of ground truth boxes
+    return det_conf, tp, fp, ovmax, npos
+
+def _detection_curves(tp, fp, npos, voc2007=False):
+    """
+        Calculating the precision-recall curves and the average precision from ranked true positive and false positive flags.
+
+        Args:
+            tp: The true positive flags of the ranked detections (T x D).
+            fp: The false positive flags of the ranked detections (T x D).
+            npos: The number of ground truth boxes which are not difficult.
+            voc2007: Boolean flag indicating whether to use the 11-point method of the PASCAL VOC 2007 paper.
+
+        Returns:
+            The precision (T x D), recall (T x D) and average precision (T).
+    """
+    # Calculating the precision and recall curves (finfo is used to avoid division by zero)
+    tp = np.cumsum(tp, axis=1, dtype=np.float64)
+    fp = np.cumsum(fp, axis=1, dtype=np.float64)
+    recall = tp / max(npos, np.finfo(np.float64).eps)
+    precision = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+
+    # Calculating the average precision at every threshold
+    return precision, recall, voc_ap(recall, precision, voc2007)
+
+def evaluate_class_detections(bounding_boxes, gt_boxes, confidences=None, iou_thresholds=COCO_IOU_THRESHOLDS, difficult=None, voc2007=False):
+    """
+        Evaluating the detections of a single class following the PASCAL VOC protocol, for many IoU thresholds in one pass.
+
+        All detections are ranked by confidence, matched greedily against the ground truth boxes of their image, and the precision-recall curve and
+        average precision are computed for every IoU threshold from the same overlaps.
+
+        Args:
+            bounding_boxes: Dictionary mapping every image to its predicted bounding boxes, as [xmin, ymin, xmax, ymax].
+            gt_boxes: Dictionary mapping every image to its ground truth bounding boxes, as [xmin, ymin, xmax, ymax].
+            confidences: Dictionary mapping every image to the confidences of its predicted bounding boxes (missing confidences are treated as equal).
+            iou_thresholds: The IoU thresholds.
+            difficult: Dictionary mapping every image to the difficult flags of its ground truth boxes (None if no box is difficult).
+            voc2007: Boolean flag indicating whether to use the 11-point method of the PASCAL VOC 2007 paper.
+
+        Returns:
+            A dictionary with the average precision per threshold (T), the precision and recall curves (T x D), the average IoU of the detections, and the
+            number of detections and of (non-difficult) ground truth boxes.
+    """
+    # Ranking and matching the detections at every threshold
+    _, tp, fp, ovmax, npos = _rank_and_match_detections(bounding_boxes, gt_boxes, confidences, iou_thresholds, difficult)
+
+    # Calculating the precision-recall curves and the average precision at every threshold
+    precision, recall, ap = _detection_curves(tp, fp, npos, voc2007)
+
+    # Returning the metrics
+    return {"average_precision": ap, "precision": precision, "recall": recall, "average_iou": float(np.mean(np.maximum(ovmax, 0))) if len(ovmax) > 0 else 0.0, "num_detections": len(ovmax), "num_gt": npos}
+
+def calculate_voc_detection_metrics(results_path, save_path=None, iou_thresholds=COCO_IOU_THRESHOLDS, voc2007=False):
+    """
+    Calculating the PASCAL VOC / COCO-style detection metrics (confidence ranked, per-image greedy matching) for all the classes, from the
+    [xmin, ymin, xmax, ymax] boxes saved by the environment.
+
+        Args:
+            results_path: Path to the directory containing detection results.
+            save_path: Path to the directory where the metrics are saved (None to not save them).
+            iou_thresholds: The IoU thresholds at which the average precision is computed.
+            voc2007: Boolean flag indicating whether to use the 11-point method of the PASCAL VOC 2007 paper.
+
+        Returns:
+            df: A pandas dataframe with the average precision of every class at every IoU threshold, together with the mean over the thresholds.
+            mAps: The mean average precision at every IoU threshold, and over all the thresholds ("mean").
+    """
+    # Loading the results
+    results = load_detection_results(results_path)
+
+    # Evaluating every class
+    metrics = {}
+    for current_class, current_results in results.items():
+        metrics[current_class] = evaluate_class_detections(current_results["bounding_boxes"], current_results["gt_boxes"], current_results.get("confidences"),
+                                                           iou_thresholds, current_results.get("difficult"), voc2007)
+
+    # Transforming the average precisions into a dataframe (as a percentage), with one column per threshold
+    columns = ["AP@%.2f" % threshold for threshold in iou_thresholds]
+    df = pd.DataFrame({current_class: dict(zip(columns, metric["average_precision"] * 100)) for current_class, metric in metrics.items()}).T
+    df["AP@[%.2f:%.2f]" % (iou_thresholds[0], iou_thresholds[-1])] = df[columns].mean(axis=1)
+    df["average_iou"] = [metric["average_iou"] for metric in metrics.values()]
+    df["num_detections"] = [metric["num_detections"] for metric in metrics.values()]
+    df["num_gt"] = [metric["num_gt"] for metric in metrics.values()]
+
+    # Calculating the mean average precision at every threshold and over all the thresholds
+    mAps = dict(zip(iou_thresholds, df[columns].mean(axis=0).values))
+    mAps["mean"] = float(np.mean(list(mAps.values()))) if len(mAps) > 0 else 0.0
+
+    # Adding the mean average precision to the dataframe as a new row
+    df.loc["mAp"] = df.drop(columns=["num_detections", "num_gt"]).mean(axis=0)
+
+    # Displaying the dataframe
+    display(df)
+
+    # If save_path is provided, save the results
+    if save_path is not None:
+        os.makedirs(save_path, exist_ok=True)
+        df.to_csv(os.path.join(save_path, "voc_detection_metrics.csv"))
+
+    # Returning the dataframe and the mean average precision
+    return df, mAps
+
+class DetectionMetricsAccumulator():
+    """
+        Streaming detection metrics, updated as every image is evaluated, so that the running mean average precision can be reported during long evaluations
+        without keeping the raw bounding boxes of every image.
+
+        Every image keeps only the ranked confidences, the true/false positive flags and the best overlaps of its detections, which are matched with the
+        same protocol as evaluate_class_detections(). Since detections are only ever matched against the ground truth boxes of their own image, and updating
+        an image replaces its entry in place, the final numbers are exactly those of evaluate_class_detections() on the same dictionaries.
+
+        Args:
+            iou_thresholds: The IoU thresholds at which the average precision is computed.
+            voc2007: Boolean flag indicating whether to use the 11-point method of the PASCAL VOC 2007 paper.
+    """
+    def __init__(self, iou_thresholds=COCO_IOU_THRESHOLDS, voc2007=False):
+        self.iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+        self.voc2007 = voc2007
+        self.entries = {} # Dictionary mapping every class to a dictionary mapping every image to its matched detections
+
+    def update(self, current_class, img_id, gt_boxes, bounding_boxes=None, confidences=None, difficult=None):
+        """
+            Updating the metrics with the ground truth boxes and (optionally) the detections of an image, replacing any previous entry of that image.
+
+            Args:
+                current_class: The current class/label.
+                img_id: The identifier of the image.
+                gt_boxes: The ground truth bounding boxes of the image, as [xmin, ymin, xmax, ymax].
+                bounding_boxes: The predicted bounding boxes of the image, as [xmin, ymin, xmax, ymax] (None if the image has not been evaluated yet).
+                confidences: The confidences of the predicted bounding boxes.
+                difficult: The difficult flags of the ground truth boxes.
+        """
+        # Matching the detections of the image
+        detections = {} if bounding_boxes is None else {img_id: bounding_boxes}
+        conf, tp, fp, ovmax, npos = _rank_and_match_detections(detections, {img_id: gt_boxes}, None if confidences is None else {img_id: confidences},
+                                                               self.iou_thresholds, None if difficult is None else {img_id: difficult})
+
+        # Storing the entry of the image
+        self.entries.setdefault(current_class, {})[img_id] = (conf, tp, fp, ovmax, npos)
+
+    def _class_matches(self, current_class):
+        """ Concatenating the entries of a class and ranking all its detections by decreasing confidence """
+        entries = list(self.entries.get(current_class, {}).values())
+        if len(entries) == 0:
+            return np.zeros((len(self.iou_thresholds), 0), dtype=bool), np.zeros((len(self.iou_thresholds), 0), dtype=bool), np.zeros(0), 0
+
+        # Concatenating the entries of every image in their insertion order
+        conf = np.concatenate([entry[0] for entry in entries])
+        tp = np.concatenate([entry[1] for entry in entries], axis=1)
+        fp = np.concatenate([entry[2] for entry in entries], axis=1)
+        ovmax = np.concatenate([entry[3] for entry in entries])
+        npos = sum(entry[4] for entry in entries)
+
+        # Ranking the detections of all the images (stable, so equal confidences keep their order)
+        order = np.argsort(-conf, kind='stable')
+        return tp[:, order], fp[:, order], ovmax[order], npos
+
+    def class_metrics(self, current_class):
+        """
+            Calculating the metrics of a class from the images seen so far.
+
+            Args:
+                current_class: The current class/label.
+
+            Returns:
+                A dictionary with the same metrics as evaluate_class_detections(), together with the number of true and false positives at every threshold.
+        """
+        # Retrieving the ranked matches of the class
+        tp, fp, ovmax, npos = self._class_matches(current_class)
+
+        # Calculating the precision-recall curves and the average precision at every threshold
+        precision, recall, ap = _detection_curves(tp, fp, npos, self.voc2007)
+
+        # Returning the metrics
+        return {"average_precision": ap, "precision": precision, "recall": recall, "average_iou": float(np.mean(np.maximum(ovmax, 0))) if len(ovmax) > 0 else 0.0,
+                "num_detections": len(ovmax), "num_gt": npos, "num_tp": tp.sum(axis=1), "num_fp": fp.sum(axis=1), "num_images": len(self.entries.get(current_class, {}))}
+
+    def mean_average_precision(self):
+        """ Calculating the running mean average precision over the classes seen so far at every IoU threshold (as a percentage) """
+        # Handling the case where no image has been seen yet
+        if len(self.entries) == 0:
+            return np.zeros(len(self.iou_thresholds))
+        return np.mean([self.class_metrics(current_class)["average_precision"] for current_class in self.entries], axis=0) * 100
+
+    def summary(self):
+        """
+            Summarising the running metrics of every class.
+
+            Returns:
+                A pandas dataframe with the average precision of every class at every IoU threshold (as a percentage), the mean over the thresholds, the average
+                IoU and the number of images, detections and ground truth boxes, with the mean average precision as the last row.
+        """
+        # Calculating the metrics of every class
+        metrics = {current_class: self.class_metrics(current_class) for current_class in self.entries}
+
+        # Transforming the average precisions into a dataframe, with one column per threshold
+        columns = ["AP@%.2f" % threshold for threshold in self.iou_thresholds]
+        df = pd.DataFrame({current_class: dict(zip(columns, metric["average_precision"] * 100)) for current_class, metric in metrics.items()}, index=columns).T
+        df["AP@[%.2f:%.2f]" % (self.iou_thresholds[0], self.iou_thresholds[-1])] = df[columns].mean(axis=1)
+        df["average_iou"] = [metric["average_iou"] for metric in metrics.values()]
+        df["num_images"] = [metric["num_images"] for metric in metrics.values()]
+        df["num_detections"] = [metric["num_detections"] for metric in metrics.values()]
+        df["num_gt"] = [metric["num_gt"] for metric in metrics.values()]
+
+        # Adding the mean average precision to the dataframe as a new row
+        df.loc["mAp"] = df.drop(columns=["num_images", "num_detections", "num_gt"]).mean(axis=0)
+
+        # Returning the dataframe
+        return df
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Making the SaRLVision package importable when the tests are run from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
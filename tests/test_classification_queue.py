@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from SaRLVision.env import DetectionEnv, TEST_MODE
+from SaRLVision.models import ClassificationQueue, decode_imagenet_predictions
+from SaRLVision.utils import DetectionMetricsAccumulator
+
+
+class MeanClassifier():
+    """ Deterministic classifier whose prediction depends on the mean intensity of every region of interest """
+    categories = ['class_%d' % i for i in range(1000)]
+
+    def preprocess_input(self, images):
+        return images
+
+    def predict(self, images, verbose=0):
+        means = images.reshape(len(images), -1).mean(axis=1)
+        preds = np.full((len(images), 1000), 1e-4, dtype=np.float32)
+        preds[np.arange(len(images)), means.astype(np.int64) % 1000] = (means % 1) + 0.1
+        return preds
+
+    def decode_predictions(self, preds, top=5):
+        return decode_imagenet_predictions(preds, self.categories, top=top)
+
+
+def make_env(queue, images):
+    """ Building only the evaluation state of an environment that filter_bboxes and get_labels use (no feature extractor is constructed) """
+    env = DetectionEnv.__new__(DetectionEnv)
+    env.env_mode = TEST_MODE
+    env.use_dataset = 'voc'
+    env.current_class = 'cat'
+    env.dataset = {'cat': {name: None for name in images}}
+    env.store_evaluation_boxes = True
+    env.evaluation_results = {'class': 'cat', 'gt_boxes': {}, 'bounding_boxes': {}, 'labels': {}, 'confidences': {}, 'difficult': {}}
+    env.metrics_accumulator = DetectionMetricsAccumulator()
+    env.shared_backbone_classification = False
+    env.classification_queue = queue
+    env.classifier_target_size = (8, 8)
+    env.label_mapping = None
+    return env
+
+
+def run_images(env, images):
+    """ Classifying and filtering the bounding boxes of every image, resetting the classification state between images as reset() does """
+    for index, (name, (image, bboxes, gt_bboxes)) in enumerate(images.items()):
+        env.original_image = image
+        env.class_image_index = index + 1
+        env.current_gt_bboxes = gt_bboxes
+        env.current_gt_difficult = [False] * len(gt_bboxes)
+        env.classification_dictionary = {'label': [], 'confidence': [], 'bbox': list(bboxes), 'color': []}
+        env.pending_classification = None
+        env.get_labels()
+        env.filter_bboxes()
+        env.classification_queue.resolve()
+    env.flush_classification()
+    return env.metrics_accumulator
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(0)
+    images = {}
+    for index in range(7):
+        image = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+        bboxes = [[int(x), int(y), int(x) + 20, int(y) + 20] for x, y in rng.integers(0, 40, (index % 3 + 1, 2))]
+        images['image_%d' % index] = (image, bboxes, [[10, 10, 40, 40]])
+    return images
+
+
+def test_synchronous_and_asynchronous_queues_give_the_same_metrics(images):
+    accumulators = []
+    for asynchronous in (False, True):
+        queue = ClassificationQueue(MeanClassifier(), batch_size=4, asynchronous=asynchronous)
+        accumulators.append(run_images(make_env(queue, images), images))
+
+    synchronous, asynchronous = accumulators
+    # Every image reaches the accumulator, whichever thread classified it
+    assert set(synchronous.entries['cat']) == set(images) == set(asynchronous.entries['cat'])
+    for name in images:
+        for sync_value, async_value in zip(synchronous.entries['cat'][name], asynchronous.entries['cat'][name]):
+            np.testing.assert_array_equal(sync_value, async_value)
+    np.testing.assert_array_equal(synchronous.class_metrics('cat')['average_precision'], asynchronous.class_metrics('cat')['average_precision'])
+
+
+def test_synchronous_queue_resolves_within_submit():
+    queue = ClassificationQueue(MeanClassifier(), batch_size=2, asynchronous=False)
+    labels = []
+    request = queue.submit(np.zeros((2, 8, 8, 3), dtype=np.uint8), labels.extend)
+    assert request['resolved'] and len(labels) == 2
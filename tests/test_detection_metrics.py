@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from SaRLVision.utils import (evaluate_class_detections, DetectionMetricsAccumulator, calculate_detection_metrics, calculate_class_detection_metrics,
+                              voc_ap, _xyxy_box_overlaps)
+
+
+"""
+    Hand-computed PASCAL VOC example (boxes as [xmin, ymin, xmax, ymax]):
+
+    image_a has a ground truth box and a difficult ground truth box, image_b has a single ground truth box (2 non-difficult boxes in total).
+    Ranked by confidence, the detections are:
+        0.9  image_a  exact match of the box                  -> TP at every threshold
+        0.8  image_a  exact match of the difficult box        -> ignored (neither TP nor FP)
+        0.7  image_a  duplicate of the first detection        -> FP
+        0.6  image_b  IoU 0.6 with the box                    -> TP at 0.50, FP at 0.75
+        0.5  image_b  no overlap                              -> FP
+
+    At 0.50 the recall/precision points are (0.5, 1), (0.5, 1), (0.5, 1/2), (1, 2/3), (1, 1/2), so AP = 0.5 * 1 + 0.5 * 2/3 = 5/6, and the
+    11-point AP is (6 * 1 + 5 * 2/3) / 11 = 28/33. At 0.75 only the first detection is a TP, so AP = 0.5 * 1.
+"""
+GT_BOXES = {'image_a': [[0, 0, 10, 10], [20, 20, 30, 30]], 'image_b': [[0, 0, 10, 10]]}
+DIFFICULT = {'image_a': [False, True], 'image_b': [False]}
+BOUNDING_BOXES = {'image_a': [[0, 0, 10, 10], [20, 20, 30, 30], [0, 0, 10, 10]], 'image_b': [[0, 0, 10, 6], [50, 50, 60, 60]]}
+CONFIDENCES = {'image_a': [0.9, 0.8, 0.7], 'image_b': [0.6, 0.5]}
+
+
+def test_xyxy_overlaps():
+    inter_area, box_area, gt_area = _xyxy_box_overlaps(np.array([[10., 10., 20., 20.]]), np.array([[15., 15., 25., 25.]]))
+    assert inter_area[0] / (box_area[0] + gt_area[0] - inter_area[0]) == pytest.approx(25 / 175)
+
+
+def test_evaluator_matches_hand_computed_voc_example():
+    metrics = evaluate_class_detections(BOUNDING_BOXES, GT_BOXES, CONFIDENCES, iou_thresholds=[0.5, 0.75], difficult=DIFFICULT)
+    np.testing.assert_allclose(metrics['average_precision'], [5 / 6, 0.5])
+    np.testing.assert_allclose(metrics['recall'][0], [0.5, 0.5, 0.5, 1.0, 1.0])
+    np.testing.assert_allclose(metrics['precision'][0], [1.0, 1.0, 0.5, 2 / 3, 0.5])
+    assert metrics['num_gt'] == 2 and metrics['num_detections'] == 5
+
+
+def test_evaluator_matches_hand_computed_voc2007_example():
+    metrics = evaluate_class_detections(BOUNDING_BOXES, GT_BOXES, CONFIDENCES, iou_thresholds=[0.5], difficult=DIFFICULT, voc2007=True)
+    np.testing.assert_allclose(metrics['average_precision'], [28 / 33])
+
+
+def test_difficult_boxes_count_as_ground_truth_without_flags():
+    metrics = evaluate_class_detections(BOUNDING_BOXES, GT_BOXES, CONFIDENCES, iou_thresholds=[0.5])
+    # The second detection becomes a TP and the number of ground truth boxes is 3: points (1/3, 1), (2/3, 1), (2/3, 2/3), (1, 3/4), (1, 3/5)
+    np.testing.assert_allclose(metrics['average_precision'], [2 / 3 + 1 / 3 * 3 / 4])
+    assert metrics['num_gt'] == 3
+
+
+def test_accumulator_matches_batch_evaluator():
+    rng = np.random.default_rng(0)
+    gt_boxes, bounding_boxes, confidences, difficult = {}, {}, {}, {}
+    for index in range(20):
+        corners = rng.uniform(0, 80, (rng.integers(1, 4), 2))
+        gt_boxes[index] = np.concatenate([corners, corners + rng.uniform(5, 30, corners.shape)], axis=1).tolist()
+        difficult[index] = (rng.random(len(gt_boxes[index])) < 0.2).tolist()
+        jitter = [np.array(gt_boxes[index][rng.integers(len(gt_boxes[index]))]) + rng.normal(0, 4, 4) for _ in range(rng.integers(0, 4))]
+        bounding_boxes[index] = [box.tolist() for box in jitter]
+        confidences[index] = rng.random(len(jitter)).tolist()
+
+    thresholds = np.arange(0.5, 0.96, 0.05)
+    accumulator = DetectionMetricsAccumulator(thresholds)
+    # Updating the images out of order, and one image twice (the second update replaces the first)
+    for index in rng.permutation(20):
+        accumulator.update('cat', index, gt_boxes[index], bounding_boxes[index], confidences[index], difficult[index])
+    accumulator.update('cat', 3, gt_boxes[3], bounding_boxes[3], confidences[3], difficult[3])
+
+    batch = evaluate_class_detections(bounding_boxes, gt_boxes, confidences, thresholds, difficult)
+    streaming = accumulator.class_metrics('cat')
+    np.testing.assert_allclose(streaming['average_precision'], batch['average_precision'])
+    assert streaming['num_gt'] == batch['num_gt'] and streaming['num_detections'] == batch['num_detections']
+
+
+def reference_voc_ap(rec, prec, voc2007=False):
+    """ The per-point loops of voc_ap before it was vectorised """
+    if voc2007:
+        ap = 0.0
+        for t in np.arange(0.0, 1.1, 0.1):
+            p = np.max(prec[rec >= t]) if np.sum(rec >= t) > 0 else 0
+            ap += p / 11.0
+        return ap
+    mrec = np.concatenate(([0.0], rec, [1.0]))
+    mpre = np.concatenate(([0.0], prec, [0.0]))
+    for i in range(mpre.size - 1, 0, -1):
+        mpre[i - 1] = np.maximum(mpre[i - 1], mpre[i])
+    i = np.where(mrec[1:] != mrec[:-1])[0]
+    return np.sum((mrec[i + 1] - mrec[i]) * mpre[i + 1])
+
+
+@pytest.mark.parametrize('voc2007', [False, True])
+def test_voc_ap_matches_reference_loop(voc2007):
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        tp = rng.random(30) < 0.5
+        rec = np.cumsum(tp) / 40
+        prec = np.cumsum(tp) / np.arange(1, 31)
+        assert voc_ap(rec, prec, voc2007) == pytest.approx(reference_voc_ap(rec, prec, voc2007))
+
+
+def test_calculate_detection_metrics_matches_per_threshold_loop(tmp_path):
+    rng = np.random.default_rng(2)
+    results = {}
+    for current_class in ['cat', 'dog', 'bird']:
+        gt_boxes, bounding_boxes = {}, {}
+        for index in range(rng.integers(5, 15)):
+            corner = rng.uniform(0, 80, 2)
+            gt_boxes[index] = [np.concatenate([corner, corner + rng.uniform(5, 30, 2)]).tolist()]
+            bounding_boxes[index] = [(np.array(gt_boxes[index][0]) + rng.normal(0, 5, 4)).tolist()]
+        results[current_class] = {'class': current_class, 'gt_boxes': gt_boxes, 'bounding_boxes': bounding_boxes}
+        np.save(tmp_path / (current_class + '_evaluation_results.npy'), results[current_class])
+
+    thresholds = [0.5, 0.6, 0.75]
+    dfs, mAps = calculate_detection_metrics(str(tmp_path), threshold_list=thresholds)
+
+    # The loop over the thresholds and classes which calculate_detection_metrics replaced
+    for t, ovthresh in enumerate(thresholds):
+        aps = {}
+        for current_class, current_results in results.items():
+            detection_metrics, _ = calculate_class_detection_metrics(current_class, current_results['bounding_boxes'], current_results['gt_boxes'], ovthresh)
+            aps[current_class] = detection_metrics['average_precision_voc']
+            assert dfs[t].loc[current_class, 'average_precision_voc'] == pytest.approx(detection_metrics['average_precision_voc'] * 100)
+            assert dfs[t].loc[current_class, 'average_precision'] == pytest.approx(detection_metrics['average_precision'] * 100)
+            assert dfs[t].loc[current_class, 'average_iou'] == pytest.approx(detection_metrics['average_iou'])
+        assert mAps[ovthresh] == pytest.approx(np.mean(list(aps.values())) * 100)
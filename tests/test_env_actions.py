@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from SaRLVision.env import DetectionEnv
+
+
+def make_env(bbox, width=300, height=200, alpha=0.2):
+    """ Building only the state of an environment that the actions use (no feature extractor is constructed) """
+    env = DetectionEnv.__new__(DetectionEnv)
+    env.bbox, env.width, env.height, env.alpha = bbox, width, height, alpha
+    return env
+
+
+def reference_transform_action(env, action):
+    """ The per-action update of the bounding box before the actions were vectorised """
+    xmin, ymin, xmax, ymax = env.bbox
+    alpha_h, alpha_w = int(env.alpha * (ymax - ymin)), int(env.alpha * (xmax - xmin))
+    dx_min, dy_min, dx_max, dy_max = [(alpha_w, 0, alpha_w, 0), (-alpha_w, 0, -alpha_w, 0), (0, -alpha_h, 0, -alpha_h), (0, alpha_h, 0, alpha_h),
+                                      (-alpha_w, -alpha_h, alpha_w, alpha_h), (alpha_w, alpha_h, -alpha_w, -alpha_h), (0, alpha_h, 0, -alpha_h),
+                                      (alpha_w, 0, -alpha_w, 0), (0, 0, 0, 0)][action]
+    return [env.rewrap(xmin + dx_min, env.width), env.rewrap(ymin + dy_min, env.height), env.rewrap(xmax + dx_max, env.width), env.rewrap(ymax + dy_max, env.height)]
+
+
+@pytest.mark.parametrize('bbox', [[10, 20, 200, 150], [10.7, 20.3, 200.9, 150.5], [-3.5, 1.2, 310.4, 170.1]])
+def test_actions_match_the_per_action_updates(bbox):
+    env = make_env(bbox)
+    for action in range(9):
+        np.testing.assert_allclose(env.transform_action(action), reference_transform_action(env, action))
+
+
+def test_integer_boxes_stay_integral():
+    env = make_env([10, 20, 200, 150])
+    assert all(isinstance(coordinate, int) for action in range(9) for coordinate in env.transform_action(action))
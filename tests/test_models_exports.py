@@ -0,0 +1,14 @@
+import os
+import subprocess
+import sys
+
+from SaRLVision.models import KERAS_APPLICATIONS
+
+
+def test_star_import_exports_the_keras_applications_without_importing_keras():
+    # Running in a fresh interpreter, as other tests may already have imported Keras
+    code = ("import sys\n"
+            "from SaRLVision.models import *\n"
+            "print(all(callable(globals().get(name)) for name in " + repr(list(KERAS_APPLICATIONS)) + "), 'keras' in sys.modules)\n")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.split() == ['True', 'False'], result.stderr
@@ -0,0 +1,35 @@
+import numpy as np
+
+import SaRLVision.SaRa.sara_cache as sara_cache
+from SaRLVision.SaRa.sara_cache import SaliencyCache
+
+
+def fake_saliency(img, generator='itti'):
+    return img.mean(axis=2).astype(np.float32)
+
+
+def test_lru_evicts_every_entry_of_an_image_together(monkeypatch):
+    monkeypatch.setattr(sara_cache.sara, 'return_saliency', fake_saliency)
+    cache = SaliencyCache(max_size=2)
+    img = np.zeros((8, 8, 3), dtype=np.uint8)
+    for image_id in ['a', 'b']:
+        cache.get_saliency(image_id, img)
+        cache._put_entry(('proposals', image_id, 'itti', 9, 0.3, 4), [])
+
+    # Using image a makes image b the least recently used, so both entries of b are evicted by image c
+    cache.get_saliency('a', img)
+    cache.get_saliency('c', img)
+    assert set(cache.images) == {'a', 'c'}
+    assert ('saliency', 'a', 'itti') in cache and ('proposals', 'a', 'itti', 9, 0.3, 4) in cache
+    assert not any(key[1] == 'b' for key in cache.entries)
+
+
+def test_on_disk_store_survives_an_empty_memory(monkeypatch, tmp_path):
+    monkeypatch.setattr(sara_cache.sara, 'return_saliency', fake_saliency)
+    img = np.random.default_rng(0).integers(0, 255, (8, 8, 3), dtype=np.uint8)
+    saliency_map = SaliencyCache(max_size=0, cache_dir=str(tmp_path)).get_saliency('a', img)
+
+    # A new cache (e.g. the next run) reads the stored map instead of computing it
+    cache = SaliencyCache(cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(cache.get_saliency('a', np.zeros_like(img)), saliency_map)
+    assert cache.hits == 1 and cache.misses == 0